@@ -21,6 +21,8 @@ class PackageInfoCommand(GenericSubcommand):
 						help = 'only display the package name(s). Useful in displaying the list of rpms displayed by a specific build')
 		args.add_argument('--no-labels', action = 'store_true', default = False,
 						help = 'do not display any labels')
+		args.add_argument('--no-server', action = 'store_true', default = False,
+						help = 'do not forward the query to a running query server')
 		args.add_argument(dest = 'packages', metavar = 'PACKAGES', nargs = '+',
 						help = 'list of rpms to query')
 
@@ -44,6 +46,8 @@ class BuildInfoCommand(GenericSubcommand):
 						help = 'only display the package name(s). Useful in displaying the list of rpms displayed by a specific build')
 		args.add_argument('--no-labels', action = 'store_true', default = False,
 						help = 'do not display any labels')
+		args.add_argument('--no-server', action = 'store_true', default = False,
+						help = 'do not forward the query to a running query server')
 		args.add_argument(dest = 'packages', metavar = 'PACKAGES', nargs = '+',
 						help = 'list of builds to query')
 
@@ -95,6 +99,8 @@ class DownloadRpmsCommand(GenericSubcommand):
 				help = 'Use local HTTP cache for some OBS queries (TTL given in minutes; default: no caching)')
 		args.add_argument('--staging',
 				help = 'Download packages from staging projects (either "all" or a comma separated list, such as A,B,C)')
+		args.add_argument('--rescan', default = False, action = 'store_true',
+				help = 'Rescan the local rpm header cache rather than relying on its manifest')
 
 	def createApplication(self, opts):
 		from package_monkey.cmd_download import SolverDownloadApplication
@@ -162,6 +168,12 @@ class LabellingCommand(GenericSubcommand):
 	def registerArguments(self, args):
 		args.add_argument('--trace', action = 'append', default = [],
 				help = 'Enable tracing for packages and/or labels. Specify multiple times or use comma to separate strings to trace for')
+		args.add_argument('--full', action = 'store_true', default = False,
+				help = 'Do not relabel incrementally, even if only filter rules changed since the last run')
+		args.add_argument('--verify', action = 'store_true', default = False,
+				help = 'When relabelling incrementally, cross-check the result against a full classification run')
+		args.add_argument('--scope', action = 'append', default = [],
+				help = 'Only classify builds relevant to the given epics and/or layers, and display the result without updating classification.db. Specify multiple times or use comma to separate names')
 
 
 	def createApplication(self, opts):
@@ -179,6 +191,8 @@ class ComposeCommand(GenericSubcommand):
 		args.add_argument('--build-path', default = '../SLES',
 				help = 'path to where the product composer files live')
 		args.add_argument('--ignore-errors', action = 'store_true')
+		args.add_argument('--reclassify', action = 'store_true', default = False,
+				help = 'Do not reuse the cached classification result, even if the codebase and model are unchanged')
 		args.add_argument('--trace', action = 'append', default = [],
 				help = 'Enable tracing for packages and/or labels. Specify multiple times or use comma to separate strings to trace for')
 
@@ -269,10 +283,33 @@ class EpicInfoCommand(GenericSubcommand):
 
 	def registerArguments(self, args):
 		args.add_argument('--terse', action = 'store_true', default = False)
+		args.add_argument('--no-server', action = 'store_true', default = False,
+				help = 'do not forward the query to a running query server')
 
 	def createSubParser(self, subparsers):
 		return self.args.add_subparsers(dest = 'query', help = 'query command', metavar = 'QUERY')
 
+class QueryServerCommand(GenericSubcommand):
+	NAME = 'serve'
+	ALIASES = ['server']
+	HELP = 'Run a query server for rpminfo, buildinfo and epicinfo'
+	DESCRIPTION = '''
+		Load the codebase DB, classification and policy once, and
+		answer rpminfo, buildinfo and epicinfo queries over a unix
+		socket in the codebase state directory. The query commands
+		use the server automatically while it is running. The server
+		reloads its data when the DB or the model files change.
+		'''
+
+	def registerArguments(self, args):
+		args.add_argument('--reclassify', action = 'store_true', default = False,
+				help = 'Do not reuse the cached classification result when (re)loading')
+
+	def createApplication(self, opts):
+		from package_monkey.cmd_server import QueryServerApplication
+
+		return QueryServerApplication(self.NAME, opts)
+
 class ChartCommand(GenericSubcommand):
 	NAME = 'make-chart'
 	ALIASES = ['chart']
@@ -366,6 +403,7 @@ subcommandRegistry.registerCommand(LabellingCommand())
 subcommandRegistry.registerCommand(ComposeCommand())
 subcommandRegistry.registerCommand(ExplainCommand())
 subcommandRegistry.registerCommand(EpicInfoCommand())
+subcommandRegistry.registerCommand(QueryServerCommand())
 subcommandRegistry.registerCommand(PackageDiffCommand())
 subcommandRegistry.registerCommand(ProductDiffCommand())
 subcommandRegistry.registerCommand(ChartCommand())
@@ -9,17 +9,39 @@ from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
 __names__ = ['archRegistry', 'ArchSet']
 
 class ArchRegistry(object):
-	canonicalArchList = (
+	# The architectures we know about out of the box. Codebase models can
+	# add more via their architectures list.
+	# Architectures are never removed or renumbered, so masks computed
+	# earlier remain valid when new architectures are registered.
+	defaultArchList = (
 		'x86_64',
 		's390x',
 		'ppc64le',
 		'aarch64',
 	)
 
+	# For up to this many architectures, we precompute the MaskInfo for
+	# all possible masks. Beyond that, we compute them on demand.
+	MAX_PRECOMPUTED_ARCHES = 10
+
+	class MaskInfo(object):
+		def __init__(self, mask, names):
+			self.mask = mask
+			self.names = tuple(names)
+			self.nameSet = frozenset(names)
+			self.count = len(self.names)
+			self.string = ' '.join(self.names)
+
 	_instance = None
 
-	def __init__(self):
-		self.archCount = len(self.canonicalArchList)
+	def __init__(self, archList = None):
+		self.canonicalArchList = ()
+		self.archCount = 0
+		self._nameToID = {}
+		self._maskTable = []
+		self._maskCache = {}
+
+		self.registerArchitectures(archList or self.defaultArchList)
 
 	@classmethod
 	def instance(klass):
@@ -27,17 +49,52 @@ class ArchRegistry(object):
 			klass._instance = klass()
 		return klass._instance
 
+	def registerArchitectures(self, names):
+		changed = False
+		for name in names:
+			if name not in self._nameToID:
+				self._nameToID[name] = len(self.canonicalArchList)
+				self.canonicalArchList += (name, )
+				changed = True
+
+		if changed:
+			self.archCount = len(self.canonicalArchList)
+			self._maskCache = {}
+			if self.archCount <= self.MAX_PRECOMPUTED_ARCHES:
+				self._maskTable = list(map(self._computeMaskInfo, range(1 << self.archCount)))
+			else:
+				self._maskTable = []
+
+	def _computeMaskInfo(self, mask):
+		names = []
+		for id, name in enumerate(self.canonicalArchList):
+			if mask & (1 << id):
+				names.append(name)
+		return self.MaskInfo(mask, names)
+
+	def maskInfo(self, mask):
+		try:
+			return self._maskTable[mask]
+		except IndexError:
+			pass
+
+		info = self._maskCache.get(mask)
+		if info is None:
+			info = self._computeMaskInfo(mask)
+			self._maskCache[mask] = info
+		return info
+
 	@property
 	def fullset(self):
-		return ArchSet(self.canonicalArchList)
+		return ArchSet((1 << self.archCount) - 1)
 
 	def isValidArchitecture(self, name):
-		return name in self.canonicalArchList
+		return name in self._nameToID
 
 	def nameToID(self, name):
 		try:
-			return self.canonicalArchList.index(name)
-		except:
+			return self._nameToID[name]
+		except KeyError:
 			pass
 
 		raise Exception(f"Invalid architecture name {name}")
@@ -46,22 +103,10 @@ class ArchRegistry(object):
 		return (1 << self.nameToID(name))
 
 	def maskToNameSet(self, mask):
-		result = set()
-
-		for name in self.canonicalArchList:
-			if mask & 1:
-				result.add(name)
-			mask >>= 1
-		return result
+		return set(self.maskInfo(mask).nameSet)
 
 	def maskToString(self, mask):
-		result = []
-
-		for name in self.canonicalArchList:
-			if mask & 1:
-				result.append(name)
-			mask >>= 1
-		return ' '.join(result)
+		return self.maskInfo(mask).string
 
 	def nameSetToMask(self, names):
 		mask = 0
@@ -138,11 +183,11 @@ class ArchSet(object):
 		return bool(self.mask)
 
 	def __len__(self):
-		# we could also count the bits
-		return len(archRegistry.maskToNameSet(self.mask))
+		return archRegistry.maskInfo(self.mask).count
 
+	# Iterates over the architectures in canonical order
 	def __iter__(self):
-		return iter(archRegistry.maskToNameSet(self.mask))
+		return iter(archRegistry.maskInfo(self.mask).names)
 
 	def __eq__(self, other):
 		return self.mask == other.mask
@@ -30,6 +30,11 @@ class RpmControl(Composable):
 		self.tentativePolicy = None
 		self.indirectRequiredOptions = None
 
+		# What checking the rpm's requirements produced, besides shippable
+		# and the option dependencies; see NewResult.flatten()
+		self.inversions = None
+		self.promisedRequirements = None
+
 		rpm.composable = self
 
 	def __str__(self):
@@ -69,6 +74,16 @@ class RpmControl(Composable):
 			self.optionSet = Classification.createLabelSet()
 		self.optionSet.add(option)
 
+	def addInversion(self, msg):
+		if self.inversions is None:
+			self.inversions = []
+		self.inversions.append(msg)
+
+	def addPromisedRequirement(self, req):
+		if self.promisedRequirements is None:
+			self.promisedRequirements = []
+		self.promisedRequirements.append(req)
+
 	@property
 	def hasOptionDependencies(self):
 		return bool(self.optionSet)
@@ -412,6 +427,30 @@ class EpicControl(LabelControl):
 			self.byClass[klass] = memberSet
 		return memberSet
 
+	def checkRequirements(self, rpmControl):
+		rpm = rpmControl.rpm
+
+		# the set of resolved requirements may change while we iterate over it,
+		# so force a copy
+		for req in list(rpm.resolvedRequires):
+			self.checkForDependencyInversion(rpmControl, req)
+
+		common = rpm.solutions.common
+		for arch in rpm.solutions.keys():
+			assert(arch is not None)
+			for req in rpm.solutions.raw_get(arch).difference(common):
+				self.checkForDependencyInversion(rpmControl, req, arch = arch)
+
+	def reportInversion(self, rpmControl, msg):
+		location = rpmControl.rpm.new_build.new_epic.definingLocation
+
+		if self.dependencyReport is None:
+			warnmsg(msg)
+		else:
+			self.dependencyReport.add(location, msg)
+
+		rpmControl.addInversion(msg)
+
 	def checkForDependencyInversion(self, rpmControl, req, arch = None):
 		rpm = rpmControl.rpm
 
@@ -450,18 +489,14 @@ class EpicControl(LabelControl):
 			if optionLabel is not None:
 				# if the promise doesn't exist yet, we create it on the fly
 				promiseRpm = self.db.createPromise(req)
+				rpmControl.addPromisedRequirement(req)
 
 		if promiseRpm is None:
 			promiseRpm = self.db.lookupPromise(req)
 		if promiseRpm is None:
 			epicLabel = rpm.new_build.new_epic
-			location = epicLabel.definingLocation
 			msg = f"{epicLabel}: {rpm.new_build}: dependency inversion {rpm} -> {req} (build {req.new_build}, epic {req.new_build.new_layer}/{req.new_build.new_epic})"
-
-			if self.dependencyReport is None:
-				warnmsg(msg)
-			else:
-				self.dependencyReport.add(location, msg)
+			self.reportInversion(rpmControl, msg)
 
 			rpmControl.shippable = False
 			return False
@@ -586,6 +621,10 @@ class NewResult(object):
 			yield m
 
 	def buildInverseTree(self):
+		if self.db.providesLookupsEnabled:
+			self.buildInverseTreeFromIndex()
+			return
+
 		unresolvables = []
 		for epicControl in self._members.values():
 			for rpmControl in epicControl.rpms:
@@ -604,6 +643,56 @@ class NewResult(object):
 			# Normally, the only rpm we find in this manner should be __unresolvable__
 			rpmControl.markUnresolvable()
 
+	# If someone enabled provides lookups on the DB, we can simply walk the
+	# requiredBy sets rather than computing the inverse from scratch.
+	# The result is the same as the one produced by the loop above.
+	def buildInverseTreeFromIndex(self):
+		unresolvables = []
+		for epicControl in self._members.values():
+			for rpmControl in epicControl.rpms:
+				rpm = rpmControl.rpm
+				if rpm.isUnresolvable:
+					unresolvables.append(rpmControl)
+
+				if rpm.requiredBy is None:
+					continue
+
+				perArchRequirers = {}
+				for arch, requirers in rpm.requiredBy.items():
+					for requiring in requirers:
+						try:
+							perArchRequirers[requiring].add(arch)
+						except KeyError:
+							perArchRequirers[requiring] = set((arch, ))
+
+				for requiring, archSet in perArchRequirers.items():
+					# Requirements of rpms we do not track are ignored by the
+					# loop above, too
+					requiringControl = self.membershipForRpm(requiring)
+					if requiringControl is None:
+						continue
+
+					if rpm in requiring.resolvedRequires:
+						rpmControl.addRequiredBy(requiringControl, None)
+					else:
+						for arch in archSet:
+							rpmControl.addRequiredBy(requiringControl, arch)
+
+		# The same consistency check as in the loop above, but looking at
+		# it from the other end: none of the rpms we do not track may be
+		# required by one that we do track.
+		for rpm in self.db.rpms:
+			if rpm.requiredBy is None or self.membershipForRpm(rpm) is not None:
+				continue
+
+			for arch, requirers in rpm.requiredBy.items():
+				for requiring in requirers:
+					if self.membershipForRpm(requiring) is not None:
+						raise Exception(f"{requiring} requires {rpm}, but I'm not tracking this rpm")
+
+		for rpmControl in unresolvables:
+			rpmControl.markUnresolvable()
+
 	def buildIndirectRequirements(self):
 		for epicControl in self._members.values():
 			for rpmControl in epicControl.rpms:
@@ -623,28 +712,31 @@ class NewResult(object):
 			print(msg, file = dbf)
 
 		with open(path + ".tmp", "w") as dbf:
-			for epicControl in sorted(self._members.values(), key = str):
-				write(f"epic {epicControl} layer={epicControl.label.layer}")
-				for buildControl in sorted(epicControl.builds, key = str):
-					write(f"  build {buildControl}")
-					for rpmControl in sorted(buildControl.rpms, key = str):
-						extra = []
-						extra.append(f"class={rpmControl.rpmClass}")
-						if rpmControl.definedByOption:
-							extra.append(f"option={rpmControl.definedByOption}")
-						if rpmControl.choice:
-							extra.append(f"choice={rpmControl.choice}")
-						if rpmControl.indirectRequiredOptions:
-							extra.append(f"requires={','.join(map(str, rpmControl.indirectRequiredOptions))}")
-						if rpmControl.rpm.new_override_epic is not None and \
-						   rpmControl.rpm.new_override_epic is not epicControl.label:
-							# this rpm was placed in a different epic using split-ok
-							extra.append(f"epic={rpmControl.rpm.new_override_epic}")
-						write(f"    rpm {rpmControl} {' '.join(extra)}")
+			self.writePlacements(write)
 
 		os.rename(path + ".tmp", path)
 		infomsg(f"Updated {path}")
 
+	def writePlacements(self, write):
+		for epicControl in sorted(self._members.values(), key = str):
+			write(f"epic {epicControl} layer={epicControl.label.layer}")
+			for buildControl in sorted(epicControl.builds, key = str):
+				write(f"  build {buildControl}")
+				for rpmControl in sorted(buildControl.rpms, key = str):
+					extra = []
+					extra.append(f"class={rpmControl.rpmClass}")
+					if rpmControl.definedByOption:
+						extra.append(f"option={rpmControl.definedByOption}")
+					if rpmControl.choice:
+						extra.append(f"choice={rpmControl.choice}")
+					if rpmControl.indirectRequiredOptions:
+						extra.append(f"requires={','.join(map(str, rpmControl.indirectRequiredOptions))}")
+					if rpmControl.rpm.new_override_epic is not None and \
+					   rpmControl.rpm.new_override_epic is not epicControl.label:
+						# this rpm was placed in a different epic using split-ok
+						extra.append(f"epic={rpmControl.rpm.new_override_epic}")
+					write(f"    rpm {rpmControl} {' '.join(extra)}")
+
 	def getRelevantRpms(self, build):
 		result = []
 		for rpm in build.binaries:
@@ -661,8 +753,13 @@ class NewResult(object):
 			result.append(rpm)
 		return result
 
+	# If a ClassificationScope is given, the result only covers the epics
+	# in that scope.
+	# checkedRequirements maps rpm names to what flatten() recorded for them
+	# in an earlier run. For these rpms, we reuse the recorded outcome rather
+	# than checking their requirements again.
 	@classmethod
-	def build(klass, classificationScheme, collection, db):
+	def build(klass, classificationScheme, collection, db, scope = None, checkedRequirements = None):
 		newResult = NewResult(db, classificationScheme)
 
 		for build in collection.builds:
@@ -678,6 +775,9 @@ class NewResult(object):
 				errormsg(f"{build}: no epic")
 				continue
 
+			if scope is not None and epic not in scope:
+				continue
+
 			assert(epic.layer)
 
 			epicControl = newResult.addEpic(epic)
@@ -702,16 +802,14 @@ class NewResult(object):
 				rpmControl = epicControl.addRpm(rpm)
 				buildControl.addRpm(rpmControl)
 
-				# the set of resolved requirements may change while we iterate over it,
-				# so force a copy
-				for req in list(rpm.resolvedRequires):
-					epicControl.checkForDependencyInversion(rpmControl, req)
+				checked = None
+				if checkedRequirements is not None:
+					checked = checkedRequirements.get(rpm.name)
 
-				common = rpm.solutions.common
-				for arch in rpm.solutions.keys():
-					assert(arch is not None)
-					for req in rpm.solutions.raw_get(arch).difference(common):
-						epicControl.checkForDependencyInversion(rpmControl, req, arch = arch)
+				if checked is not None:
+					newResult.restoreRequirements(epicControl, rpmControl, checked)
+				else:
+					epicControl.checkRequirements(rpmControl)
 
 				if labelHints is not None:
 					buildOption = labelHints.definingBuildOption
@@ -745,16 +843,61 @@ class NewResult(object):
 						if autoFlavor.trace:
 							localFlavorControl.trace = True
 
-		newResult.buildInverseTree()
-		newResult.buildIndirectRequirements()
+		# The remaining steps need to see the entire codebase
+		if scope is not None:
+			return newResult
+
+		newResult.complete()
+		return newResult
+
+	# The steps that follow the placement of rpms in epics, options and flavors
+	def complete(self):
+		classificationScheme = self.classificationScheme
+
+		self.buildInverseTree()
+		self.buildIndirectRequirements()
 
 		for buildOption in classificationScheme.allBuildOptions:
-			optionControl = newResult.addOption(buildOption)
+			optionControl = self.addOption(buildOption)
 
 			epic = buildOption.epic
-			newResult.addEpic(epic).addDefinedOption(optionControl)
+			self.addEpic(epic).addDefinedOption(optionControl)
 
 		for autoFlavor in classificationScheme.allAutoFlavors:
-			newResult.addGlobalChoice(autoFlavor)
+			self.addGlobalChoice(autoFlavor)
+
+	# For every rpm, record the outcome of checking its requirements as plain
+	# data that refers to labels and rpms by name. This is what build() needs
+	# in order to skip these checks in a later run.
+	def flatten(self):
+		def names(objects):
+			if not objects:
+				return None
+			return [obj.name for obj in objects]
+
+		result = {}
+		for epicControl in self._members.values():
+			for rpmControl in epicControl.rpms:
+				result[rpmControl.rpm.name] = (rpmControl.shippable,
+						names(rpmControl.optionSet),
+						rpmControl.inversions,
+						names(rpmControl.promisedRequirements))
+		return result
 
-		return newResult
+	def restoreRequirements(self, epicControl, rpmControl, checked):
+		shippable, optionNames, inversions, promisedNames = checked
+
+		rpmControl.shippable = shippable
+		for name in optionNames or []:
+			option = self.classificationScheme.getTypedLabelThrow(name, Classification.TYPE_BUILD_OPTION)
+			rpmControl.addOptionDependency(option)
+
+		for name in promisedNames or []:
+			req = self._db.lookupRpm(name)
+			if req is None:
+				raise Exception(f"DB does not have {name}")
+			self._db.createPromise(req)
+			rpmControl.addPromisedRequirement(req)
+
+		for msg in inversions or []:
+			epicControl.reportInversion(rpmControl, msg)
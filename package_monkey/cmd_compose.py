@@ -8,26 +8,23 @@ from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
 from .util import ANSITreeFormatter
 from .sick_yaml import YamlFormatter
 from .compose import Composer
-from .cmd_label import ClassificationGadget
 
 class ComposerApplication(ApplicationBase):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 
-	def produce(self, db, **kwargs):
-		gadget = ClassificationGadget(db, self.modelDescription, traceMatcher = self.traceMatcher)
-		classificationResult = gadget.solve(self.productCodebase)
-
-		composer = Composer(gadget.classificationScheme, **kwargs)
+	def produce(self, classificationResult, **kwargs):
+		composer = Composer(classificationResult.classificationScheme, **kwargs)
 		self.modelDescription.loadProductComposition(composer)
 
 		composer.compose(classificationResult)
 		return composer
 
 	def run(self):
-		db = self.loadNewDB()
+		classificationResult = self.classify()
+		db = classificationResult.db
 
-		composer = self.produce(db)
+		composer = self.produce(classificationResult)
 
 		for product in composer.products:
 			infomsg(f"Product {product.name}:")
@@ -71,9 +68,9 @@ class ErklaerBaerApplication(ComposerApplication):
 		loggingFacade.disableTimestamps()
 
 	def run(self):
-		db = self.loadNewDB()
+		classificationResult = self.classify()
 
-		composer = self.produce(db, includeExplanations = True, verbose = False)
+		composer = self.produce(classificationResult, includeExplanations = True, verbose = False)
 
 		if not self.opts.packages:
 			raise Exception(f"Missing package(s) arguments")
@@ -22,7 +22,7 @@ class SolverDownloadApplication(ApplicationBase):
 		super().__init__(*args, **kwargs)
 
 		self.repoCollection = None
-		self.infoGadget = RpmInfoUpdateGadget(self.codebaseData)
+		self.infoGadget = RpmInfoUpdateGadget(self.codebaseData, batching = True)
 
 	def createOBSClient(self):
 		apiURL = self.opts.api_url
@@ -58,11 +58,18 @@ class SolverDownloadApplication(ApplicationBase):
 
 		obsNameFilter = self.productCodebase.nameFilter
 
+		headerStore = None
+
 		infomsg(f"Checking projects for new rpms:")
 		for repository in sorted(self.repoCollection, key = str):
 			obsProject = repository.obsProject
 
 			downloadManager = obsProject.createDownloadManager(cacheRoot)
+			if downloadManager.headerStore is not None:
+				headerStore = downloadManager.headerStore
+			if self.opts.rescan:
+				downloadManager.rescan()
+
 			downloadQueue = obsProject.prepareDownload(client, downloadManager, filter = obsNameFilter)
 			repository.downloadQueue = downloadQueue
 
@@ -106,32 +113,41 @@ class SolverDownloadApplication(ApplicationBase):
 
 			repository.commitState()
 
+		# Now that all repositories have released the headers they no
+		# longer need, drop those that are not referenced anymore.
+		if headerStore is not None:
+			headerStore.collectGarbage()
+
 		info = DownloadInfo()
 		info.setTimestampNow()
 
 		self.codebaseData.saveDownloadInfo(info)
 
 		if self.infoGadget is not None:
+			if len(self.infoGadget):
+				infomsg(f"Extracting information from {len(self.infoGadget)} updated rpms")
+				self.infoGadget.updateQueued()
 			self.infoGadget.commit()
 
 	def queryBuildResults(self, db, client, project, nameFilter = None):
-		resList = project.queryBuildResults(client)
-
-		for result in resList:
-			infomsg(f"{project}: found {len(result.status_list)} builds")
-			for st in result.status_list:
-				if nameFilter is not None and nameFilter.matchBuild(st.package):
+		# The result document can be huge, so we process it incrementally
+		numBuilds = 0
+		for result, kind, item in project.iterBuildResults(client):
+			if kind == 'status':
+				numBuilds += 1
+				if nameFilter is not None and nameFilter.matchBuild(item.package):
 					continue
 
-				genericBuild = db.createBuild(st.package)
-				genericBuild.status = st.code
-
-			for p in result.binary_list:
-				if nameFilter is not None and nameFilter.matchBuild(p.package):
+				genericBuild = db.createBuild(item.package)
+				genericBuild.status = item.code
+			elif kind == 'binarylist':
+				if nameFilter is not None and nameFilter.matchBuild(item.package):
 					continue
 
-				genericBuild = db.createBuild(p.package)
-				self.updateBuildFromBinaryList(db, genericBuild, p.files, nameFilter = nameFilter)
+				genericBuild = db.createBuild(item.package)
+				self.updateBuildFromBinaryList(db, genericBuild, item.files, nameFilter = nameFilter)
+
+		infomsg(f"{project}: found {numBuilds} builds")
 
 	def updateBuildFromBinaryList(self, db, build, binaryList, nameFilter = None):
 		source = None
@@ -211,24 +227,69 @@ class RpmHeaderExtractorApplication(ApplicationBase):
 			infomsg(f"Extracting information from {totalCount} updated rpms")
 
 			progressMeter = ThatsProgress(totalCount, withETA = True)
-			for args in infoGadget:
-				if (progressMeter.count % 1000) == 0:
-					infomsg(f"   {progressMeter}: {args[0]}")
-
-				infoGadget.update(*args)
-				progressMeter.tick()
-
+			infoGadget.updateQueued(progressMeter)
 			infomsg(f"   {progressMeter}: Done.")
 
 		infoGadget.commit()
 
+##################################################################
+# Extract fields from rpm headers, reusing a single TransactionSet.
+# When processing many headers, the work is spread across a pool
+# of worker processes, each of which has its own extractor.
+##################################################################
+class RpmHeaderExtractor(object):
+	FIELDS = ('name', 'version', 'release', 'summary', 'buildtime', 'description')
+
+	# the extractor instance used by a pool worker
+	_workerInstance = None
+
+	def __init__(self):
+		self.ts = rpm.TransactionSet()
+		self.ts.setVSFlags(rpm.RPMVSF_NOHDRCHK | rpm.RPMVSF_MASK_NOSIGNATURES | rpm.RPMVSF_NOPAYLOAD)
+
+	def extract(self, path, fieldNames = FIELDS):
+		fdno = os.open(path, os.O_RDONLY)
+		try:
+			hdr = self.ts.hdrFromFdno(fdno)
+		finally:
+			os.close(fdno)
+
+		if hdr[rpm.RPMTAG_SOURCEPACKAGE]:
+			# infomsg(f"{path}: source package")
+			return None
+
+		result = {}
+		for key in fieldNames:
+			value = hdr[key]
+			if type(value) is bytes:
+				value = value.decode('utf-8')
+			result[key] = value
+
+		return result
+
+	@classmethod
+	def initWorker(klass):
+		klass._workerInstance = klass()
+
+	@classmethod
+	def extractInWorker(klass, path):
+		try:
+			return klass._workerInstance.extract(path)
+		except Exception as e:
+			errormsg(f"{path}: {e}")
+			return None
+
 class RpmInfoUpdateGadget(object):
+	# Below this number of rpms, spinning up a worker pool does not pay off
+	MIN_PARALLEL = 64
+
 	def __init__(self, codebaseData, batching = False):
 		self.codebaseData = codebaseData
 		self.extraDB = codebaseData.loadExtraDB()
 		self.batching = batching
 		self.queue = []
 		self.modified = False
+		self._extractor = None
 
 	def __len__(self):
 		return len(self.queue)
@@ -264,31 +325,57 @@ class RpmInfoUpdateGadget(object):
 
 	def update(self, rpmInfo, path, hash):
 		# infomsg(f"update {rpmInfo}")
-		hdr = self.extractRpmHeaderFields(path, ('name', 'version', 'release', 'summary', 'buildtime', 'description'))
+		# Handle extraction errors the same way extractInWorker does
+		try:
+			hdr = self.extractRpmHeaderFields(path, RpmHeaderExtractor.FIELDS)
+		except Exception as e:
+			errormsg(f"{path}: {e}")
+			hdr = None
+		self.applyUpdate(rpmInfo, path, hash, hdr)
+
+	def applyUpdate(self, rpmInfo, path, hash, hdr):
 		if hdr is None:
 			errormsg(f"Failed to update {rpmInfo}: unable to extract header fields from {path}")
+			return
 
 		rpmInfo.update(hdr, hash)
 		self.modified = True
 
-	def extractRpmHeaderFields(self, path, fieldNames):
-		ts = rpm.TransactionSet()
+	# Process all queued updates. The headers are extracted in parallel, but
+	# the results are applied to the ExtraDB in queue order.
+	def updateQueued(self, progressMeter = None, numWorkers = None):
+		import multiprocessing
 
-		ts.setVSFlags(rpm.RPMVSF_NOHDRCHK | rpm.RPMVSF_MASK_NOSIGNATURES | rpm.RPMVSF_NOPAYLOAD)
+		queue = self.queue
+		self.queue = []
 
-		fdno = os.open(path, os.O_RDONLY)
-		hdr = ts.hdrFromFdno(fdno)
-		os.close(fdno)
+		if numWorkers is None:
+			numWorkers = os.cpu_count() or 1
 
-		if hdr[rpm.RPMTAG_SOURCEPACKAGE]:
-			# infomsg(f"{path}: source package")
-			return None
+		if numWorkers <= 1 or len(queue) < self.MIN_PARALLEL:
+			for rpmInfo, path, hash in queue:
+				self.update(rpmInfo, path, hash)
+				self.reportProgress(progressMeter, rpmInfo)
+			return
 
-		result = {}
-		for key in fieldNames:
-			value = hdr[key]
-			if type(value) is bytes:
-				value = value.decode('utf-8')
-			result[key] = value
+		paths = [path for rpmInfo, path, hash in queue]
+		chunksize = max(1, min(256, len(paths) // (4 * numWorkers)))
 
-		return result
+		with multiprocessing.Pool(numWorkers, initializer = RpmHeaderExtractor.initWorker) as pool:
+			results = pool.imap(RpmHeaderExtractor.extractInWorker, paths, chunksize = chunksize)
+			for (rpmInfo, path, hash), hdr in zip(queue, results):
+				self.applyUpdate(rpmInfo, path, hash, hdr)
+				self.reportProgress(progressMeter, rpmInfo)
+
+	def reportProgress(self, progressMeter, rpmInfo):
+		if progressMeter is None:
+			return
+
+		if (progressMeter.count % 1000) == 0:
+			infomsg(f"   {progressMeter}: {rpmInfo}")
+		progressMeter.tick()
+
+	def extractRpmHeaderFields(self, path, fieldNames):
+		if self._extractor is None:
+			self._extractor = RpmHeaderExtractor()
+		return self._extractor.extract(path, fieldNames)
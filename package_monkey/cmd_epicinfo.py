@@ -8,15 +8,30 @@ from .options import ApplicationBase
 from .util import infomsg, errormsg, warnmsg, loggingFacade
 from .util import NameMatcher
 from .filter import Classification
-from .cmd_label import ClassificationGadget
+from .cmd_server import QueryClient
 
 class EpicQueryApplication(ApplicationBase):
 	def __init__(self, name, *args, **kwargs):
 		super().__init__(name, *args, **kwargs)
 
+		# The query server sets these to avoid classifying the codebase for every
+		# query, and to capture our output
+		self.classificationResult = None
+		self.captureOutput = False
+
 	def run(self):
+		# If there's a query server running, let it do the heavy lifting
+		if QueryClient.forward(self):
+			return
+
+		self.performQuery()
+
+	def performQuery(self):
 		query = self.createQuery(QueryContext(self))
 
+		if not self.captureOutput:
+			loggingFacade.enableStdout()
+
 		epics = getattr(self.opts, 'epics', [])
 		query.perform(epics)
 
@@ -45,12 +60,14 @@ class QueryContext(object):
 		except:
 			pass
 
-		self.db = application.loadDBForSnapshot()
+		classification = application.classificationResult
+		if classification is None:
+			classification = application.classify()
 
-		gadget = ClassificationGadget(self.db, application.modelDescription)
-		self.classification = gadget.solve(application.productCodebase)
+		self.db = classification.db
+		self.classification = classification
 
-		self.classificationScheme = gadget.classificationScheme
+		self.classificationScheme = classification.classificationScheme
 		self.epicOrder = self.classificationScheme.epicOrder()
 
 	def enumerateLayers(self):
@@ -88,8 +105,6 @@ class EpicQueryBase(object):
 		self.processedEpics = Classification.createLabelSet()
 
 	def perform(self, queryNames, **kwargs):
-		loggingFacade.enableStdout()
-
 		if not queryNames:
 			for layer in self.context.enumerateLayers():
 				self.queryLayer(layer)
@@ -1,17 +1,134 @@
 
+import os
+import glob
+import pickle
+import difflib
+import collections
+
 from .packages import PackageCollection
-from .filter import Classification
+from .filter import Classification, ParallelNameMatcher
+from .pmatch import ParallelStringMatcher, FnmatchIndex
 from .floader import FilterLoader
 from .options import ApplicationBase
-from .util import TimedExecutionBlock, ExecTimer
+from .util import TimedExecutionBlock, ExecTimer, FileFingerprint
 from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
 from .reports import GenericStringReport
 from .obsclnt import OBSBuild
 from .newdb import RpmBase
+from .arch import ArchSet
 from .classify import *
 from .new_compose import *
 from .scenario import *
 
+##################################################################
+# Restrict classification to a set of epics and/or layers.
+# This is useful when working on the rules for one or two epics; rather
+# than labelling the entire codebase, we only label the builds that
+# are candidates for placement in one of these epics, plus those builds
+# they depend on or that depend on them.
+##################################################################
+class ClassificationScope(object):
+	def __init__(self, classificationScheme, names):
+		self.names = []
+		self.epics = Classification.createLabelSet()
+		self.layers = Classification.createLabelSet()
+
+		for arg in names:
+			self.names += arg.split(',')
+
+		for name in self.names:
+			label = classificationScheme.getTypedLabel(name, Classification.TYPE_EPIC)
+			if label is not None:
+				self.epics.add(label)
+				continue
+
+			label = classificationScheme.getTypedLabel(name, Classification.TYPE_LAYER)
+			if label is None:
+				raise Exception(f"Unknown epic or layer {name} in classification scope")
+			self.layers.add(label)
+
+		for epic in classificationScheme.allEpics:
+			if epic.layer in self.layers:
+				self.epics.add(epic)
+
+		self.includesDefaultEpic = classificationScheme.defaultEpic in self.epics
+
+	def __str__(self):
+		return ', '.join(self.names)
+
+	def __contains__(self, epic):
+		return epic in self.epics
+
+	def touches(self, labelHints):
+		if labelHints is None:
+			return False
+		return labelHints.epic in self.epics or labelHints.layer in self.layers
+
+	# A build is part of the scope if any of the build or rpm rules matching
+	# it refers to one of our epics or layers. We do not care about precedence
+	# here, as that is resolved when labelling the build.
+	def buildIsCandidate(self, build, packageLabelling):
+		if self.touches(build.labelHints):
+			return True
+
+		buildMatches = packageLabelling.buildMatcher.match(build.name)
+		if not buildMatches and self.includesDefaultEpic:
+			return True
+
+		for m in buildMatches:
+			if self.touches(m.labelHints):
+				return True
+
+		for rpm in build.binaries:
+			for m in packageLabelling.binaryMatcher.match(rpm.name):
+				if self.touches(m.labelHints):
+					return True
+		return False
+
+	def directDependencies(self, rpm):
+		if rpm.isSourcePackage:
+			return
+
+		yield from rpm.resolvedRequires
+		for arch in rpm.solutions.keys():
+			yield from rpm.solutions.raw_get(arch)
+
+		if rpm.requiredBy is not None:
+			for arch, requirers in rpm.requiredBy.items():
+				yield from requirers
+
+	def restrictCollection(self, collection, packageLabelling, db):
+		# directDependencies() needs rpm.requiredBy, which is only populated
+		# on demand
+		db.enableProvidesLookups()
+
+		selected = set()
+		for build in collection.builds:
+			if self.buildIsCandidate(build, packageLabelling):
+				selected.add(build)
+
+		neighbors = set()
+		for build in selected:
+			for rpm in build.binaries:
+				for other in self.directDependencies(rpm):
+					if other.new_build is not None:
+						neighbors.add(other.new_build)
+
+		# build somepkg:blah may inherit its epic from build somepkg
+		for build in selected.union(neighbors):
+			if ':' in build.name:
+				baseBuild = db.lookupBuild(build.name.split(':')[0])
+				if baseBuild is not None:
+					neighbors.add(baseBuild)
+
+		result = PackageCollection()
+		for build in collection.builds:
+			if build in selected or build in neighbors:
+				result.addBuild(build)
+
+		infomsg(f"Scope {self}: {len(selected)} candidate builds, {len(neighbors.difference(selected))} neighboring builds")
+		return result
+
 # This is the workhorse for performing the classification.
 # Split into a separate class so that it can also be used by the composition code
 class ClassificationGadget(object):
@@ -34,13 +151,29 @@ class ClassificationGadget(object):
 		filterPath = modelDescription.getPath('filter.yaml')
 		self.schemeBuilder = loader.load(filename = filterPath, scheme = classificationScheme, scenarios = scenarioFacade)
 
-	def solve(self, codebase):
-		packageCollection = self.performInitialPlacement(codebase)
+	@property
+	def modelFiles(self):
+		return self.schemeBuilder.modelFiles
+
+	def createScope(self, names):
+		return ClassificationScope(self.classificationScheme, names)
+
+	# If an IncrementalPlacement is given, we reuse the previous placement
+	# of all builds and rpms that are not affected by the changed filter rules.
+	def solve(self, codebase, scope = None, incremental = None):
+		packageCollection = self.performInitialPlacement(codebase, scope, incremental)
+
+		checkedRequirements = None
+		if incremental is not None:
+			checkedRequirements = incremental.reusableRequirements(self.db, packageCollection)
+
 		return NewResult.build(self.classificationScheme,
 					packageCollection,
-					self.db)
+					self.db,
+					scope = scope,
+					checkedRequirements = checkedRequirements)
 
-	def performInitialPlacement(self, codebase):
+	def createCollection(self, codebase):
 		collection = PackageCollection()
 		schemeBuilder = self.schemeBuilder
 		db = self.db
@@ -63,10 +196,36 @@ class ClassificationGadget(object):
 			if self.traceMatcher is not None:
 				collection.enablePackageTracing(self.traceMatcher)
 
+		return collection
+
+	def performInitialPlacement(self, codebase, scope = None, incremental = None):
+		collection = self.createCollection(codebase)
+		schemeBuilder = self.schemeBuilder
+		db = self.db
+
+		if scope is not None:
+			with TimedExecutionBlock(f"selecting builds in scope {scope}"):
+				collection = scope.restrictCollection(collection, schemeBuilder.packageLabelling, db)
+
+		# the builds and rpms we need to place
+		unplaced = collection
+		if incremental is not None:
+			with TimedExecutionBlock("restoring placements not affected by changed filter rules"):
+				unplaced = incremental.selectAffected(collection)
+				self.applyPlacement(incremental.placement, incremental.affectedBuilds, incremental.affectedRpms)
+
+		with TimedExecutionBlock("matching builds and packages against filter rules"):
+			nameMatcher = ParallelNameMatcher(schemeBuilder.packageLabelling)
+			buildMatches, rpmMatches = nameMatcher.matchCollection(unplaced)
+
 		with TimedExecutionBlock("performing initial placement of packages"):
-			deferred = []
+			buildsByName = {}
 			for build in collection.builds:
-				schemeBuilder.tryToLabelBuild(build)
+				buildsByName[build.name] = build
+
+			deferred = []
+			for build in unplaced.builds:
+				schemeBuilder.tryToLabelBuild(build, buildMatches.get(build))
 				if build.epic is None and not build.isSynthetic:
 					deferred.append(build)
 
@@ -77,8 +236,7 @@ class ClassificationGadget(object):
 				# build somepkg:blah defaults to the same epic as build 'somepkg'
 				if ':' in build.name:
 					name = build.name.split(':')[0]
-					# FIXME: this is slow, but shouldn't happen too often.
-					baseBuild = self.db.lookupBuild(name)
+					baseBuild = buildsByName.get(name)
 					if baseBuild is not None and baseBuild.epic is not None:
 						if build.trace:
 							infomsg(f"{build}: inherit epic {build.epic} from base build {baseBuild}")
@@ -94,12 +252,15 @@ class ClassificationGadget(object):
 					build.setLabelHints(labelHints)
 
 			defaultClass = schemeBuilder.classificationScheme.defaultClass
-			for pkg in collection.packages:
-				schemeBuilder.tryToLabelPackage(pkg)
+			for pkg in unplaced.packages:
+				schemeBuilder.tryToLabelPackage(pkg, rpmMatches.get(pkg))
 				if pkg.new_class is None:
 					pkg.new_class = defaultClass
 
-			schemeBuilder.resolveSubsets(db)
+			if scope is None and incremental is None:
+				schemeBuilder.resolveSubsets(db)
+			else:
+				schemeBuilder.resolveSubsets(db, unplaced.builds)
 
 		# Is this still useful?
 		for build in collection.builds:
@@ -108,6 +269,91 @@ class ClassificationGadget(object):
 
 		return collection
 
+	# Represent the placement of builds and rpms as plain data, referring to
+	# labels by name. This is what restorePlacement() needs in order to put
+	# a freshly loaded DB into the same state as the one we classified.
+	def flattenPlacement(self):
+		builds = []
+		for build in self.db.builds:
+			labelHints = build.labelHints
+			if labelHints is not None:
+				# these have been placed when loading the model already
+				if labelHints.scenarioBinding is not None:
+					continue
+				labelHints = labelHints.flatten()
+
+			epic = build.new_epic
+			if epic is not None:
+				epic = epic.name
+
+			if epic is not None or labelHints is not None:
+				builds.append((build.name, epic, labelHints))
+
+		# rpms that do not belong to any build are never placed; this includes
+		# the promises created by NewResult.build()
+		rpms = []
+		for rpm in self.db.rpms:
+			if rpm.new_build is None:
+				continue
+
+			labelHints = rpm.labelHints
+			if labelHints is not None:
+				labelHints = labelHints.flatten()
+
+			klass = rpm.new_class
+			if klass is not None:
+				klass = klass.name
+
+			overrideEpic = rpm.new_override_epic
+			if overrideEpic is not None:
+				overrideEpic = overrideEpic.name
+
+			rpms.append((rpm.name, klass, overrideEpic, sorted(rpm.architectures.names), labelHints))
+
+		return {'builds': builds, 'rpms': rpms}
+
+	def restorePlacement(self, codebase, data):
+		collection = self.createCollection(codebase)
+		self.applyPlacement(data)
+		return collection
+
+	# Apply the placement recorded by flattenPlacement(), except for the
+	# builds and rpms given
+	def applyPlacement(self, data, skipBuilds = (), skipRpms = ()):
+		classificationScheme = self.classificationScheme
+		db = self.db
+
+		def getEpic(name):
+			return classificationScheme.getTypedLabelThrow(name, Classification.TYPE_EPIC)
+
+		for name, epic, labelHints in data['builds']:
+			build = db.lookupBuild(name)
+			if build is None:
+				raise Exception(f"DB does not have build {name}")
+			if build in skipBuilds:
+				continue
+
+			if epic is not None:
+				build.new_epic = getEpic(epic)
+				build.new_layer = build.new_epic.layer
+			if labelHints is not None:
+				build.labelHints = Classification.LabelHints.restore(classificationScheme, labelHints)
+
+		for name, klass, overrideEpic, architectures, labelHints in data['rpms']:
+			rpm = db.lookupRpm(name)
+			if rpm is None:
+				raise Exception(f"DB does not have rpm {name}")
+			if rpm in skipRpms:
+				continue
+
+			if klass is not None:
+				rpm.new_class = classificationScheme.getTypedLabelThrow(klass, Classification.TYPE_CLASS)
+			if overrideEpic is not None:
+				rpm.new_override_epic = getEpic(overrideEpic)
+			rpm.architectures = ArchSet(architectures)
+			if labelHints is not None:
+				rpm.labelHints = Classification.LabelHints.restore(classificationScheme, labelHints)
+
 	# Fabricate build objects for synthetic rpms (such as scenarios)
 	def generateSyntheticBuilds(self, db, collection):
 		for rpm in db.rpms:
@@ -144,6 +390,335 @@ class ClassificationGadget(object):
 
 		return report
 
+##################################################################
+# Relabel incrementally after a change to the filter rules.
+#
+# We diff the model files of the previous run against the current
+# ones. If every line that was added or removed is a list item that
+# corresponds to a filter rule that was added or removed, nothing
+# but the filter rules changed.
+#
+# In this case, only builds whose name matches a changed rule, or
+# that produce an rpm whose name matches one, need to be placed
+# again. So do the builds that may inherit their epic from one of
+# these, and those that share an rpm with one of these. All other
+# builds and rpms get the placement recorded by the previous run.
+#
+# Likewise, NewResult.build() only needs to check the requirements
+# of the rpms placed again, and of those that require one of them.
+# For all other rpms, it reuses the outcome of the previous run.
+#
+# Anything else, like changes to label definitions, or to rules that
+# define promises, requires a full run.
+##################################################################
+class IncrementalPlacement(object):
+	def __init__(self, previous, schemeBuilder):
+		self.placement = previous['placement']
+		self.requirements = previous['result']
+		self.schemeBuilder = schemeBuilder
+
+		self.changedBuildRules = ParallelStringMatcher()
+		self.changedRpmRules = ParallelStringMatcher()
+		self.changedBuildSubsetRules = FnmatchIndex()
+		self.changedRpmSubsetRules = FnmatchIndex()
+		self.numChangedRules = 0
+
+		self.affectedBuilds = set()
+		self.affectedRpms = set()
+
+		self.valid = self.compare(previous['model'])
+
+	# Record what compare() needs to know about the model in the next run
+	@classmethod
+	def describeModel(klass, schemeBuilder):
+		files = {}
+		for path in schemeBuilder.modelFiles:
+			with open(path) as f:
+				files[path] = f.read()
+
+		return {'files': files, 'rules': list(klass.ruleSignatures(schemeBuilder))}
+
+	@staticmethod
+	def ruleSignatures(schemeBuilder):
+		for m in schemeBuilder.packageLabelling.allMatches:
+			yield m.signature
+
+		for subset in schemeBuilder.subsetResolver.subsets:
+			for m in subset.buildMatches + subset.rpmMatches:
+				yield m.signature
+
+	def fail(self, msg):
+		infomsg(f"Cannot relabel incrementally: {msg}")
+		return False
+
+	@staticmethod
+	def listItemText(line):
+		line = line.strip()
+		if not line.startswith('- '):
+			return None
+
+		text = line[2:].split(' #')[0].strip()
+		if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+			text = text[1:-1]
+		return ' '.join(text.split())
+
+	def compare(self, previousModel):
+		modelFiles = self.schemeBuilder.modelFiles
+		previousFiles = previousModel['files']
+
+		if list(previousFiles.keys()) != list(modelFiles):
+			return self.fail("the set of model files changed")
+
+		addedLines = collections.Counter()
+		removedLines = collections.Counter()
+		for path in modelFiles:
+			with open(path) as f:
+				newLines = f.read().splitlines()
+			oldLines = previousFiles[path].splitlines()
+
+			sm = difflib.SequenceMatcher(None, oldLines, newLines, autojunk = False)
+			for tag, i1, i2, j1, j2 in sm.get_opcodes():
+				if tag == 'equal':
+					continue
+
+				for lines, counter in ((oldLines[i1:i2], removedLines), (newLines[j1:j2], addedLines)):
+					for line in lines:
+						if not line.strip() or line.strip().startswith('#'):
+							continue
+
+						text = self.listItemText(line)
+						if text is None:
+							return self.fail(f"{os.path.basename(path)}: \"{line.strip()}\" is not a filter rule")
+						counter[text] += 1
+
+		currentRules = collections.Counter(self.ruleSignatures(self.schemeBuilder))
+		previousRules = collections.Counter(previousModel['rules'])
+		addedRules = currentRules - previousRules
+		removedRules = previousRules - currentRules
+
+		if collections.Counter(sig[1] for sig in addedRules.elements()) != addedLines or \
+		   collections.Counter(sig[1] for sig in removedRules.elements()) != removedLines:
+			return self.fail("model changes other than filter rules")
+
+		for sig in (addedRules + removedRules):
+			type, text = sig[:2]
+
+			pattern = text.split()[0]
+			if pattern.startswith('promise:'):
+				return self.fail(f"changed rule \"{text}\" defines a promise")
+
+			if type == 'package':
+				self.changedBuildRules.add(pattern, True)
+			elif type == 'subset-build':
+				self.changedBuildSubsetRules.add(pattern.lstrip('!'), True)
+			elif type == 'subset-rpm':
+				self.changedRpmSubsetRules.add(pattern.lstrip('!'), True)
+			else:
+				self.changedRpmRules.add(pattern, True)
+			self.numChangedRules += 1
+
+		return True
+
+	def matchesChangedRule(self, build):
+		if self.changedBuildRules.match(build.name) or \
+		   self.changedBuildSubsetRules.match(build.name):
+			return True
+
+		for rpm in build.binaries:
+			if self.changedRpmRules.match(rpm.name) or \
+			   self.changedRpmSubsetRules.match(rpm.name):
+				return True
+		return False
+
+	# Find the builds that need to be placed again, and return them as a
+	# PackageCollection
+	def selectAffected(self, collection):
+		buildsOfRpm = {}
+		derivedBuilds = {}
+		for build in collection.builds:
+			for rpm in build.binaries:
+				buildsOfRpm.setdefault(rpm, []).append(build)
+
+			# build somepkg:blah may inherit its epic from build somepkg
+			if ':' in build.name:
+				derivedBuilds.setdefault(build.name.split(':')[0], []).append(build)
+
+		pending = [build for build in collection.builds if self.matchesChangedRule(build)]
+		while pending:
+			build = pending.pop()
+			if build in self.affectedBuilds:
+				continue
+
+			self.affectedBuilds.add(build)
+			self.affectedRpms.update(build.binaries)
+
+			pending += derivedBuilds.get(build.name, [])
+			for rpm in build.binaries:
+				pending += buildsOfRpm[rpm]
+
+		result = PackageCollection()
+		for build in collection.builds:
+			if build in self.affectedBuilds:
+				result.addBuild(build)
+
+		infomsg(f"Relabelling incrementally: {self.numChangedRules} changed filter rules affect {len(self.affectedBuilds)} builds and {len(self.affectedRpms)} rpms")
+		return result
+
+	# Checking the requirements of an rpm looks at its own placement, and at
+	# the placement of the rpms it requires, as well as the promises for these.
+	# Return what the previous run recorded for all rpms where none of these changed.
+	def reusableRequirements(self, db, collection):
+		changed = set(self.affectedRpms)
+		for rpm in self.affectedRpms:
+			if rpm.type == RpmBase.TYPE_PROMISE and rpm.name.startswith('promise:'):
+				promised = db.lookupRpm(rpm.name[8:])
+				if promised is not None:
+					changed.add(promised)
+
+		def needsCheck(rpm):
+			if rpm in changed or not changed.isdisjoint(rpm.resolvedRequires):
+				return True
+
+			for arch in rpm.solutions.keys():
+				if not changed.isdisjoint(rpm.solutions.raw_get(arch)):
+					return True
+			return False
+
+		result = dict(self.requirements)
+		numChecked = 0
+		for build in collection.builds:
+			for rpm in build.binaries:
+				if rpm.name in result and needsCheck(rpm):
+					del result[rpm.name]
+					numChecked += 1
+
+		infomsg(f"Relabelling incrementally: checking the requirements of {numChecked} rpms")
+		return result
+
+##################################################################
+# Persist the result of ClassificationGadget.solve() together with
+# a fingerprint of everything that went into it (codebase DB, model
+# files, hints, and the package_monkey code itself).
+# The result is stored in flat form, with builds, rpms and labels
+# referred to by name. Restoring it still requires us to load the
+# DB and the model, but compose no longer needs to classify the
+# entire codebase when all that changed is compose.yaml.
+# We also record the model files and filter rules, so that classify
+# can relabel incrementally when only the rules changed.
+##################################################################
+class ClassificationCache(object):
+	FORMAT_VERSION = 3
+
+	def __init__(self, codebaseData, modelDescription, traceMatcher = None):
+		self.path = codebaseData.getPath("classification.cache")
+		self.codebaseData = codebaseData
+		self.modelDescription = modelDescription
+		self.traceMatcher = traceMatcher
+
+	def computeFingerprint(self, modelFiles = None):
+		fingerprint = FileFingerprint()
+		fingerprint.addValue('format', self.FORMAT_VERSION)
+
+		trace = []
+		if self.traceMatcher is not None:
+			trace = sorted(self.traceMatcher.patterns)
+		fingerprint.addValue('trace', ','.join(trace))
+
+		fingerprint.addFile(self.codebaseData.dbPath)
+		fingerprint.addFile(self.codebaseData.dbJournalPath)
+		fingerprint.addFile(self.codebaseData.patchPath)
+		fingerprint.addFile(self.modelDescription.codebaseModelPath)
+		fingerprint.addFile(self.modelDescription.preprocessorHintsPath)
+		for path in modelFiles or []:
+			fingerprint.addFile(path)
+
+		for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))):
+			fingerprint.addFile(path)
+
+		return fingerprint
+
+	# Returns the flat data if the cache is up to date. If modelChanges is
+	# True, also return it if nothing but the model files changed.
+	def loadData(self, modelChanges = False):
+		if not os.path.exists(self.path):
+			return None
+
+		try:
+			with open(self.path, "rb") as f:
+				cached = FileFingerprint.fromDict(pickle.load(f))
+
+				current = self.computeFingerprint(cached.files.keys())
+				changed = current.differences(cached)
+				if changed and modelChanges:
+					data = pickle.load(f)
+					if set(changed).issubset(data['model']['files']):
+						return data
+
+				if changed:
+					infomsg(f"Cached classification in {self.path} is out of date")
+					for key in changed:
+						infomsg(f"   changed: {key}")
+					return None
+
+				return pickle.load(f)
+		except Exception as e:
+			warnmsg(f"Unable to use cached classification {self.path}: {e}")
+
+		return None
+
+	# Restore the cached result on top of the gadget's DB. If this raises
+	# an exception, the DB may have been modified, and the caller should
+	# discard it.
+	def load(self, gadget, codebase):
+		data = self.loadData()
+		if data is None:
+			return None
+
+		with TimedExecutionBlock(f"restoring cached classification from {self.path}"):
+			collection = gadget.restorePlacement(codebase, data['placement'])
+			return NewResult.build(gadget.classificationScheme, collection, gadget.db,
+						checkedRequirements = data['result'])
+
+	# Returns an IncrementalPlacement if the cached classification differs
+	# from what we would compute now in the filter rules only.
+	def loadIncremental(self, gadget):
+		data = self.loadData(modelChanges = True)
+		if data is None:
+			return None
+
+		incremental = IncrementalPlacement(data, gadget.schemeBuilder)
+		if not incremental.valid:
+			return None
+		return incremental
+
+	def save(self, gadget, classificationResult):
+		fingerprint = self.computeFingerprint(gadget.modelFiles)
+
+		tmpPath = self.path + ".tmp"
+		try:
+			with TimedExecutionBlock(f"saving classification to {self.path}"):
+				data = {
+					'model':	IncrementalPlacement.describeModel(gadget.schemeBuilder),
+					'placement':	gadget.flattenPlacement(),
+					'result':	classificationResult.flatten(),
+				}
+
+				with open(tmpPath, "wb") as f:
+					pickle.dump(fingerprint.asDict(), f)
+					pickle.dump(data, f, protocol = pickle.HIGHEST_PROTOCOL)
+		except Exception as e:
+			warnmsg(f"Unable to cache classification result: {e}")
+			if os.path.exists(tmpPath):
+				os.remove(tmpPath)
+			return False
+
+		os.rename(tmpPath, self.path)
+		return True
+
+	def invalidate(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
 class LabellingApplication(ApplicationBase):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -153,7 +728,32 @@ class LabellingApplication(ApplicationBase):
 		db = self.loadNewDB()
 
 		gadget = ClassificationGadget(db, self.modelDescription, self.traceMatcher)
-		result = gadget.solve(self.productCodebase)
+
+		if getattr(self.opts, 'scope', None):
+			self.runScoped(gadget)
+			return
+
+		result = None
+		if not self.opts.full:
+			incremental = self.classificationCache.loadIncremental(gadget)
+			if incremental is not None:
+				try:
+					result = gadget.solve(self.productCodebase, incremental = incremental)
+				except Exception as e:
+					warnmsg(f"Unable to relabel incrementally: {e}")
+
+					# relabelling incrementally may have modified the DB
+					gadget = self.createPristineGadget()
+				else:
+					if self.opts.verify:
+						result, gadget = self.verifyIncremental(result, gadget)
+
+		if result is None:
+			result = gadget.solve(self.productCodebase)
+
+		# Save the result before anyone else gets to modify it, so that
+		# a subsequent compose can pick it up
+		self.classificationCache.save(gadget, result)
 
 		if result.dependencyReport:
 			infomsg(f"{len(result.dependencyReport)} package dependency inversions in model:")
@@ -169,6 +769,70 @@ class LabellingApplication(ApplicationBase):
 
 		self.codebaseData.saveClassification(result)
 
+	def createPristineGadget(self):
+		self._codebaseData = None
+		db = self.loadNewDB()
+		return ClassificationGadget(db, self.modelDescription, self.traceMatcher)
+
+	# Cross-check the result of incremental relabelling against a full run.
+	# Classifying modifies the DB, so the full run needs a pristine copy.
+	def verifyIncremental(self, result, gadget):
+		infomsg(f"Verifying incremental relabelling against a full classification run")
+
+		fullGadget = self.createPristineGadget()
+		fullResult = fullGadget.solve(self.productCodebase)
+
+		def describe(gadget, result):
+			lines = []
+			result.writePlacements(lines.append)
+			for name, seq, msg in result.dependencyReport.messages:
+				lines.append(f"{name}: {msg}")
+
+			placement = gadget.flattenPlacement()
+			for key in ('builds', 'rpms'):
+				for entry in sorted(placement[key], key = lambda entry: entry[0]):
+					lines.append(f"placement {key} {entry}")
+
+			# the order in which we check the requirements of an rpm is arbitrary
+			for name, checked in sorted(result.flatten().items()):
+				shippable, optionNames, inversions, promisedNames = checked
+				lines.append(f"requirements {name} shippable={shippable} options={optionNames}" \
+					f" inversions={sorted(inversions or [])} promised={sorted(promisedNames or [])}")
+			return lines
+
+		differences = list(difflib.unified_diff(describe(gadget, result), describe(fullGadget, fullResult),
+					'incremental', 'full', lineterm = '', n = 0))
+		if not differences:
+			infomsg(f"Incremental relabelling produced the same result as a full run")
+			return result, gadget
+
+		errormsg(f"Incremental relabelling differs from a full run:")
+		for line in differences[:50]:
+			errormsg(f"   {line}")
+		if len(differences) > 50:
+			errormsg(f"   ... {len(differences) - 50} more lines")
+		errormsg(f"Using the result of the full run")
+
+		return fullResult, fullGadget
+
+	# Label only the builds relevant to the requested epics and layers, and
+	# display the result. This is a partial classification, so we neither
+	# cache it nor update classification.db
+	def runScoped(self, gadget):
+		scope = gadget.createScope(self.opts.scope)
+		result = gadget.solve(self.productCodebase, scope = scope)
+
+		infomsg(f"Placements for scope {scope}:")
+		result.writePlacements(infomsg)
+		infomsg("")
+
+		if result.dependencyReport:
+			infomsg(f"{len(result.dependencyReport)} package dependency inversions in scope:")
+			result.dependencyReport.render()
+			infomsg("")
+
+		infomsg(f"Scoped classification; not updating classification.db")
+
 class ScenarioLabellingFacade(object):
 	class ScenarioBinding(object):
 		def __init__(self, var, version):
@@ -1,8 +1,8 @@
 from .options import ApplicationBase
 from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
-from .util import NameMatcher
 from .arch import *
 from .postprocess import *
+from .cmd_server import QueryClient
 
 loggingFacade.disableTimestamps()
 
@@ -18,7 +18,14 @@ class CommonInfoApplication(ApplicationBase):
 			errormsg(f"You can specify only one of --requires-only --provides-only or --names-only")
 			exit(1)
 
-		codebaseData = self.getCodebaseForSnapshot(None)
+		# If there's a query server running, let it do the heavy lifting
+		if QueryClient.forward(self):
+			return
+
+		self.performQuery()
+
+	def performQuery(self):
+		codebaseData = self.codebaseData
 		self.db = codebaseData.loadDB()
 
 		self.db.enableProvidesLookups()
@@ -54,12 +61,7 @@ class PackageInfoApplication(CommonInfoApplication):
 				if arch in validArchitectures:
 					packageName, packageArch = baseName, arch
 
-			matcher = NameMatcher([packageName])
-			rpmList = []
-			for rpm in db.rpms:
-				if matcher.match(rpm.name):
-					rpmList.append(rpm)
-
+			rpmList = db.matchRpms(packageName)
 			if not rpmList:
 				print(f"{packageName}: no match")
 				continue
@@ -70,12 +72,7 @@ class PackageInfoApplication(CommonInfoApplication):
 class BuildInfoApplication(CommonInfoApplication):
 	def processQuery(self, db, nameList):
 		for buildName in nameList:
-			matcher = NameMatcher([buildName])
-			buildList = []
-			for build in db.builds:
-				if matcher.match(build.name):
-					buildList.append(build)
-
+			buildList = db.matchBuilds(buildName)
 			if not buildList:
 				print(f"{buildName}: not found")
 				continue
@@ -33,6 +33,9 @@ class PreprocessApplicationBase(ApplicationBase):
 		self.resolverLog = None
 		self.errorReport = GenericStringReport()
 
+		# ArchSolvers that can be reused, indexed by arch
+		self.archSolvers = {}
+
 	def openResolverLog(self):
 		if self.opts.reslog is None:
 			self.opts.reslog = self.getCodebasePath("resolver.log")
@@ -112,8 +115,12 @@ class PreprocessApplicationBase(ApplicationBase):
 	def displayUnresolvables(self, unresolvables):
 		pass
 
-	def updateCodebasePatch(self):
-		db = self.loadNewDB(withoutPatchDB = True)
+	# When called right after solving, the caller passes in the DB it just saved.
+	# In this case, we also reuse its ArchSolvers rather than loading all
+	# repositories a second time.
+	def updateCodebasePatch(self, db = None):
+		if db is None:
+			db = self.loadNewDB(withoutPatchDB = True)
 
 		unresolvables = self.getUnresolvables(db)
 		self.displayUnresolvables(unresolvables)
@@ -125,14 +132,20 @@ class PreprocessApplicationBase(ApplicationBase):
 
 		ghosts = codebaseModel.ghostRpms.toRpms(db, create = True)
 
-		self.hints = self.modelDescription.loadPreprocessorHints()
-		self.loadRepositories(withStaging = self.opts.staging)
+		if self.hints is None:
+			self.hints = self.modelDescription.loadPreprocessorHints()
+		if self.repositoryCollection is None:
+			self.loadRepositories(withStaging = self.opts.staging)
 
 		for rpm in unresolvables:
 			rpm.prepareToPatch()
 
 		for arch in codebaseModel.architectures:
-			archSolver = self.createArchSolver(arch)
+			archSolver = self.archSolvers.get(arch)
+			if archSolver is None:
+				archSolver = self.createArchSolver(arch)
+			else:
+				archSolver.resetResults()
 
 			rpmsToSolve = []
 			for rpm in unresolvables:
@@ -201,7 +214,9 @@ class SolverApplication(PreprocessApplicationBase):
 
 		archSolvers = []
 		for arch in sorted(self.architectures):
-			archSolvers.append(self.createArchSolver(arch))
+			archSolver = self.createArchSolver(arch)
+			self.archSolvers[arch] = archSolver
+			archSolvers.append(archSolver)
 
 		totalRpmCount = sum(len(a.queue) for a in archSolvers)
 		progressMeter = ThatsProgress(totalRpmCount)
@@ -229,7 +244,7 @@ class SolverApplication(PreprocessApplicationBase):
 			if not self.opts.ignore_errors:
 				return 1
 
-		self.updateCodebasePatch()
+		self.updateCodebasePatch(db)
 
 		return 0
 
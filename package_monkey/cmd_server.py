@@ -0,0 +1,253 @@
+##################################################################
+#
+# Query server: keep the codebase DB, extraDB, policy and
+# classification in memory, and answer rpminfo/buildinfo/epic
+# queries over a unix domain socket.
+#
+# The query commands transparently forward their request to the
+# server if one is running for the same codebase.
+#
+##################################################################
+
+import os
+import io
+import sys
+import json
+import glob
+import socket
+import argparse
+import traceback
+import contextlib
+import logging
+
+from .options import ApplicationBase
+from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
+from .util import FileFingerprint
+
+class QueryProtocol(object):
+	STATUS_OK = 'ok'
+	STATUS_MISMATCH = 'mismatch'
+	STATUS_ERROR = 'error'
+
+	@staticmethod
+	def socketPath(application):
+		return application.codebaseData.getPath("query.sock")
+
+	# Describe which model and state we're talking about. The server refuses
+	# queries that were issued against a different setup.
+	@staticmethod
+	def identity(application):
+		return {
+			'codebase': application.opts.codebase,
+			'statedir': os.path.abspath(application.expandedStateRoot),
+			'model': os.path.abspath(application.modelDescription.path),
+		}
+
+	@staticmethod
+	def send(sock, msg):
+		sock.sendall(json.dumps(msg, default = str).encode('utf-8') + b'\n')
+
+	@staticmethod
+	def receive(sock):
+		data = b''
+		while not data.endswith(b'\n'):
+			chunk = sock.recv(65536)
+			if not chunk:
+				break
+			data += chunk
+
+		if not data:
+			return None
+		return json.loads(data.decode('utf-8'))
+
+class QueryClient(object):
+	# Try to have the query answered by a running server. Returns True if the
+	# server took care of it; False if the caller should process the query itself.
+	@classmethod
+	def forward(klass, application):
+		opts = application.opts
+		if getattr(opts, 'no_server', False) or opts.trace:
+			return False
+
+		path = QueryProtocol.socketPath(application)
+		if not os.path.exists(path):
+			return False
+
+		try:
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+				sock.connect(path)
+
+				QueryProtocol.send(sock, {
+					'command': application.name,
+					'identity': QueryProtocol.identity(application),
+					'options': vars(opts),
+				})
+				response = QueryProtocol.receive(sock)
+		except OSError as e:
+			debugmsg(f"Unable to contact query server at {path}: {e}")
+			return False
+
+		if response is None or response.get('status') == QueryProtocol.STATUS_MISMATCH:
+			return False
+
+		sys.stdout.write(response.get('output', ''))
+		sys.stdout.flush()
+
+		if response.get('status') != QueryProtocol.STATUS_OK:
+			exit(response.get('exitcode') or 1)
+		return True
+
+class QueryServerApplication(ApplicationBase):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+
+		self.classificationResult = None
+		self.fingerprint = None
+
+	def queryApplicationClass(self, command):
+		from .cmd_pinfo import PackageInfoApplication, BuildInfoApplication
+		from .cmd_epicinfo import EpicListApplication, EpicShowApplication
+
+		return {
+			'rpminfo': PackageInfoApplication,
+			'buildinfo': BuildInfoApplication,
+			'list': EpicListApplication,
+			'show': EpicShowApplication,
+		}.get(command)
+
+	# All the files whose modification should cause us to reload
+	def computeFingerprint(self):
+		codebaseData = self.codebaseData
+
+		fingerprint = FileFingerprint()
+		fingerprint.addFileStat(codebaseData.dbPath)
+		fingerprint.addFileStat(codebaseData.dbJournalPath)
+		fingerprint.addFileStat(codebaseData.patchPath)
+		fingerprint.addFileStat(codebaseData.extraDbPath)
+		fingerprint.addFileStat(codebaseData.policyPath)
+		fingerprint.addFileStat(codebaseData.getPath("classification.db"))
+
+		modelPath = self.modelDescription.path
+		for path in sorted(glob.glob(os.path.join(modelPath, "**", "*.yaml"), recursive = True)):
+			fingerprint.addFileStat(path)
+		fingerprint.addFileStat(self.modelDescription.preprocessorHintsPath)
+		return fingerprint
+
+	def load(self):
+		self.fingerprint = self.computeFingerprint()
+
+		# forget everything we loaded previously
+		self._codebaseData = None
+		self._modelDescription = None
+		self.classificationResult = None
+
+		# The epic queries need the classification result. Classifying modifies
+		# the DB, so make sure the rpm/build queries get a pristine copy.
+		# The query server only reads the state directory, so we use
+		# classification.cache if it is valid, but never update it.
+		self.classificationResult = self.classify(updateCache = False)
+		self._codebaseData = None
+
+		codebaseData = self.codebaseData
+		db = codebaseData.loadDB()
+		db.enableProvidesLookups()
+		codebaseData.loadExtraDB()
+		codebaseData.loadClassification()
+
+		infomsg(f"Query server is ready")
+
+	def reloadIfChanged(self):
+		changed = self.computeFingerprint().differences(self.fingerprint)
+		if not changed:
+			return
+
+		infomsg(f"Reloading because of changes to {' '.join(map(os.path.basename, changed))}")
+		self.load()
+
+	def processRequest(self, request):
+		identity = QueryProtocol.identity(self)
+		if request.get('identity') != identity:
+			return {'status': QueryProtocol.STATUS_MISMATCH}
+
+		command = request.get('command')
+		klass = self.queryApplicationClass(command)
+		if klass is None:
+			return {'status': QueryProtocol.STATUS_MISMATCH}
+
+		self.reloadIfChanged()
+
+		opts = argparse.Namespace(**request['options'])
+		application = klass(command, opts)
+		application._modelDescription = self.modelDescription
+		application._codebaseData = self.codebaseData
+		application.classificationResult = self.classificationResult
+		application.captureOutput = True
+
+		# The query commands display their output via print() or infomsg(),
+		# so we need to capture both
+		output = io.StringIO()
+		handler = logging.StreamHandler(output)
+		handler.setFormatter(loggingFacade.RelativeTimeFormatter(loggingFacade.NOTIME_FORMAT))
+
+		status = QueryProtocol.STATUS_OK
+		exitcode = 0
+
+		root = loggingFacade.root
+		savedHandlers = root.handlers
+		root.handlers = [handler]
+		try:
+			with contextlib.redirect_stdout(output):
+				application.performQuery()
+		except SystemExit as e:
+			if e.code:
+				status = QueryProtocol.STATUS_ERROR
+				exitcode = e.code if type(e.code) is int else 1
+		except Exception as e:
+			output.write(traceback.format_exc())
+			status = QueryProtocol.STATUS_ERROR
+			exitcode = 1
+		finally:
+			root.handlers = savedHandlers
+
+		return {'status': status, 'exitcode': exitcode, 'output': output.getvalue()}
+
+	def run(self):
+		path = QueryProtocol.socketPath(self)
+
+		if os.path.exists(path):
+			try:
+				with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+					probe.connect(path)
+				errormsg(f"There already is a query server listening on {path}")
+				exit(1)
+			except ConnectionRefusedError:
+				infomsg(f"Removing stale socket {path}")
+				os.unlink(path)
+
+		self.load()
+
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+			server.bind(path)
+			server.listen()
+			infomsg(f"Listening on {path}")
+
+			try:
+				while True:
+					conn, addr = server.accept()
+					with conn:
+						self.handleConnection(conn)
+			except KeyboardInterrupt:
+				infomsg(f"Shutting down")
+			finally:
+				os.unlink(path)
+
+	def handleConnection(self, conn):
+		try:
+			request = QueryProtocol.receive(conn)
+			if request is None:
+				return
+
+			response = self.processRequest(request)
+			QueryProtocol.send(conn, response)
+		except (OSError, ValueError) as e:
+			warnmsg(f"Error while processing query: {e}")
@@ -10,34 +10,254 @@ import tempfile
 import re
 import time
 from .util import infomsg, warnmsg, errormsg
+from .util import removeUnreferencedObjects
+
+##################################################################
+# Inventory of the files in a download directory, so that we do not
+# have to list and stat the directory every time we want to know
+# what is present.
+#
+# The manifest is a journal of lines that either record the arrival of
+# a file ("+ name size hdrmd5") or its removal ("- name"). Each change
+# is appended as a single line, so an interrupted download leaves the
+# manifest in a consistent state. The journal is compacted whenever it
+# has accumulated too many changes.
+##################################################################
+class DownloadManifest(object):
+	FILENAME = ".manifest"
+
+	hdrmd5_re = re.compile('^([0-9a-f]{32})-')
 
-class DownloadManager(object):
 	def __init__(self, destdir):
 		self.destdir = destdir
+		self.path = os.path.join(destdir, self.FILENAME)
+		self._entries = None
+		self.journalLength = 0
+
+	@property
+	def entries(self):
+		if self._entries is None:
+			if os.path.exists(self.path):
+				self.load()
+			else:
+				self.rescan()
+		return self._entries
+
+	def __contains__(self, name):
+		return name in self.entries
+
+	def __iter__(self):
+		return iter(self.entries)
+
+	def load(self):
+		self._entries = {}
+		self.journalLength = 0
+
+		with open(self.path) as f:
+			for line in f.readlines():
+				if not line.endswith('\n'):
+					# incomplete last line, eg because we were interrupted
+					break
+
+				w = line.split()
+				if len(w) == 4 and w[0] == '+':
+					self._entries[w[1]] = (int(w[2]), w[3])
+				elif len(w) == 2 and w[0] == '-':
+					self._entries.pop(w[1], None)
+				else:
+					continue
+
+				self.journalLength += 1
+
+		if self.journalLength > 2 * len(self._entries) + 1000:
+			self.save()
+
+	# Rebuild the manifest from the contents of the directory
+	def rescan(self):
+		infomsg(f"Scanning {self.destdir}")
+
+		self._entries = {}
+		for filename in os.listdir(self.destdir):
+			if filename.endswith('.rpm'):
+				st = os.stat(os.path.join(self.destdir, filename))
+				self._entries[filename] = (st.st_size, self.hdrmd5(filename))
+
+		self.save()
+
+	def save(self):
+		with open(self.path + ".tmp", "w") as f:
+			for name, (size, hdrmd5) in sorted(self.entries.items()):
+				print(f"+ {name} {size} {hdrmd5}", file = f)
+		os.rename(self.path + ".tmp", self.path)
+
+		self.journalLength = len(self._entries)
+
+	def hdrmd5(self, name):
+		m = self.hdrmd5_re.match(name)
+		if m is None:
+			return '-'
+		return m.group(1)
+
+	def add(self, name, size):
+		entry = (size, self.hdrmd5(name))
+		self.entries[name] = entry
+		self.append(f"+ {name} {entry[0]} {entry[1]}")
+
+	def remove(self, name):
+		if self.entries.pop(name, None) is not None:
+			self.append(f"- {name}")
+
+	def append(self, line):
+		with open(self.path, "a") as f:
+			f.write(line + '\n')
+		self.journalLength += 1
+
+##################################################################
+# Store of rpm headers that is shared across projects, repositories
+# and architectures. Headers are stored under their hdrmd5, and the
+# per-repository directories hardlink to these objects. This way, a
+# header that was downloaded once (eg for the main project) does not
+# need to be downloaded again for a staging project that contains
+# the very same rpm.
+##################################################################
+class HeaderStore(object):
+	def __init__(self, path):
+		self.path = path
+
+	def objectPath(self, hdrmd5):
+		return os.path.join(self.path, hdrmd5[:2], hdrmd5)
+
+	def lookup(self, hdrmd5):
+		path = self.objectPath(hdrmd5)
+		if os.path.exists(path):
+			return path
+		return None
+
+	def add(self, hdrmd5, path):
+		objPath = self.objectPath(hdrmd5)
+		if os.path.exists(objPath):
+			return
+
+		objDir = os.path.dirname(objPath)
+		if not os.path.isdir(objDir):
+			os.makedirs(objDir)
+
+		try:
+			os.link(path, objPath)
+		except FileExistsError:
+			pass
+
+	# Called before a repository view drops its link to the header.
+	# If nobody else references it, remove it from the store.
+	def release(self, hdrmd5, path):
+		objPath = self.objectPath(hdrmd5)
+		try:
+			st = os.stat(path)
+			if st.st_nlink == 2 and os.path.samestat(st, os.stat(objPath)):
+				os.unlink(objPath)
+		except FileNotFoundError:
+			pass
+
+	# release() only catches objects that are referenced by the store and
+	# the one repository view dropping it. Objects that were also linked
+	# into a snapshot (with --with-rpms) are left behind when that snapshot
+	# goes away, so we need to sweep for objects that nobody references
+	# anymore.
+	def collectGarbage(self):
+		numRemoved = removeUnreferencedObjects(self.path)
+		if numRemoved:
+			infomsg(f"Removed {numRemoved} unreferenced headers from {self.path}")
+
+class DownloadManager(object):
+	def __init__(self, destdir, headerStore = None):
+		self.destdir = destdir
+		self.headerStore = headerStore
 
 		if not os.path.isdir(destdir):
 			os.makedirs(destdir)
 
+		self.manifest = DownloadManifest(destdir)
+
 	@property
 	def localFilenames(self):
-		for filename in os.listdir(self.destdir):
+		for filename in self.manifest:
 			if filename.endswith('.rpm'):
 				yield filename
 
+	def isPresent(self, name):
+		return name in self.manifest
+
 	def fullpath(self, name):
 		return os.path.join(self.destdir, name)
 
+	def rescan(self):
+		self.manifest.rescan()
+
+		if self.headerStore is not None:
+			for name in self.manifest:
+				hdrmd5 = self.manifest.hdrmd5(name)
+				if hdrmd5 != '-':
+					self.headerStore.add(hdrmd5, self.fullpath(name))
+
+	# Satisfy as many of the given names as possible by linking to
+	# headers in the shared store. Returns the names we were able to link.
+	def adoptFromStore(self, names):
+		result = set()
+		if self.headerStore is None:
+			return result
+
+		for name in names:
+			hdrmd5 = self.manifest.hdrmd5(name)
+			if hdrmd5 == '-':
+				continue
+
+			objPath = self.headerStore.lookup(hdrmd5)
+			if objPath is None:
+				continue
+
+			destpath = self.fullpath(name)
+			if os.path.exists(destpath):
+				os.unlink(destpath)
+			os.link(objPath, destpath)
+
+			self.manifest.add(name, os.stat(destpath).st_size)
+			result.add(name)
+
+		return result
+
 	def storeFromStream(self, filename, stream, count = -1):
 		destpath = os.path.join(self.destdir, filename)
 
 		with tempfile.NamedTemporaryFile(mode = 'wb', dir = self.destdir) as tmpfile:
 			tmpfile.write(stream.read(count))
+			tmpfile.flush()
+			size = tmpfile.tell()
+
 			if os.path.exists(destpath):
 				os.unlink(destpath)
 			os.link(tmpfile.name, destpath)
 
+		self.manifest.add(filename, size)
+
+		hdrmd5 = self.manifest.hdrmd5(filename)
+		if self.headerStore is not None and hdrmd5 != '-':
+			self.headerStore.add(hdrmd5, destpath)
+
 		return destpath
 
+	def remove(self, filename):
+		path = self.fullpath(filename)
+
+		hdrmd5 = self.manifest.hdrmd5(filename)
+		if self.headerStore is not None and hdrmd5 != '-':
+			self.headerStore.release(hdrmd5, path)
+
+		try:
+			os.unlink(path)
+		except FileNotFoundError:
+			pass
+		self.manifest.remove(filename)
+
 	def processCpio(self, stream):
 		from osc.util.cpio import CpioHdr
 
@@ -98,6 +318,10 @@ class DownloadQueue(object):
 		alreadyPresent = set(self.downloadManager.localFilenames)
 		self.downloadNames = requestedLocalNames.difference(alreadyPresent)
 
+		# Do not download headers that we already have for a different project
+		if self.downloadNames:
+			self.downloadNames.difference_update(self.downloadManager.adoptFromStore(self.downloadNames))
+
 		if remoteNameMap is None:
 			self.queue = sorted(self.downloadNames)
 		else:
@@ -122,7 +346,7 @@ class DownloadQueue(object):
 	def downloadedFiles(self):
 		for name in self.requestedLocalNames:
 			path = self.downloadManager.fullpath(name)
-			if not os.path.isfile(path):
+			if not self.downloadManager.isPresent(name):
 				raise Exception(f"Download of {path} failed")
 			yield path
 		return
@@ -141,7 +365,9 @@ class DownloadQueue(object):
 			infomsg(f"Going to remove {len(toRemove)} stale files from {cacheDir}")
 
 			for filename in toRemove:
-				os.unlink(os.path.join(cacheDir, filename))
+				self.downloadManager.remove(filename)
+
+			self.downloadManager.manifest.save()
 
 class DownloadInfo(object):
 	def __init__(self):
@@ -3,6 +3,7 @@
 # Label hierarchy used to abstract package dependencies
 #
 ##################################################################
+import os
 import fnmatch
 import datetime
 from functools import reduce
@@ -10,7 +11,7 @@ from functools import reduce
 from .util import ExecTimer, TimedExecutionBlock
 from .util import loggingFacade, debugmsg, infomsg, warnmsg, errormsg
 from .ordered import PartialOrder
-from .pmatch import ParallelStringMatcher
+from .pmatch import ParallelStringMatcher, FnmatchIndex
 from .profile import profiling
 from .policy import Policy
 from .reports import LocationIndexedReport
@@ -935,6 +936,54 @@ class Classification(object):
 
 			return f"LabelHints({' '.join(attrs)})"
 
+		LABEL_ATTRS = ('label', 'layer', 'epic', 'klass', 'definingBuildOption', 'autoFlavor')
+		ARCH_ATTRS = ('overrideArch', 'includeArch', 'excludeArch')
+		PLAIN_ATTRS = ('priority', 'lifecycleID', 'isPrivate', 'splitOkay')
+
+		# Represent the label hints as plain data that refers to labels by type and
+		# name. This is used when caching the classification result; see restore().
+		# Scenario bindings are not included; the caller needs to deal with them.
+		def flatten(self):
+			result = {}
+			for attr in self.LABEL_ATTRS:
+				label = getattr(self, attr)
+				if label is not None:
+					result[attr] = (label.type, label.name)
+			for attr in self.ARCH_ATTRS:
+				archSet = getattr(self, attr)
+				if archSet is not None:
+					result[attr] = sorted(archSet.names)
+			for attr in self.PLAIN_ATTRS:
+				value = getattr(self, attr)
+				if value:
+					result[attr] = value
+			if self.options:
+				result['options'] = [(label.type, label.name) for label in self.options]
+			return result
+
+		@staticmethod
+		def restore(classificationScheme, data):
+			def getLabel(typeAndName):
+				type, name = typeAndName
+				return classificationScheme.getTypedLabelThrow(name, type)
+
+			labelHints = Classification.LabelHints(potentiallyShared = False)
+			for attr in labelHints.LABEL_ATTRS:
+				value = data.get(attr)
+				if value is not None:
+					setattr(labelHints, attr, getLabel(value))
+			for attr in labelHints.ARCH_ATTRS:
+				value = data.get(attr)
+				if value is not None:
+					setattr(labelHints, attr, ArchSet(value))
+			for attr in labelHints.PLAIN_ATTRS:
+				if attr in data:
+					setattr(labelHints, attr, data[attr])
+			if 'options' in data:
+				labelHints.options = Classification.createLabelSet(list(map(getLabel, data['options'])))
+			labelHints.inuse = True
+			return labelHints
+
 		def updateFromMatch(self, m):
 			assert(not self.potentiallyShared)
 
@@ -1047,6 +1096,7 @@ class Classification(object):
 				self.pattern = pattern
 				self.priority = len(pattern)
 				self.classes = None
+				self.parameters = []
 
 			def addClass(self, klass):
 				if self.type == 0 and self.exclude:
@@ -1054,6 +1104,22 @@ class Classification(object):
 				if self.classes is None:
 					self.classes = Classification.createLabelSet()
 				self.classes.add(klass)
+				self.parameters.append(f"class={klass.name}")
+
+			# The pattern as written in the model file, including its parameters
+			@property
+			def text(self):
+				pattern = self.pattern
+				if self.exclude:
+					pattern = '!' + pattern
+				return ' '.join([pattern] + self.parameters)
+
+			# Identifies the rule across classification runs (see IncrementalPlacement)
+			@property
+			def signature(self):
+				type = 'subset-build' if self.type == 0 else 'subset-rpm'
+				label = self.subset.label
+				return (type, self.text, label.type, label.name)
 
 			def match(self, name):
 				return fnmatch.fnmatchcase(name, self.pattern)
@@ -1216,38 +1282,64 @@ class PackageLabelling(object):
 		def describe(self):
 			return f"{self.type} filter pattern={self.pattern} precedence={self.precedence}: hints={self.labelHints}"
 
+		# The pattern as written in the model file, including its parameters
+		@property
+		def text(self):
+			return ' '.join([self.pattern] + self.parameters)
+
+		# Identifies the rule across classification runs (see IncrementalPlacement)
+		@property
+		def signature(self):
+			return (self.type, self.text, self.precedence, repr(self.labelHints.flatten()))
+
 	def __init__(self):
 		self.binaryMatcher = ParallelStringMatcher()
 		self.buildMatcher = ParallelStringMatcher()
 
+		# Every match is assigned an integer id, so that the result of matching
+		# names in a worker process can be returned in compact form
+		self.allMatches = []
+
+	def addMatch(self, matcher, m):
+		m.id = len(self.allMatches)
+		self.allMatches.append(m)
+		matcher.add(m.pattern, m)
+		return m
+
 	def createBinaryRpmMatch(self, pattern, labelHints):
 		m = self.Match(pattern, 'binary', labelHints.priority, labelHints)
-		self.binaryMatcher.add(m.pattern, m)
-		return m
+		return self.addMatch(self.binaryMatcher, m)
 
 	def createRpmHintsMatch(self, pattern, labelHints):
 		m = self.Match(pattern, 'hints', labelHints.priority, labelHints)
-		self.binaryMatcher.add(m.pattern, m)
-		return m
+		return self.addMatch(self.binaryMatcher, m)
 
 	def createBuildMatch(self, pattern, labelHints):
 		m = self.Match(pattern, 'package', labelHints.priority, labelHints)
-		self.buildMatcher.add(m.pattern, m)
-		return m
+		return self.addMatch(self.buildMatcher, m)
 
 	def createRoleMatch(self, pattern, labelHints):
 		m = self.Match(pattern, 'role', labelHints.priority, labelHints)
-		self.binaryMatcher.add(m.pattern, m)
-		return m
+		return self.addMatch(self.binaryMatcher, m)
+
+	def matchIds(self, name, isBuild):
+		matcher = self.buildMatcher if isBuild else self.binaryMatcher
+		return tuple(m.id for m in matcher.match(name))
+
+	def matchesForIds(self, ids):
+		return [self.allMatches[id] for id in ids]
 
 	def finalize(self):
 		pass
 
-	def tryToLabelPackage(self, rpm):
+	# If the caller has already matched the rpm name against our rules
+	# (see ParallelNameMatcher), it can pass the result in matches.
+	def tryToLabelPackage(self, rpm, matches = None):
 		if rpm.isSourcePackage:
 			return None
 
-		matches = self.binaryMatcher.match(rpm.name)
+		if matches is None:
+			matches = self.binaryMatcher.match(rpm.name)
 
 		matchFilter = None
 		if rpm.new_build:
@@ -1271,8 +1363,9 @@ class PackageLabelling(object):
 		matches = self.preprocessMatches(rpm.name, matches, rpm.trace, matchFilter)
 		return self.returnMatches(rpm.name, matches, rpm.trace)
 
-	def tryToLabelBuild(self, build):
-		matches = self.buildMatcher.match(build.name)
+	def tryToLabelBuild(self, build, matches = None):
+		if matches is None:
+			matches = self.buildMatcher.match(build.name)
 		matches = self.preprocessMatches(build.name, matches, build.trace)
 		return self.returnMatches(build.name, matches, build.trace)
 
@@ -1393,6 +1486,73 @@ class PackageLabelling(object):
 
 		return labelHints
 
+##################################################################
+# Match the names of all builds and rpms of a collection against the
+# filter rules. This is independent for each name, so we farm it out
+# to a pool of worker processes. Workers are forked after the filter
+# rules have been loaded, so they inherit the PackageLabelling object;
+# all we send back and forth are names and tuples of match ids.
+##################################################################
+class ParallelNameMatcher(object):
+	# Below this number of names, spinning up a worker pool does not pay off
+	MIN_PARALLEL = 2000
+
+	_workerLabelling = None
+
+	def __init__(self, packageLabelling, numWorkers = None):
+		if numWorkers is None:
+			numWorkers = os.cpu_count() or 1
+
+		self.packageLabelling = packageLabelling
+		self.numWorkers = numWorkers
+
+	@classmethod
+	def matchInWorker(klass, job):
+		name, isBuild = job
+		return klass._workerLabelling.matchIds(name, isBuild)
+
+	# Returns two dicts mapping builds and rpms, respectively, to the list
+	# of matching rules
+	def matchCollection(self, collection):
+		builds = list(collection.builds)
+		rpms = [rpm for rpm in collection.packages if not rpm.isSourcePackage]
+
+		jobs = [(build.name, True) for build in builds] + \
+			[(rpm.name, False) for rpm in rpms]
+
+		labelling = self.packageLabelling
+		results = self.run(jobs)
+
+		buildMatches = {}
+		for build, ids in zip(builds, results):
+			buildMatches[build] = labelling.matchesForIds(ids)
+
+		rpmMatches = {}
+		for rpm, ids in zip(rpms, results[len(builds):]):
+			rpmMatches[rpm] = labelling.matchesForIds(ids)
+
+		return buildMatches, rpmMatches
+
+	def run(self, jobs):
+		import multiprocessing
+
+		labelling = self.packageLabelling
+
+		# We rely on the workers inheriting our state via fork()
+		if self.numWorkers <= 1 or len(jobs) < self.MIN_PARALLEL or \
+		   'fork' not in multiprocessing.get_all_start_methods():
+			return [labelling.matchIds(name, isBuild) for name, isBuild in jobs]
+
+		chunksize = max(1, min(1024, len(jobs) // (4 * self.numWorkers)))
+
+		ParallelNameMatcher._workerLabelling = labelling
+		try:
+			context = multiprocessing.get_context('fork')
+			with context.Pool(self.numWorkers) as pool:
+				return pool.map(self.matchInWorker, jobs, chunksize = chunksize)
+		finally:
+			ParallelNameMatcher._workerLabelling = None
+
 class LabelTreeValidator(object):
 	@classmethod
 	def validate(klass, classificationScheme):
@@ -1450,10 +1610,59 @@ class LabelTreeValidator(object):
 		infomsg(f"Created label tree containing {len(classificationScheme.allEpics)} epics")
 
 class SubsetMemberResolver(object):
+	# The build and rpm patterns of all subsets of an epic, compiled into
+	# one FnmatchIndex each. Every pattern is tagged with the position of its
+	# subset, and its position within the subset, so that we can apply the
+	# same "first matching rule wins" logic as Subset.bestBuildRule() and
+	# Subset.bestRpmRule().
+	class EpicRuleIndex(object):
+		def __init__(self, subsets):
+			self.buildIndex = FnmatchIndex()
+			self.rpmIndex = FnmatchIndex()
+
+			for subsetPos, subset in enumerate(subsets):
+				for rulePos, m in enumerate(subset.buildMatches):
+					self.buildIndex.add(m.pattern, (subsetPos, rulePos, m))
+				for rulePos, m in enumerate(subset.rpmMatches):
+					self.rpmIndex.add(m.pattern, (subsetPos, rulePos, m))
+
+		@staticmethod
+		def sortedMatches(matches):
+			return sorted(matches, key = lambda t: (t[0], t[1]))
+
+		# Returns a dict mapping subset position to the best build rule
+		# (or None, if the build is excluded from the subset)
+		def bestBuildRules(self, build):
+			result = {}
+			for subsetPos, rulePos, m in self.sortedMatches(self.buildIndex.match(build.name)):
+				if subsetPos in result:
+					continue
+
+				if m.exclude:
+					assert(not m.classes)
+					m = None
+				result[subsetPos] = m
+			return result
+
+		def bestRpmRules(self, rpm):
+			result = {}
+			for subsetPos, rulePos, m in self.sortedMatches(self.rpmIndex.match(rpm.name)):
+				if subsetPos in result:
+					continue
+
+				if m.classes is not None and rpm.new_class not in m.classes:
+					continue
+
+				if m.exclude:
+					m = None
+				result[subsetPos] = m
+			return result
+
 	def __init__(self):
 		self.epicMap = {}
 
 		self._subsets = {}
+		self._ruleIndex = {}
 		self.rpmMap = {}
 		self.builds = []
 
@@ -1461,6 +1670,8 @@ class SubsetMemberResolver(object):
 		if label in self._subsets:
 			raise Exception(f"Refusing to redefine subset {label}")
 
+		self._ruleIndex = {}
+
 		subset = Classification.Subset(label)
 		self._subsets[label] = subset
 
@@ -1482,11 +1693,6 @@ class SubsetMemberResolver(object):
 			if have is None or have.priority < m.priority:
 				self.rpmMap[rpm] = m
 
-		def maybeUpdateBuild(build, m):
-			for rpm in build.binaries:
-				if not m.classes or rpm.new_class in m.classes:
-					maybeUpdateRpm(rpm, m)
-
 		epic = build.new_epic
 		if epic not in self.epicMap:
 			return
@@ -1495,15 +1701,21 @@ class SubsetMemberResolver(object):
 			self.rpmMap[rpm] = None
 		self.builds.append(build)
 
-		for subset in self.epicMap[epic]:
-			m = subset.bestBuildRule(build)
-			if m is not None:
-				maybeUpdateBuild(build, m)
+		ruleIndex = self.getRuleIndex(epic)
+		buildRules = ruleIndex.bestBuildRules(build)
 
-			for rpm in build.binaries:
-				m = subset.bestRpmRule(rpm)
+		# For each rpm, this applies the rules in the same order as looping over
+		# all subsets, and trying first the build rule, then the rpm rule of each.
+		for rpm in build.binaries:
+			rpmRules = ruleIndex.bestRpmRules(rpm)
+
+			for subsetPos in sorted(set(buildRules).union(rpmRules)):
+				m = buildRules.get(subsetPos)
+				if m is not None and (not m.classes or rpm.new_class in m.classes):
+					maybeUpdateRpm(rpm, m)
+
+				m = rpmRules.get(subsetPos)
 				if m is not None:
-					assert(m.subset is subset)
 					maybeUpdateRpm(rpm, m)
 
 		# Propagate the build and rpm trace flags to the subset
@@ -1512,6 +1724,13 @@ class SubsetMemberResolver(object):
 			if m is not None and (build.trace or rpm.trace):
 				m.subset.trace = True
 
+	def getRuleIndex(self, epic):
+		ruleIndex = self._ruleIndex.get(epic)
+		if ruleIndex is None:
+			ruleIndex = self.EpicRuleIndex(self.epicMap[epic])
+			self._ruleIndex[epic] = ruleIndex
+		return ruleIndex
+
 	@property
 	def result(self):
 		for rpm, m in self.rpmMap.items():
@@ -1736,6 +1955,9 @@ class ClassificationSchemeBuilder(object):
 		self._lateLabelBindings = []
 		self._lateFilterBindings = []
 
+		# all files that went into the model (filter.yaml plus includes)
+		self.modelFiles = []
+
 		self.policy = Policy()
 		self.globalPolicySettings = self.policy.globalSettings
 
@@ -1836,13 +2058,13 @@ class ClassificationSchemeBuilder(object):
 		self.classificationScheme.freezeCategory(type)
 
 
-	def tryToLabelPackage(self, pkg):
-		labelHints = self.packageLabelling.tryToLabelPackage(pkg)
+	def tryToLabelPackage(self, pkg, matches = None):
+		labelHints = self.packageLabelling.tryToLabelPackage(pkg, matches)
 		if labelHints is not None:
 			pkg.setLabelHints(labelHints)
 			debugInitialPlacement(f"{pkg} is placed in {labelHints} by package filter rules")
 
-	def tryToLabelBuild(self, build):
+	def tryToLabelBuild(self, build, matches = None):
 		# If the build has already been labelled via 'implement_scenario', do not try
 		# to update it.
 		if build.labelHints and build.labelHints.scenarioBinding:
@@ -1850,7 +2072,7 @@ class ClassificationSchemeBuilder(object):
 				infomsg(f"{build} was already placed in {build.labelHints} by scenario binding {build.labelHints.scenarioBinding}")
 			return
 
-		labelHints = self.packageLabelling.tryToLabelBuild(build)
+		labelHints = self.packageLabelling.tryToLabelBuild(build, matches)
 		if labelHints is not None:
 			build.setLabelHints(labelHints)
 			debugInitialPlacement(f"{build} is placed in {labelHints} by package filter rules")
@@ -2038,7 +2260,7 @@ class ClassificationSchemeBuilder(object):
 				subset = self.byExtra.get(f"{epic}+{name}")
 			return subset
 
-	def resolveSubsets(self, db):
+	def resolveSubsets(self, db, builds = None):
 		defaultClass = self.classificationScheme.defaultClass
 
 		memberResolver = self.subsetResolver
@@ -2046,7 +2268,10 @@ class ClassificationSchemeBuilder(object):
 		for subset in memberResolver.subsets:
 			subset.buildClassClosure(self.classificationScheme)
 
-		for build in db.builds:
+		if builds is None:
+			builds = db.builds
+
+		for build in builds:
 			memberResolver.resolveBuild(build)
 
 		# memberResolver.showResult()
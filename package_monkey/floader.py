@@ -3,7 +3,6 @@
 # Load package-monkey configuration from yaml files
 #
 ##################################################################
-import yaml
 import os
 import datetime
 
@@ -15,7 +14,7 @@ from .filter import PackageLabelling
 from .arch import *
 from .compose import Composer
 from .policy import Team
-from .tracked_yaml import YamlLocationTracking
+from .tracked_yaml import YamlLocationTracking, full_load
 from .packages import RpmOverrideList
 
 class MonkeyConfigLoader(object):
@@ -426,6 +425,8 @@ class FilterLoader(MonkeyConfigLoader):
 			if includeBaseDir:
 				includeFile = os.path.join(includeBaseDir, includeFile)
 
+			self.schemeBuilder.modelFiles.append(includeFile)
+
 			locationTracking = YamlLocationTracking()
 			with open(includeFile) as f:
 				from .tracked_yaml import tracked_load
@@ -1112,6 +1113,7 @@ class FilterLoader(MonkeyConfigLoader):
 		assert(locationTracking is not None)
 
 		mainProcessor = self.MainFileProcessor(schemeBuilder, filename, locationTracking)
+		schemeBuilder.modelFiles.append(filename)
 
 		with open(filename) as f:
 			from .tracked_yaml import tracked_load
@@ -1378,7 +1380,7 @@ class CompositionLoader(MonkeyConfigLoader):
 		mainProcessor = self.MainFileProcessor(composer, filename)
 
 		with open(filename) as f:
-			data = yaml.full_load(f)
+			data = full_load(f)
 
 		with TimedExecutionBlock(f"loading product composition from {filename}"):
 			mainProcessor.process(data)
@@ -1400,7 +1402,9 @@ class CodebaseLoader(MonkeyConfigLoader):
 			elif key == 'versions':
 				pass
 			elif key == 'architectures':
-				self.codebase.architectures = ArchSet(self.context.asStringList(key, value))
+				names = self.context.asStringList(key, value)
+				archRegistry.registerArchitectures(names)
+				self.codebase.architectures = ArchSet(names)
 			elif key == 'hints':
 				self.codebase.hintsFile = self.context.asString(key, value)
 			elif key == 'filter':
@@ -1429,7 +1433,7 @@ class CodebaseLoader(MonkeyConfigLoader):
 	def load(self, codebase, filename, **kwargs):
 		mainProcessor = self.MainFileProcessor(codebase, filename)
 		with open(filename) as f:
-			data = yaml.full_load(f)
+			data = full_load(f)
 
 		with TimedExecutionBlock(f"loading codebase definition from {filename}"):
 			mainProcessor.process(data)
@@ -114,11 +114,17 @@ class RepositoryHandle(object):
 		return latestState == self.remoteState
 
 class SolverRepositoryCollection(object):
+	# Max number of OBS queries we issue concurrently when discovering stagings
+	DISCOVERY_WORKERS = 8
+
 	def __init__(self, architectures, solverDir):
 		self.architectures = ArchSet(architectures)
 		self.solverDir = solverDir
 		self._projects = []
 
+		# For each upstream project, the list of its staging projects
+		self._upstreamState = {}
+
 		if not os.path.isdir(solverDir):
 			os.makedirs(solverDir)
 
@@ -146,19 +152,43 @@ class SolverRepositoryCollection(object):
 		for arch in sorted(self.architectures):
 			self.createRepositoryHandle(projectName, repoName, arch)
 
+	# The OBS queries involved are independent of each other, so we issue them
+	# from a pool of worker threads. If the set of staging projects has not changed
+	# since we last looked, we reuse the information from stagings.txt rather
+	# than probing all stagings for their architectures again.
 	def discoverStagingProjects(self, client, codebase):
-		for projectName in codebase.buildProjects:
-			stagings = client.listStagings(projectName, status = 1, quiet = True) or []
-			if stagings:
-				infomsg(f"{projectName}: detected {len(stagings)} staging projects")
-			for info in stagings:
-				stagingId = info.name.split(':')[-1]
-				self._addStaging(client, stagingId, info.name, enabled = False)
-
-	def _addStaging(self, client, stagingId, projectName, repoName = 'standard', **kwargs):
+		from concurrent.futures import ThreadPoolExecutor
+
+		def listStagings(projectName):
+			return client.listStagings(projectName, status = 1, quiet = True) or []
+
+		def queryArchitectures(projectName):
+			return client.queryBuildArchitectures(projectName, 'standard') or []
+
+		upstreamProjects = list(codebase.buildProjects)
+
+		with ThreadPoolExecutor(max_workers = self.DISCOVERY_WORKERS) as pool:
+			stagingProjects = []
+			for projectName, stagings in zip(upstreamProjects, pool.map(listStagings, upstreamProjects)):
+				if stagings:
+					infomsg(f"{projectName}: detected {len(stagings)} staging projects")
+
+				names = sorted(info.name for info in stagings)
+				self._upstreamState[projectName] = names
+				stagingProjects += names
+
+			if self.loadStagingList(expectUpstreamState = self._upstreamState):
+				infomsg(f"Staging projects did not change, using cached information")
+				return
+
+			for projectName, archList in zip(stagingProjects, pool.map(queryArchitectures, stagingProjects)):
+				stagingId = projectName.split(':')[-1]
+				self._addStaging(stagingId, projectName, archList, enabled = False)
+
+	def _addStaging(self, stagingId, projectName, archList, repoName = 'standard', **kwargs):
 		count = 0
 
-		for arch in client.queryBuildArchitectures(projectName, repoName):
+		for arch in archList:
 			if not archRegistry.isValidArchitecture(arch):
 				# infomsg(f"  staging project {projectName}: ignore architecture {arch}")
 				continue
@@ -223,17 +253,41 @@ class SolverRepositoryCollection(object):
 	def saveStagingList(self):
 		path = os.path.join(self.solverDir, 'stagings.txt')
 		with open(path, "w") as f:
+			for projectName, stagingNames in sorted(self._upstreamState.items()):
+				print(f"upstream {projectName} {' '.join(stagingNames)}", file = f)
+
 			for project in sorted(self._projects, key = str):
 				if project.stagingId is not None:
 					print(f"{project.stagingId} {project}", file = f)
 
-	def loadStagingList(self):
+	# If expectUpstreamState is given, the list is loaded only if it was created for
+	# the same set of staging projects. Returns True if the list was loaded.
+	def loadStagingList(self, expectUpstreamState = None):
 		path = os.path.join(self.solverDir, 'stagings.txt')
+
+		if expectUpstreamState is not None and not os.path.exists(path):
+			return False
+
+		upstreamState = {}
+		stagings = []
 		with open(path, "r") as f:
 			for l in f.readlines():
-				stagingId, projectSpec = l.split()
+				w = l.split()
+				if w[0] == 'upstream':
+					upstreamState[w[1]] = w[2:]
+					continue
+
+				stagingId, projectSpec = w
 				projectName, repoName, arch = projectSpec.split('/')
+				stagings.append((stagingId, projectName, repoName, arch))
+
+		if expectUpstreamState is not None and upstreamState != expectUpstreamState:
+			return False
+
+		self._upstreamState = upstreamState
+		for stagingId, projectName, repoName, arch in stagings:
+			# By default, all stagings are disabled.
+			self.createRepositoryHandle(projectName, repoName, arch, stagingId = stagingId, enabled = False)
 
-				# By default, all stagings are disabled.
-				self.createRepositoryHandle(projectName, repoName, arch, stagingId = stagingId, enabled = False)
+		return True
 
@@ -259,15 +259,13 @@ class PatternMapping(object):
 				pattern.requiresPatterns.append(other)
 
 class PackageArchMap(object):
-	VALID_ARCH_NAMES = set((
-		'x86_64', 's390x', 'aarch64', 'ppc64le'
-	))
-
 	def __init__(self):
 		self._names = {}
 
 	def add(self, name, values):
-		badNames = set(values).difference(self.VALID_ARCH_NAMES)
+		from .arch import archRegistry
+
+		badNames = set(arch for arch in values if not archRegistry.isValidArchitecture(arch))
 		if badNames:
 			raise Exception(f"Bad architecture(s) for {name}: {', '.join(badNames)}")
 
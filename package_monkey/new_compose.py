@@ -774,6 +774,12 @@ class Composable(object):
 
 		ComposableRegistry.add(self)
 
+	# When restoring a cached classification result, we need to make sure
+	# the registry knows about us, so that CompositionRules.apply() can reset us.
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		ComposableRegistry.add(self)
+
 	def maybeTracePolicyUpdate(self):
 		if self.trace:
 			infomsg(f"POLICY: {self} update policy {self.policyString}")
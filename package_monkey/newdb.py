@@ -3,7 +3,7 @@ import os
 
 from .arch import *
 from .filter import Classification
-from .util import DictOfSets
+from .util import DictOfSets, NameIndex
 
 __names__ = ['RpmInfo', 'GenericRpm', 'GenericBuild', 'NewDB', 'UniquePackageInfoFactory', 'ExtraDB']
 
@@ -62,6 +62,15 @@ class NewDB(object):
 
 		self._buildProvidesCache = False
 
+		# The requiredby index of the DB file, as raw records. Parsing it is
+		# deferred until someone calls enableProvidesLookups().
+		self._requiredByIndex = None
+		self._requiredByIndexPatches = []
+
+		# name indices for pattern lookups; built on demand
+		self._rpmIndex = None
+		self._buildIndex = None
+
 	def addArchitecture(self, arch):
 		self.architectures.add(arch)
 
@@ -75,6 +84,7 @@ class NewDB(object):
 			if self.traceMatcher is not None and self.traceMatcher.match(name):
 				rpm.trace = True
 			self._rpms[name] = rpm
+			self._rpmIndex = None
 		elif type and rpm.type != type:
 			raise Exception(f"{rpm}: cannot change type from {rpm.type} to {type}")
 
@@ -100,6 +110,12 @@ class NewDB(object):
 	def rpms(self):
 		return iter(self._rpms.values())
 
+	# Return all rpms matching the given name or shell pattern
+	def matchRpms(self, pattern):
+		if self._rpmIndex is None:
+			self._rpmIndex = NameIndex(self._rpms.values(), getName = lambda rpm: rpm.name)
+		return self._rpmIndex.match(pattern)
+
 	def lookupBuild(self, name):
 		return self._builds.get(name)
 
@@ -110,12 +126,46 @@ class NewDB(object):
 			if self.traceMatcher is not None and self.traceMatcher.match(name):
 				build.trace = True
 			self._builds[name] = build
+			self._buildIndex = None
 		return build
 
 	@property
 	def builds(self):
 		return iter(self._builds.values())
 
+	# Used when replaying the journal
+	def removeRpm(self, name):
+		rpm = self._rpms.pop(name, None)
+		if rpm is None:
+			return
+
+		if self._buildProvidesCache:
+			self.unlinkRequiredBy(rpm)
+		elif self._requiredByIndex is not None:
+			self.rememberRequiredByPatch(rpm)
+
+		build = rpm.new_build
+		if build is not None:
+			build.rpms.discard(rpm)
+		self._promises.pop(rpm, None)
+		self._rpmIndex = None
+
+	def removeBuild(self, name):
+		build = self._builds.pop(name, None)
+		if build is None:
+			return
+
+		for rpm in build.rpms:
+			if rpm.new_build is build:
+				rpm.new_build = None
+		self._buildIndex = None
+
+	# Return all builds matching the given name or shell pattern
+	def matchBuilds(self, pattern):
+		if self._buildIndex is None:
+			self._buildIndex = NameIndex(self._builds.values(), getName = lambda build: build.name)
+		return self._buildIndex.match(pattern)
+
 	def createPromise(self, rpm, arch = None):
 		if arch is not None:
 			name = f"promise:{arch}:{rpm}"
@@ -139,28 +189,157 @@ class NewDB(object):
 	def promisedItems(self):
 		return self._promises.items()
 
+	@property
+	def providesLookupsEnabled(self):
+		return self._buildProvidesCache
+
 	def enableProvidesLookups(self):
 		if self._buildProvidesCache:
 			return
 		self._buildProvidesCache = True
 
+		if self._requiredByIndex is not None:
+			self.loadRequiredByIndex()
+			return
+
 		for rpm in self.rpms:
 			if rpm.isSourcePackage:
 				continue
-			rpm.requiredBy = rpm.DictOfSetsWithCommonTracking()
-			for arch in rpm.architectures:
-				rpm.requiredBy.update(arch, set())
-				pass
+			rpm.requiredBy = self.createRequiredBy(rpm)
 
 		for rpm in self.rpms:
-			commonRequires = rpm.resolvedRequires
-			for req in commonRequires:
-				for arch in rpm.architectures:
-					req.requiredBy.add(arch, rpm)
+			self.linkRequiredBy(rpm)
+
+	@staticmethod
+	def createRequiredBy(rpm):
+		requiredBy = rpm.DictOfSetsWithCommonTracking()
+		for arch in rpm.architectures:
+			requiredBy.update(arch, set())
+		return requiredBy
+
+	@staticmethod
+	def enumerateRequiredByArch(rpm):
+		commonRequires = rpm.resolvedRequires
+		for arch in rpm.architectures:
+			for req in commonRequires.union(rpm.solutions.raw_get(arch)):
+				yield req, arch
+
+	# Record rpm in the requiredBy set of everything it requires
+	def linkRequiredBy(self, rpm):
+		for req, arch in self.enumerateRequiredByArch(rpm):
+			if req.requiredBy is None:
+				req.requiredBy = self.createRequiredBy(req)
+			req.requiredBy.add(arch, rpm)
+			req.requiredBy._common = None
+
+	def unlinkRequiredBy(self, rpm):
+		for req, arch in self.enumerateRequiredByArch(rpm):
+			if req.requiredBy is not None:
+				req.requiredBy.discard(arch, rpm)
+
+	# Workaround, until we've cleaned up the prepare stage: the loader
+	# ignores promise:foo:arch style promises.
+	@staticmethod
+	def isPerArchPromise(name):
+		return name.startswith("promise:") and name.count(":") > 1
+
+	# Compute the reverse dependencies the way enableProvidesLookups() would
+	# do after loading the DB, ie only taking into account those dependencies
+	# that we actually write to the DB, and that the loader does not ignore.
+	def computeRequiredByIndex(self):
+		index = {}
+		for rpm in self.rpms:
+			if rpm.type != RpmBase.TYPE_REGULAR:
+				continue
+
+			for req, arch in self.enumerateRequiredByArch(rpm):
+				if self.isPerArchPromise(req.name):
+					continue
+				perArch = index.get(req)
+				if perArch is None:
+					perArch = {}
+					index[req] = perArch
+				try:
+					perArch[arch].add(rpm)
+				except KeyError:
+					perArch[arch] = set((rpm, ))
+		return index
+
+	# Populate requiredBy from the index records we found when loading the DB.
+	# Records refer to rpms by name; anything that was dropped by the journal
+	# is ignored.
+	def loadRequiredByIndex(self):
+		for name, records in self._requiredByIndex.items():
+			rpm = self.lookupRpm(name)
+			if rpm is None:
+				continue
+
+			requiredBy = self.createRequiredBy(rpm)
+			for w in records:
+				key = w[0]
+				requirers = set()
+				for reqName in w[1:]:
+					if self.isPerArchPromise(reqName):
+						continue
+					requiring = self.lookupRpm(reqName)
+					if requiring is not None:
+						requirers.add(requiring)
+
+				if key != 'common':
+					requiredBy.update(key, requirers)
+				else:
+					for arch in rpm.architectures:
+						requiredBy.update(arch, requirers)
+			rpm.requiredBy = requiredBy
+
+		# The index reflects the base file; undo the dependencies of rpms
+		# that the journal replaced or dropped, and add their new ones.
+		patchedNames = set()
+		for name, oldRequires in self._requiredByIndexPatches:
+			patchedNames.add(name)
+
+			rpm = self.lookupRpm(name)
+			if rpm is None:
+				continue
+
+			for reqName, arch in oldRequires:
+				req = self.lookupRpm(reqName)
+				if req is not None and req.requiredBy is not None:
+					req.requiredBy.discard(arch, rpm)
 
-			for arch in rpm.architectures:
-				for req in rpm.solutions.raw_get(arch).difference(commonRequires):
-					req.requiredBy.add(arch, rpm)
+		for name in patchedNames:
+			rpm = self.lookupRpm(name)
+			if rpm is not None:
+				self.linkRequiredBy(rpm)
+
+		# rpms that nobody requires do not show up in the index
+		for rpm in self.rpms:
+			if not rpm.isSourcePackage and rpm.requiredBy is None:
+				rpm.requiredBy = self.createRequiredBy(rpm)
+
+		self._requiredByIndex = None
+		self._requiredByIndexPatches = []
+
+	# Called when the journal replaces or drops the record of an rpm while the
+	# index has not been parsed yet.
+	def rememberRequiredByPatch(self, rpm):
+		oldRequires = [(req.name, arch) for req, arch in self.enumerateRequiredByArch(rpm)]
+		self._requiredByIndexPatches.append((rpm.name, oldRequires))
+
+	def saveRequiredBy(self, rpm, perArch, write):
+		write(f"provides {rpm.name}")
+
+		common = set()
+		if rpm.architectures:
+			common = functools.reduce(set.intersection, (perArch.get(arch, set()) for arch in rpm.architectures))
+		if common:
+			write(f"  rby common {' '.join(sorted(map(str, common)))}")
+
+		for arch, values in sorted(perArch.items()):
+			if arch in rpm.architectures:
+				values = values.difference(common)
+			if values:
+				write(f"  rby {arch} {' '.join(sorted(map(str, values)))}")
 
 	def saveRpm(self, genericRpm, write):
 		def writeDictOfSets(pfx, dos, archSet):
@@ -195,39 +374,76 @@ class NewDB(object):
 			for dep in sorted(map(str, values.difference(common))):
 				write(f"  unr {arch} {dep}")
 
-	def save(self, path):
+	def saveBuild(self, build, write):
+		write(f"build {build.name}")
+		for arch, status in sorted(build._buildStatus.items()):
+			if status != 'succeeded':
+				write(f" status {arch} {status}")
+		if build.controllingScenarioVersion:
+			write(f" mem {build.controllingScenarioVersion}")
+		for rpm in sorted(map(str, build.rpms)):
+			write(f" rpm {rpm}")
+
+	def headerLines(self):
+		result = []
+		if self.downloadTimestamp is not None:
+			result.append(f"timestamp {self.downloadTimestamp}")
+		result.append(f"arch {' '.join(sorted(self.architectures))}")
+		return result
+
+	# Enumerate the pkg and build records of the DB, in the order in
+	# which the loader expects them.
+	def records(self):
+		syntheticTypes = set(RpmBase.VALID_TYPES)
+		syntheticTypes.discard(RpmBase.TYPE_REGULAR)
+		# We do not output any dependencies on rpms of type missing any more; so no
+		# need to include them in the output file.
+		syntheticTypes.discard(RpmBase.TYPE_MISSING)
+		for type in sorted(syntheticTypes):
+			rpms = filter(lambda r: r.type == type, self.rpms)
+			for genericRpm in sorted(rpms, key = str):
+				yield ('pkg', genericRpm.name), [f"pkg {genericRpm.name} {genericRpm.type}"]
+
+		rpms = filter(lambda r: r.type == RpmBase.TYPE_REGULAR, self.rpms)
+		for genericRpm in sorted(rpms, key = str):
+			lines = []
+			self.saveRpm(genericRpm, lines.append)
+			yield ('pkg', genericRpm.name), lines
+
+		for build in sorted(self.builds, key = str):
+			lines = []
+			self.saveBuild(build, lines.append)
+			yield ('build', build.name), lines
+
+	# Unless told otherwise, we try to just append the records that changed
+	# to the journal. If that is not possible, or if the journal has grown
+	# too large, we write the whole DB.
+	def save(self, path, compact = False):
+		journal = NewDBJournal(path)
+		if not compact and journal.update(self):
+			return
+
+		self.saveFull(path)
+		journal.remove()
+
+	def saveFull(self, path):
 		def write(msg):
 			print(msg, file = dbf)
 
 		with open(path + ".tmp", "w") as dbf:
-			if self.downloadTimestamp is not None:
-				write(f"timestamp {self.downloadTimestamp}")
-
-			write(f"arch {' '.join(sorted(self.architectures))}")
-
-			syntheticTypes = set(RpmBase.VALID_TYPES)
-			syntheticTypes.discard(RpmBase.TYPE_REGULAR)
-			# We do not output any dependencies on rpms of type missing any more; so no
-			# need to include them in the output file.
-			syntheticTypes.discard(RpmBase.TYPE_MISSING)
-			for type in sorted(syntheticTypes):
-				rpms = filter(lambda r: r.type is type, self.rpms)
-				for genericRpm in sorted(rpms, key = str):
-					write(f"pkg {genericRpm.name} {genericRpm.type}")
-
-			rpms = filter(lambda r: r.type is RpmBase.TYPE_REGULAR, self.rpms)
-			for genericRpm in sorted(rpms, key = str):
-				self.saveRpm(genericRpm, write)
+			for line in self.headerLines():
+				write(line)
 
-			for build in self.builds:
-				write(f"build {build.name}")
-				for arch, status in build._buildStatus.items():
-					if status != 'succeeded':
-						write(f" status {arch} {status}")
-				if build.controllingScenarioVersion:
-					write(f" mem {build.controllingScenarioVersion}")
-				for rpm in sorted(map(str, build.rpms)):
-					write(f" rpm {rpm}")
+			# Tell the loader that this DB contains the reverse dependencies
+			write(f"index requiredby")
+
+			for key, lines in self.records():
+				for line in lines:
+					write(line)
+
+			requiredByIndex = self.computeRequiredByIndex()
+			for rpm, perArch in sorted(requiredByIndex.items(), key = lambda pair: pair[0].name):
+				self.saveRequiredBy(rpm, perArch, write)
 
 		os.rename(path + ".tmp", path)
 		infomsg(f"Updated {path}")
@@ -252,7 +468,13 @@ class NewDB(object):
 		os.rename(path + ".tmp", path)
 		infomsg(f"Updated {path}")
 
-	def loadWorker(self, path, patching = False):
+	# When replaying the journal, we're basically patching the DB. The
+	# difference is that build records replace what we had before, and
+	# records may be dropped.
+	def loadWorker(self, path, patching = False, replaying = False):
+		if replaying:
+			patching = True
+
 		nerrors = 0
 		nrpms = 0
 		nbuilds = 0
@@ -272,9 +494,14 @@ class NewDB(object):
 				if dos._common is not None:
 					dos._common.update(w)
 
+		haveRequiredByIndex = False
+		requiredByIndex = {}
+		patchedRpms = []
+
 		with open(path, 'r') as dbf:
 			currentRpm = None
 			currentBuild = None
+			currentIndexRecords = None
 
 			for line in dbf.readlines():
 				w = line.split()
@@ -283,7 +510,13 @@ class NewDB(object):
 				if cmd == 'timestamp':
 					self.downloadTimestamp = ' '.join(w)
 				elif cmd == 'arch':
+					# the DB may have been created with a model that defines
+					# additional architectures
+					archRegistry.registerArchitectures(w)
 					self.architectures.update(ArchSet(w))
+				elif cmd == 'index':
+					if 'requiredby' in w and not patching:
+						haveRequiredByIndex = True
 				elif cmd == 'pkg':
 					name = w.pop(0)
 					type = None
@@ -296,6 +529,15 @@ class NewDB(object):
 						continue
 
 					rpm = self.createRpm(name, type)
+
+					if patching and self._buildProvidesCache:
+						# the reverse dependencies of what this rpm used to
+						# require need to be updated
+						self.unlinkRequiredBy(rpm)
+						patchedRpms.append(rpm)
+					elif patching and self._requiredByIndex is not None:
+						self.rememberRequiredByPatch(rpm)
+
 					if w:
 						rpm.architectures = ArchSet(w)
 
@@ -309,6 +551,7 @@ class NewDB(object):
 
 					currentRpm = rpm
 					currentBuild = None
+					currentIndexRecords = None
 					nrpms += 1
 				elif cmd == 'req':
 					# Workaround, until we've cleaned up the prepare stage:
@@ -340,6 +583,26 @@ class NewDB(object):
 					updateDictOfSets(currentRpm.unresolvables, [key, dep])
 				elif cmd == 'cond':
 					updateDictOfSets(currentRpm.conditionals, w)
+				elif cmd == 'provides':
+					name = w.pop(0)
+					currentRpm = None
+					currentBuild = None
+
+					# Same workaround as for pkg. Older versions of the
+					# index may still contain records for these.
+					if self.isPerArchPromise(name):
+						currentIndexRecords = None
+						continue
+
+					# Just collect the records; see loadRequiredByIndex()
+					currentIndexRecords = []
+					requiredByIndex[name] = currentIndexRecords
+				elif cmd == 'rby':
+					# rby records following a provides record we ignored
+					if currentIndexRecords is None:
+						continue
+
+					currentIndexRecords.append(w)
 				elif cmd == 'build':
 					name = w.pop(0)
 
@@ -349,7 +612,10 @@ class NewDB(object):
 						continue
 
 					currentBuild = self.createBuild(name)
+					if replaying:
+						currentBuild.prepareToPatch()
 					currentRpm = None
+					currentIndexRecords = None
 					nbuilds += 1
 				elif cmd == 'status':
 					assert(currentBuild)
@@ -369,7 +635,21 @@ class NewDB(object):
 					for flag in w:
 						if flag == 'ghost':
 							rpm.isExternal = True
+					if replaying:
+						# the rpm may have moved here from a different build
+						rpm.new_build = currentBuild
 					currentBuild.addRpm(rpm)
+				elif cmd == 'drop' and replaying:
+					type, name = w
+					if type == 'pkg':
+						self.removeRpm(name)
+					elif type == 'build':
+						self.removeBuild(name)
+					else:
+						errormsg(f"DB {path}: cannot drop {type} records")
+						nerrors += 1
+					currentRpm = None
+					currentBuild = None
 				else:
 					errormsg(f"DB {path}: command {cmd} not supported")
 					nerrors += 1
@@ -377,6 +657,19 @@ class NewDB(object):
 		if nerrors:
 			raise Exception(f"DB {path}: encountered {nerrors} errors")
 
+		if haveRequiredByIndex:
+			self._requiredByIndex = requiredByIndex
+			self._requiredByIndexPatches = []
+
+		if self._buildProvidesCache:
+			for rpm in patchedRpms:
+				self.linkRequiredBy(rpm)
+
+			# rpms that were added by the patch, and that nobody requires
+			for rpm in self.rpms:
+				if not rpm.isSourcePackage and rpm.requiredBy is None:
+					rpm.requiredBy = self.createRequiredBy(rpm)
+
 		for rpm in self.rpms:
 			if rpm.new_build is None and not rpm.isSynthetic:
 				raise Exception(f"After loading DB: {rpm} w/o associated build")
@@ -389,10 +682,141 @@ class NewDB(object):
 		infomsg(f"DB {path}: loaded {nbuilds} builds and {nrpms} rpms")
 		self.userVersion = int(os.stat(path).st_mtime)
 
+		journal = NewDBJournal(path)
+		if journal.exists:
+			nrpms, nbuilds = self.loadWorker(journal.path, replaying = True)
+			infomsg(f"DB {journal.path}: replayed {nbuilds} builds and {nrpms} rpms")
+			self.userVersion = max(self.userVersion, int(os.stat(journal.path).st_mtime))
+
 	def loadPatch(self, path):
 		nrpms, nbuilds = self.loadWorker(path, patching = True)
 		infomsg(f"DB {path}: loaded {nbuilds} builds and {nrpms} rpms")
 
+# Usually, only a few hundred rpms change between two runs of the solver,
+# so rather than rewriting all of codebase.db every time, we append the
+# records that changed to a journal next to it. Loading the DB replays the
+# journal over the base file.
+# Each update appends a new segment to the journal, consisting of the header
+# lines, the pkg and build records that changed, and drop records for anything
+# that went away.
+# Once the journal has grown past a certain fraction of the base file, we
+# compact it by writing the complete DB again.
+class NewDBJournal(object):
+	SUFFIX = '.journal'
+	COMPACT_RATIO = 0.25
+
+	def __init__(self, basePath):
+		self.basePath = basePath
+		self.path = basePath + self.SUFFIX
+
+	@property
+	def exists(self):
+		return os.path.isfile(self.path)
+
+	def remove(self):
+		if self.exists:
+			os.unlink(self.path)
+
+	@property
+	def needsCompaction(self):
+		return os.path.getsize(self.path) > self.COMPACT_RATIO * os.path.getsize(self.basePath)
+
+	# Split the contents of a DB file into records. Records start with a pkg,
+	# build or provides line, and extend over all the indented lines that follow.
+	# Any other lines are header lines and form records of their own.
+	@staticmethod
+	def parseRecords(path, records):
+		key = None
+		with open(path) as f:
+			for line in f.readlines():
+				line = line.rstrip('\n')
+				if line.startswith(' '):
+					if key is not None:
+						records[key].append(line)
+					continue
+
+				w = line.split()
+				if not w:
+					continue
+
+				cmd = w[0]
+				if cmd in ('pkg', 'build', 'provides'):
+					key = (cmd, w[1])
+					records[key] = [line]
+				elif cmd == 'drop':
+					key = None
+					records.pop((w[1], w[2]), None)
+				else:
+					key = None
+					records[(cmd, )] = [line]
+
+	# The records currently on disk, ie the base file with the journal applied
+	def readRecords(self):
+		records = {}
+		self.parseRecords(self.basePath, records)
+		if self.exists:
+			self.parseRecords(self.path, records)
+		return records
+
+	# The type of an rpm, as given by the first line of its pkg record
+	@staticmethod
+	def recordType(lines):
+		return lines[0].split()[2]
+
+	# Returns False if the caller needs to write the complete DB
+	def update(self, db):
+		if not os.path.isfile(self.basePath):
+			return False
+
+		# Note, this reads and parses the base file plus the journal on every save
+		onDisk = self.readRecords()
+
+		segment = []
+		for line in db.headerLines():
+			key = (line.split()[0], )
+			if onDisk.get(key) != [line]:
+				segment.append(line)
+
+		seen = set()
+		drops = []
+		nchanged = 0
+		for key, lines in db.records():
+			seen.add(key)
+
+			previous = onDisk.get(key)
+			if previous == lines:
+				continue
+
+			# When replaying the journal, createRpm() refuses to change the type
+			# of an existing rpm. Avoid this by writing the complete DB.
+			if key[0] == 'pkg' and previous is not None and \
+			   self.recordType(previous) != self.recordType(lines):
+				infomsg(f"DB {self.basePath}: {key[1]} changed type from {self.recordType(previous)} to {self.recordType(lines)}; rewriting")
+				return False
+
+			segment += lines
+			nchanged += 1
+
+		for type in ('build', 'pkg'):
+			for key in sorted(onDisk.keys()):
+				if key[0] == type and key not in seen:
+					drops.append(f"drop {type} {key[1]}")
+
+		if not segment and not drops:
+			infomsg(f"DB {self.basePath}: no changes")
+			return True
+
+		with open(self.path, "a") as f:
+			for line in segment + drops:
+				print(line, file = f)
+
+		if self.needsCompaction:
+			infomsg(f"DB journal {self.path} has grown too large; compacting")
+			return False
+
+		infomsg(f"Updated {self.path}: {nchanged} changed and {len(drops)} dropped records")
+		return True
+
 class RpmBase(object):
 	TYPE_REGULAR	= 'rpm'
 	TYPE_SYNTHETIC	= 'synthetic'
@@ -658,7 +1082,7 @@ class GenericRpm(RpmBase):
 
 	# This is invoked when patching up the codebase with fake rpms from the ghosts section.
 	def prepareToPatch(self):
-		for dos in (self.solutions, self.versions, self.validScenarios, self.controllingScenarios, self.unresolvables,):
+		for dos in (self.solutions, self.versions, self.validScenarios, self.controllingScenarios, self.unresolvables, self.conditionals,):
 			dos.clear()
 
 class GenericBuild(object):
@@ -682,6 +1106,16 @@ class GenericBuild(object):
 	def __str__(self):
 		return self.name
 
+	# This is invoked when replaying the journal; the build record replaces
+	# everything we knew about the build.
+	def prepareToPatch(self):
+		for rpm in self.rpms:
+			if rpm.new_build is self:
+				rpm.new_build = None
+		self.rpms = set()
+		self._buildStatus = {}
+		self.controllingScenarioVersion = None
+
 	def setArchBuildStatus(self, arch, status):
 		self._buildStatus[arch] = status
 
@@ -827,10 +1261,22 @@ class GenericScenarioClass(object):
 # We store additional rpm information such as summary and
 # descriptions in a separate DB.
 #
-# FIXME: the data representation could be way more compact.
+# This used to be a text file that was loaded and rewritten as a
+# whole. These days, we keep the information in an sqlite DB, which
+# allows us to look up individual records, and to update or delete
+# just those records that changed.
 ##################################################################
 class ExtraDB(object):
+	ATTRIBUTES = ('version', 'release', 'summary', 'buildtime', 'description')
+
 	def __init__(self):
+		self._conn = None
+		self._path = None
+
+		# hash of each record in the DB, loaded on demand
+		self._storedHashes = None
+
+		# records we have looked up or created
 		self._rpms = {}
 		self._foundNames = set()
 
@@ -838,58 +1284,118 @@ class ExtraDB(object):
 	def makekey(name, buildArch):
 		return f"{name}.{buildArch}"
 
+	def load(self, path, readOnly = False):
+		import sqlite3
+
+		self._path = path
+		if readOnly:
+			self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri = True)
+			return
+
+		self._conn = sqlite3.connect(path)
+		self._conn.execute("""
+			CREATE TABLE IF NOT EXISTS rpms (
+				key TEXT PRIMARY KEY,
+				name TEXT NOT NULL,
+				arch TEXT NOT NULL,
+				hash TEXT,
+				version TEXT,
+				release TEXT,
+				summary TEXT,
+				buildtime INTEGER,
+				description TEXT
+			)""")
+
+	@property
+	def storedHashes(self):
+		if self._storedHashes is None:
+			self._storedHashes = {}
+			if self._conn is not None:
+				for key, hash in self._conn.execute("SELECT key, hash FROM rpms"):
+					self._storedHashes[key] = hash
+		return self._storedHashes
+
 	def lookupRpm(self, name, buildArch, create = False):
 		key = self.makekey(name, buildArch)
 		rpm = self._rpms.get(key)
+		if rpm is not None:
+			return rpm
+
+		if self._conn is not None:
+			columns = ', '.join(self.ATTRIBUTES)
+			row = self._conn.execute(f"SELECT hash, {columns} FROM rpms WHERE key = ?", (key, )).fetchone()
+			if row is not None:
+				rpm = RpmAuxInfo(name, buildArch, row[0])
+				for attr, value in zip(self.ATTRIBUTES, row[1:]):
+					if value is not None:
+						setattr(rpm, attr, value)
+				rpm.storedHash = rpm.hash
+
 		if rpm is None:
+			if not create:
+				return None
 			rpm = RpmAuxInfo(name, buildArch)
-			self._rpms[key] = rpm
 
+		self._rpms[key] = rpm
 		return rpm
 
 	def maybeUpdate(self, rpmName, buildArch, hash):
-		self._foundNames.add(self.makekey(rpmName, buildArch))
+		key = self.makekey(rpmName, buildArch)
+		self._foundNames.add(key)
+
+		if self.storedHashes.get(key) == hash:
+			# no need to update
+			return None
 
 		rpmInfo = self.lookupRpm(rpmName, buildArch, create = True)
 		if rpmInfo.hash == hash:
-			# no need to update
 			return None
 
 		return rpmInfo
 
 	def removeStaleEntries(self):
-		removed = set(self._rpms.keys()).difference(self._foundNames)
+		removed = set(self.storedHashes.keys()).union(self._rpms.keys()).difference(self._foundNames)
 
 		if removed:
 			infomsg(f"Removing {len(removed)} stale entries")
 
 		for key in removed:
 			infomsg(f"delete {key}")
-			del self._rpms[key]
-
-	def save(self, path):
-		with open(path, "w") as dbf:
-			def write(msg):
-				print(msg, file = dbf)
-
-			for key, rpmInfo in sorted(self._rpms.items()):
-				write(f"rpm {rpmInfo.name} {rpmInfo.arch} {rpmInfo.hash}")
-				for attr in 'version', 'release', 'summary', 'buildtime', 'description':
-					value = getattr(rpmInfo, attr, None)
-					if not value:
-						continue
+			if self._conn is not None:
+				self._conn.execute("DELETE FROM rpms WHERE key = ?", (key, ))
+			self.storedHashes.pop(key, None)
+			self._rpms.pop(key, None)
+
+	# Write all records that were updated since they were loaded
+	def save(self, path = None):
+		if path is not None and path != self._path:
+			self.load(path)
+
+		columns = ('key', 'name', 'arch', 'hash') + self.ATTRIBUTES
+		statement = f"INSERT OR REPLACE INTO rpms ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+		rows = []
+		for key, rpmInfo in sorted(self._rpms.items()):
+			if rpmInfo.hash == rpmInfo.storedHash:
+				continue
 
-					if type(value) is str and '\n' in value:
-						lines = value.strip().split('\n')
-						if not lines:
-							continue
-						write(f"   {attr} |")
-						for l in lines:
-							write(f"   |{l}")
-					else:
-						write(f"   {attr} {value}")
+			values = [key, rpmInfo.name, rpmInfo.arch, rpmInfo.hash]
+			for attr in self.ATTRIBUTES:
+				value = getattr(rpmInfo, attr, None)
+				if type(value) is str:
+					value = value.strip()
+				values.append(value or None)
+			rows.append(values)
 
-	def load(self, path):
+			rpmInfo.storedHash = rpmInfo.hash
+			self.storedHashes[key] = rpmInfo.hash
+
+		if rows:
+			self._conn.executemany(statement, rows)
+		self._conn.commit()
+
+	# Import the text file format that was used by older versions
+	def importText(self, path):
 		continuation = None
 		continuationAttr = None
 		currentRpm = None
@@ -921,6 +1427,9 @@ class ExtraDB(object):
 				else:
 					raise Exception(f"{path}: unknown keyword {cmd}")
 
+			if continuation is not None:
+				setattr(currentRpm, continuationAttr, '\n'.join(continuation))
+
 class RpmAuxInfo(object):
 	def __init__(self, name, arch, hash = None):
 		self.name = name
@@ -933,6 +1442,9 @@ class RpmAuxInfo(object):
 		self.description = None
 		self.buildTime = 0
 
+		# the hash of the record as it is stored in the ExtraDB
+		self.storedHash = None
+
 	def __str__(self):
 		return f"{self.name}.{self.arch}"
 
@@ -149,6 +149,40 @@ class OBSSchema(object):
 
 		return result
 
+	# Streaming version of processBuildResult(), for use with xmltree.iterparse().
+	# Rather than returning a list of results, it yields (result, kind, item) tuples,
+	# where kind is either 'result' (marking the start of a new result, with item
+	# set to None), 'status' or 'binarylist'
+	def iterBuildResult(self, events):
+		info = None
+		for event, depth, node in events:
+			if depth == 0:
+				if event == 'start' and not self.checkRootNodeTag(node, 'resultlist'):
+					return
+			elif depth == 1:
+				if event != 'start':
+					continue
+
+				info = None
+				if node.tag != 'result':
+					self.unexpectedElement(node)
+					continue
+
+				info = self.processSimpleXML(node, ('project', 'repository', 'arch'), ['code', 'state'])
+				yield info, node.tag, None
+			elif depth == 2 and event == 'end':
+				if info is None or node.tag in ('scmsync', 'scminfo', 'scc'):
+					pass
+				elif node.tag == 'status':
+					st = self.processSimpleXML(node, ('package', ), ('code', 'details', ))
+					yield info, node.tag, st
+				elif node.tag == 'binarylist':
+					bl = self.processSimpleXML(node, ('package', ), [])
+					bl.files = self.processBinaryListing(node)
+					yield info, node.tag, bl
+				else:
+					self.unexpectedElement(node)
+
 	def processBuildInfo(self, xmlnode):
 		result = OBSSchema.Dummy()
 		result.name = xmlnode.attrib['package']
@@ -219,6 +253,28 @@ class OBSSchema(object):
 
 		return result
 
+	# Streaming version of processBinaryListing() and processBinaryVersionListing()
+	def iterBinaryListing(self, events):
+		versionListing = False
+		for event, depth, node in events:
+			if depth == 0:
+				if event != 'start':
+					continue
+
+				if node.tag == 'binaryversionlist':
+					versionListing = True
+				elif not self.checkRootNodeTag(node, 'binarylist'):
+					return
+			elif depth == 1 and event == 'end':
+				if node.tag != 'binary':
+					self.unexpectedElement(node)
+				elif versionListing:
+					f = self.processSimpleXML(node, ('name', 'sizek', 'hdrmd5'), [])
+					f.filename = f.name
+					yield f
+				else:
+					yield self.processSimpleXML(node, ('filename', 'mtime'), [])
+
 	def processFileInfo(self, xmlnode, infoFactory = None):
 		if not self.checkRootNodeTag(xmlnode, 'fileinfo'):
 			return None
@@ -777,6 +833,18 @@ class OBSClient(object):
 
 		return tree.getroot()
 
+	# Like apiCallXML, but parse the response incrementally rather than
+	# building the complete element tree in memory. See xmltree.iterparse()
+	# for the events returned.
+	def apiCallXMLStream(self, function, *args, clearDepth = 1, **params):
+		path = self.apiMakePath(function, *args)
+
+		res = self.apiCallRaw(path, **params)
+		if not res:
+			return res
+
+		return xmltree.iterparse(res, clearDepth)
+
 	def apiCallText(self, function, *args, **params):
 		path = self.apiMakePath(function, *args)
 		res = self.apiCallRaw(path, **params)
@@ -865,6 +933,22 @@ class OBSClient(object):
 
 		return self._schema.processBuildResult(xml)
 
+	def iterBuildResult(self, project, **params):
+		events = self.apiCallXMLStream('build', project, "_result", clearDepth = 2, **params)
+		if events is None:
+			errormsg(f"Cannot find build/{project}/_result")
+			return None
+
+		return self._schema.iterBuildResult(events)
+
+	def iterBuildRepository(self, project, repository, arch, **params):
+		events = self.apiCallXMLStream("build", project, repository, arch, "_repository", **params)
+		if events is None:
+			errormsg(f"Cannot find build/{project}/{repository}/{arch}/_repository")
+			return None
+
+		return self._schema.iterBinaryListing(events)
+
 	def queryBuildRepository(self, project, repository, arch, **params):
 		xml = self.apiCallXML("build", project, repository, arch, "_repository", **params)
 		if xml is None:
@@ -1568,12 +1652,16 @@ class OBSProject(object):
 		return set(resList)
 
 	def queryBuildResults(self, client):
-		resList = client.queryBuildResult(
-				project = self.name,
-				repository = self.buildRepository,
-				arch = self.buildArch,
-				multibuild = 1,
-				view = ('status', 'binarylist'))
+		resList = []
+		for result, kind, item in self.iterBuildResults(client):
+			if kind == 'result':
+				result.status_list = []
+				result.binary_list = []
+				resList.append(result)
+			elif kind == 'status':
+				result.status_list.append(item)
+			else:
+				result.binary_list.append(item)
 
 		# Since we were pretty specific about the repo and arch, the result
 		# should have exactly one element only
@@ -1581,6 +1669,20 @@ class OBSProject(object):
 
 		return resList
 
+	# Iterate over the build results without holding the entire document in memory.
+	# Yields (result, kind, item) tuples; see OBSSchema.iterBuildResult
+	def iterBuildResults(self, client):
+		events = client.iterBuildResult(
+				project = self.name,
+				repository = self.buildRepository,
+				arch = self.buildArch,
+				multibuild = 1,
+				view = ('status', 'binarylist'))
+		if events is None:
+			raise Exception(f"Unable to query build results for {self}")
+
+		return events
+
 	def queryBuildRepository(self, client):
 		resList = client.queryBuildRepository(
 				project = self.name,
@@ -1611,17 +1713,21 @@ class OBSProject(object):
 				cacheEntry = cacheEntry, **params)
 
 	def createDownloadManager(self, cacheRoot):
+		headerStore = None
 		if cacheRoot is None:
 			destdir = archState.arch
 		else:
 			destdir = os.path.join(cacheRoot, self.name, self.buildRepository, self.buildArch)
+			headerStore = HeaderStore(os.path.join(cacheRoot, ".store"))
 
-		return RepositoryRpmDownadloadManager(destdir)
+		return RepositoryRpmDownadloadManager(destdir, headerStore)
 
 	def prepareDownload(self, client, downloadManager, filter = None):
 		from urllib.parse import quote_plus
 
-		fileList = client.queryBuildRepository(self.name, self.buildRepository, self.buildArch, view = 'binaryversions', nometa = 1, cachingOff = True)
+		fileList = client.iterBuildRepository(self.name, self.buildRepository, self.buildArch, view = 'binaryversions', nometa = 1, cachingOff = True)
+		if fileList is None:
+			raise Exception(f"Unable to query the build repository of {self}")
 
 		sha1 = hashlib.new('sha1')
 
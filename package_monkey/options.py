@@ -126,6 +126,44 @@ class ApplicationBase(object):
 	def loadPolicy(self, labelFacade):
 		return self.codebaseData.loadPolicy(labelFacade)
 
+	@property
+	def classificationCache(self):
+		from .cmd_label import ClassificationCache
+
+		return ClassificationCache(self.codebaseData, self.modelDescription, self.traceMatcher)
+
+	# Reuse the result of a previous classification run if none of its
+	# inputs have changed; otherwise, classify from scratch.
+	# If updateCache is False, the result is kept in memory only.
+	def classify(self, updateCache = True):
+		from .cmd_label import ClassificationGadget
+
+		cache = self.classificationCache
+
+		db = self.loadNewDB()
+		gadget = ClassificationGadget(db, self.modelDescription, traceMatcher = self.traceMatcher)
+
+		if not getattr(self.opts, 'reclassify', False):
+			try:
+				classificationResult = cache.load(gadget, self.productCodebase)
+			except Exception as e:
+				warnmsg(f"Unable to restore cached classification: {e}")
+
+				# restoring the result may have modified the DB
+				self._codebaseData = None
+				db = self.loadNewDB()
+				gadget = ClassificationGadget(db, self.modelDescription, traceMatcher = self.traceMatcher)
+			else:
+				if classificationResult is not None:
+					infomsg(f"Reusing cached classification result")
+					return classificationResult
+
+		classificationResult = gadget.solve(self.productCodebase)
+
+		if updateCache:
+			cache.save(gadget, classificationResult)
+		return classificationResult
+
 	def loadClassificationForSnapshot(self, slug = None):
 		codebaseData = self.getCodebaseForSnapshot(slug)
 		return codebaseData.loadClassification()
@@ -172,21 +210,25 @@ class ModelDescription(object):
 	def getPath(self, *args):
 		return os.path.join(self.path, *args)
 
+	@property
+	def codebaseModelPath(self):
+		name = self._codebaseID
+		if name is None:
+			raise Exception("Cannot determine codebase, please specify --codebase option")
+		return self.getPath(f"{name}.yaml")
+
 	@property
 	def codebaseModel(self):
 		if self._codebaseModel is None:
-			name = self._codebaseID
-			if name is None:
-				raise Exception("Cannot determine codebase, please specify --codebase option")
-
-			codebase = ProductCodebase.load(name, self.getPath(f"{name}.yaml"))
+			codebase = ProductCodebase.load(self._codebaseID, self.codebaseModelPath)
 			for project in self._codebaseExtraBuildProjects:
 				codebase.buildProjects.append(project)
 			self._codebaseModel = codebase
 
 		return self._codebaseModel
 
-	def loadPreprocessorHints(self):
+	@property
+	def preprocessorHintsPath(self):
 		codebase = self.codebaseModel
 		if codebase.hintsFile is not None:
 			path = self.getPath(codebase.hintsFile)
@@ -194,7 +236,10 @@ class ModelDescription(object):
 				raise Exception(f"Cannot access hints file at {path}")
 		else:
 			path = self.getPath('hints.conf')
-		hintsLoader = PreprocessorHintsLoader(path)
+		return path
+
+	def loadPreprocessorHints(self):
+		hintsLoader = PreprocessorHintsLoader(self.preprocessorHintsPath)
 		return hintsLoader.load()
 
 	def loadProductComposition(self, composer):
@@ -37,8 +37,13 @@ class OrderedSetMember(object):
 		self._setClass = self.domain.set
 
 		self.lowerNeighbors = None
-		self.upwardClosure = None
-		self.downwardClosure = None
+
+		# Set by PartialOrder.finalize(): our row in the closure matrix
+		self.matrix = None
+		self.index = None
+
+		self._upwardClosure = None
+		self._downwardClosure = None
 
 		self._defined = False
 		self._final = False
@@ -60,10 +65,24 @@ class OrderedSetMember(object):
 		return self is not other
 
 	def __le__(self, other):
-		return self.key in other.downwardClosure
+		return self.matrix.isBelow(self.index, other.index)
 
 	def __ge__(self, other):
-		return other.key in self.downwardClosure
+		return self.matrix.isBelow(other.index, self.index)
+
+	# The closures are materialized as fastsets only when someone asks for them.
+	# The queries implemented by PartialOrder work on the closure matrix directly.
+	@property
+	def downwardClosure(self):
+		if self._downwardClosure is None and self.matrix is not None:
+			self._downwardClosure = self._setClass(self.matrix.keysForMask(self.matrix.down[self.index]))
+		return self._downwardClosure
+
+	@property
+	def upwardClosure(self):
+		if self._upwardClosure is None and self.matrix is not None:
+			self._upwardClosure = self._setClass(self.matrix.keysForMask(self.matrix.up[self.index]))
+		return self._upwardClosure
 
 ##################################################################
 # Base class for cones, convex sets etc
@@ -152,6 +171,116 @@ class ConvexSet(PartiallyOrderedSet):
 			self._support = Cone(self.order, support)
 		return self._support
 
+##################################################################
+# Dense bit matrix representation of a finalized partial order.
+# Each element is assigned a row index, in order of increasing rank.
+# Row i of down is a python int that has bit j set iff element j
+# is below element i (including i itself); up is the transpose.
+#
+# Since rows are sorted by rank, the lower neighbors of an element
+# always come before the element itself, so the closure can be
+# computed in a single pass, OR-ing entire rows at a time.
+##################################################################
+class ClosureMatrix(object):
+	def __init__(self, keys, lowerNeighbors):
+		self.keys = keys
+		self.size = len(keys)
+
+		down = []
+		for i, below in enumerate(lowerNeighbors):
+			row = 1 << i
+			for j in below:
+				row |= down[j]
+			down.append(row)
+
+		up = [1 << i for i in range(self.size)]
+		for i in reversed(range(self.size)):
+			row = up[i]
+			for j in lowerNeighbors[i]:
+				up[j] |= row
+
+		self.down = down
+		self.up = up
+
+	def isBelow(self, i, j):
+		return bool((self.down[j] >> i) & 1)
+
+	def keysForMask(self, mask):
+		keys = self.keys
+		while mask:
+			low = mask & -mask
+			yield keys[low.bit_length() - 1]
+			mask ^= low
+
+	def downwardClosureMask(self, mask):
+		down = self.down
+		result = 0
+		while mask:
+			low = mask & -mask
+			i = low.bit_length() - 1
+			result |= down[i]
+			mask &= ~result
+		return result
+
+	def upwardClosureMask(self, mask):
+		up = self.up
+		result = 0
+		while mask:
+			low = mask & -mask
+			i = low.bit_length() - 1
+			result |= up[i]
+			mask &= ~result
+		return result
+
+	def intersectUpward(self, indices):
+		up = self.up
+		return reduce(int.__and__, (up[i] for i in indices))
+
+	def intersectDownward(self, indices):
+		down = self.down
+		return reduce(int.__and__, (down[i] for i in indices))
+
+	# A mask has a minimum iff its lowest ranked element is below all others
+	def minimumOfMask(self, mask):
+		if not mask:
+			return None
+		i = (mask & -mask).bit_length() - 1
+		if mask & ~self.up[i]:
+			return None
+		return i
+
+	def maximumOfMask(self, mask):
+		if not mask:
+			return None
+		i = mask.bit_length() - 1
+		if mask & ~self.down[i]:
+			return None
+		return i
+
+	def minimaOfMask(self, mask):
+		down = self.down
+		result = 0
+		rest = mask
+		while rest:
+			low = rest & -rest
+			i = low.bit_length() - 1
+			if down[i] & mask == low:
+				result |= low
+			rest ^= low
+		return result
+
+	def maximaOfMask(self, mask):
+		up = self.up
+		result = 0
+		rest = mask
+		while rest:
+			low = rest & -rest
+			i = low.bit_length() - 1
+			if up[i] & mask == low:
+				result |= low
+			rest ^= low
+		return result
+
 ##################################################################
 # The partial order itself.
 # This makes heavy use of fastsets to speed things up.
@@ -226,6 +355,7 @@ class PartialOrder(object):
 		self.guard = FastsetCycleDetector(domain.set, name)
 		self._unsorted = {}
 		self._sorted = None
+		self._matrix = None
 		self._final = False
 		self._allowUnknownKeys = allowUnknownKeys
 
@@ -318,34 +448,58 @@ class PartialOrder(object):
 			return None
 		return node.upwardClosure
 
-	def downwardClosureForSet(self, keySet):
-		result = self._setClass()
+	# Convert a set of keys to a bit mask of closure matrix rows.
+	# Unknown keys are ignored if the order allows them.
+	def maskForSet(self, keySet):
+		mask = 0
 		for key in keySet:
-			if key not in result:
-				result.update(self.downwardClosureFor(key))
-		return result
+			node = self.getNode(key)
+			if node is not None:
+				mask |= 1 << node.index
+		return mask
+
+	# Same as maskForSet, but returns None if the set contains unknown keys
+	def strictMaskForSet(self, keySet):
+		mask = 0
+		for key in keySet:
+			node = self._unsorted.get(key)
+			if node is None:
+				return None
+			mask |= 1 << node.index
+		return mask
+
+	def setForMask(self, mask):
+		return self._setClass(self._matrix.keysForMask(mask))
+
+	def downwardClosureForSet(self, keySet):
+		mask = self.maskForSet(keySet)
+		return self.setForMask(self._matrix.downwardClosureMask(mask))
 
 	def upwardClosureForSet(self, keySet):
-		result = self._setClass()
-		for key in keySet:
-			if key not in result:
-				result.update(self.upwardClosureFor(key))
-		return result
+		mask = self.maskForSet(keySet)
+		return self.setForMask(self._matrix.upwardClosureMask(mask))
 
 	def convexClosureForSet(self, keySet):
-		return self.downwardClosureForSet(keySet).intersection(self.upwardClosureForSet(keySet))
+		matrix = self._matrix
+		mask = self.maskForSet(keySet)
+		return self.setForMask(matrix.downwardClosureMask(mask) & matrix.upwardClosureMask(mask))
 
 	def isBelow(self, key1, key2):
-		return key1 in self.downwardClosureFor(key2)
+		node1 = self._unsorted.get(key1)
+		if node1 is None:
+			return False
+		return self._matrix.isBelow(node1.index, self.getNode(key2).index)
 
 	def isAbove(self, key1, key2):
-		return key1 in self.upwardClosureFor(key2)
+		return self.isBelow(key2, key1)
 
 	def subsetIsBelow(self, subset, key):
-		return subset.issubset(self.downwardClosureFor(key))
+		mask = self.strictMaskForSet(subset)
+		return mask is not None and not (mask & ~self._matrix.down[self.getNode(key).index])
 
 	def subsetIsAbove(self, subset, key):
-		return subset.issubset(self.upwardClosureFor(key))
+		mask = self.strictMaskForSet(subset)
+		return mask is not None and not (mask & ~self._matrix.up[self.getNode(key).index])
 
 	def maximumOf(self, subset):
 		found = self.maxima(subset)
@@ -365,11 +519,16 @@ class PartialOrder(object):
 		if len(subset) == 1:
 			return next(iter(subset))
 
+		matrix = self._matrix
+
 		# get the set of all elements y s.t. every y is above every x in subset
-		above = reduce(self._setClass.intersection, map(self.upwardClosureFor, subset))
+		above = matrix.intersectUpward(node.index for node in self.getNodesForSet(subset))
 
 		# the return the minimum, if it exists
-		return self.minimumOf(above)
+		index = matrix.minimumOfMask(above)
+		if index is None:
+			return None
+		return matrix.keys[index]
 
 	def infimum(self, subset):
 		if not subset:
@@ -377,28 +536,23 @@ class PartialOrder(object):
 		if len(subset) == 1:
 			return next(iter(subset))
 
+		matrix = self._matrix
+
 		# get the set of all elements y s.t. every y is below every x in subset
-		below = reduce(self._setClass.intersection, map(self.downwardClosureFor, subset))
+		below = matrix.intersectDownward(node.index for node in self.getNodesForSet(subset))
 
 		# the return the maximum, if it exists
-		return self.maximumOf(below)
+		index = matrix.maximumOfMask(below)
+		if index is None:
+			return None
+		return matrix.keys[index]
 
 	def minima(self, subset):
-		remaining = self.getNodesForSet(subset)
-
-		aboveClosure = self._setClass()
-
-		for node in remaining:
-			# if the node is above one of the previous minima, ignore it
-			if node.key not in aboveClosure:
-				# get the set of all elements > this node
-				nodeClosure = node.upwardClosure.copy()
-				nodeClosure.discard(node.key)
+		mask = self.maskForSet(subset)
 
-				# enlarge the upward closure of result
-				aboveClosure.update(nodeClosure)
-
-		return subset.difference(aboveClosure)
+		# drop all elements that are above some other element of subset
+		dropped = mask & ~self._matrix.minimaOfMask(mask)
+		return subset.difference(self.setForMask(dropped))
 
 	def oldMinima(self, subset):
 		remaining = self.getNodesForSet(subset)
@@ -427,21 +581,11 @@ class PartialOrder(object):
 		return self._setClass(map(lambda node: node.key, result))
 
 	def maxima(self, subset):
-		remaining = self.getNodesForSet(subset)
-
-		belowClosure = self._setClass()
+		mask = self.maskForSet(subset)
 
-		for node in remaining:
-			# if the node is below one of the previous maxima, ignore it
-			if node.key not in belowClosure:
-				# get the set of all elements < this node
-				nodeClosure = node.downwardClosure.copy()
-				nodeClosure.discard(node.key)
-
-				# enlarge the downward closure of result
-				belowClosure.update(nodeClosure)
-
-		return subset.difference(belowClosure)
+		# drop all elements that are below some other element of subset
+		dropped = mask & ~self._matrix.maximaOfMask(mask)
+		return subset.difference(self.setForMask(dropped))
 
 	def unboundedElements(self, subset):
 		result = self._setClass()
@@ -472,7 +616,7 @@ class PartialOrder(object):
 		return self.findPathWork(sourceNode, destNode, [destKey])
 
 	def findPathWork(self, sourceNode, destNode, path):
-		for lowerNeighbor in destNode.below:
+		for lowerNeighbor in destNode.lowerNeighbors:
 			if lowerNeighbor is sourceNode:
 				return [sourceNode.key] + path
 			if sourceNode <= lowerNeighbor:
@@ -689,29 +833,23 @@ class PartialOrder(object):
 		else:
 			self.height = int(larval[-1])
 
-		# Update the downward closure of each node
-		# The closure is not a set of OrderedSetMembers, but a set of keys
+		for index, ln in enumerate(larval):
+			ln.node.index = index
+
+		# Compute the upward and downward closures of all nodes as a bit matrix.
+		# The fastset closures of individual nodes are created on demand.
+		matrix = ClosureMatrix([ln.key for ln in larval],
+				[[lower.node.index for lower in ln.below] for ln in larval])
+
 		for ln in larval:
 			# copy rank from larval to node
 			ln.node.rank = ln.rank
-
-			closure = self._setClass(lower.key for lower in ln.below)
-			for lower in ln.below:
-				closure.update(lower.node.downwardClosure)
-			closure.add(ln.key)
-			ln.node.downwardClosure = closure
+			ln.node.matrix = matrix
 
 			ln.node.lowerNeighbors = list(lower.node for lower in ln.below)
 			ln.node._final = True
 
-		# Update the upward closure of each node
-		# The closure is not a set of OrderedSetMembers, but a set of keys
-		for ln in reversed(larval):
-			closure = self._setClass()
-			for upper in ln.above:
-				closure.update(upper.node.upwardClosure)
-			closure.add(ln.key)
-			ln.node.upwardClosure = closure
+		self._matrix = matrix
 
 		self._sorted = self.sortedSubset(self._unsorted.values())
 
@@ -4,6 +4,8 @@
 #
 ##################################################################
 
+import itertools
+
 from .util import debugmsg, infomsg, warnmsg, errormsg
 from .arch import *
 
@@ -31,7 +33,10 @@ class PackageCollection(object):
 		return len(self._packageDict)
 
 	def __iter__(self):
-		return iter(self.packages)
+		return self.packages
+
+	def __contains__(self, rpm):
+		return rpm in self._packages or rpm in self._sources
 
 	def rpmsWithArch(self):
 		for rpm in self:
@@ -94,9 +99,14 @@ class PackageCollection(object):
 	def builds(self):
 		return iter(self._builds)
 
+	# Iterate over binary and source packages without building their union.
+	# An rpm that is in both sets is returned only once.
 	@property
 	def packages(self):
-		return iter(self._packages.union(self._sources))
+		if not self._sources:
+			return iter(self._packages)
+		return itertools.chain(self._packages,
+				(rpm for rpm in self._sources if rpm not in self._packages))
 
 	# set operations
 	def update(self, other):
@@ -265,6 +265,71 @@ class ParallelStringMatcher:
 		self.fullmatchTable.fnmatchLookup(string, res)
 		return list(res)
 
+##################################################################
+# An index of fnmatch patterns that returns exactly the same result
+# as calling fnmatch.fnmatchcase() for every pattern in turn.
+# Literal patterns, as well as "prefix*" and "*suffix" patterns are
+# looked up in dicts; everything else falls back to fnmatch.
+##################################################################
+class FnmatchIndex:
+	SPECIAL = set('*?[')
+
+	def __init__(self):
+		self.literals = {}
+		self.prefixes = {}
+		self.suffixes = {}
+		self.others = []
+
+		self._prefixLengths = []
+		self._suffixLengths = []
+
+	def add(self, pattern, value):
+		special = [i for i, cc in enumerate(pattern) if cc in self.SPECIAL]
+
+		if not special:
+			self.literals.setdefault(pattern, []).append(value)
+		elif special == [len(pattern) - 1] and pattern.endswith('*'):
+			self.addKey(self.prefixes, self._prefixLengths, pattern[:-1], value)
+		elif special == [0] and pattern.startswith('*'):
+			self.addKey(self.suffixes, self._suffixLengths, pattern[1:], value)
+		else:
+			self.others.append((pattern, value))
+
+	@staticmethod
+	def addKey(table, lengths, key, value):
+		values = table.get(key)
+		if values is None:
+			values = []
+			table[key] = values
+			if len(key) not in lengths:
+				lengths.append(len(key))
+				lengths.sort()
+		values.append(value)
+
+	def match(self, string):
+		result = list(self.literals.get(string, ()))
+
+		size = len(string)
+		for n in self._prefixLengths:
+			if n > size:
+				break
+			values = self.prefixes.get(string[:n])
+			if values:
+				result += values
+
+		for n in self._suffixLengths:
+			if n > size:
+				break
+			values = self.suffixes.get(string[size - n:])
+			if values:
+				result += values
+
+		for pattern, value in self.others:
+			if fnmatch.fnmatchcase(string, pattern):
+				result.append(value)
+
+		return result
+
 def selfTest():
 	from functools import reduce
 
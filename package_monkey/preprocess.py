@@ -14,6 +14,7 @@
 import solv
 import os
 import re
+import array
 import functools
 
 from .util import debugmsg, infomsg, warnmsg, errormsg, loggingFacade
@@ -95,13 +96,22 @@ class RpmWrapper(RpmBase):
 		return major
 
 
+# The factory creates RpmWrapper objects lazily. When adding a repository,
+# we just record the ids and names of its solvables in two compact arrays;
+# the wrapper for a solvable is only created when somebody actually looks
+# at the rpm.
 class RpmFactory(object):
-	def __init__(self, buildArch):
+	def __init__(self, buildArch, pool = None):
 		self.buildArch = buildArch
+		self.pool = pool
 		self._nameToRpm = {}
 		self._shortNameToRpm = {}
 		self._idToRpm = {}
 
+		self.solvableIds = array.array('i')
+		self.solvableNames = []
+		self._lazyNameToId = {}
+
 		self._byType = {}
 		for type in RpmBase.VALID_TYPES:
 			self._byType[type] = set()
@@ -138,18 +148,55 @@ class RpmFactory(object):
 				raise Exception(f"{rpm}: cannot change type from {rpm.type} to {type}")
 			return rpm
 
-		if solvable.name.startswith('pattern:') or solvable.name.startswith('product:'):
+		if self.isMetaPackageName(solvable.name):
 			assert(type is None)
 			type = RpmWrapper.TYPE_METAPKG
 
 		return self.newRpm(solvable.name, solvable.arch, self.buildArch, solvable = solvable, type = type)
 
+	def registerSolvable(self, solvable):
+		self.solvableIds.append(solvable.id)
+		self.solvableNames.append(solvable.name)
+
+		# With stagings, there may be several solvables by the same name.
+		# As before, the one that was added last wins.
+		self._lazyNameToId[solvable.name] = solvable.id
+
+	# A synthetic solvable that shadows a regular package
+	def forgetRegisteredName(self, name):
+		self._lazyNameToId.pop(name, None)
+
+	def getById(self, id):
+		rpm = self._idToRpm.get(id)
+		if rpm is None:
+			rpm = self.createFromSolvable(self.pool.id2solvable(id))
+		return rpm
+
+	@staticmethod
+	def isMetaPackageName(name):
+		return name.startswith('pattern:') or name.startswith('product:')
+
 	def getByName(self, name):
 		rpm = self._nameToRpm.get(name)
 		if rpm is None:
-			rpm = self._shortNameToRpm.get(name)
+			id = self._lazyNameToId.get(name)
+			if id is not None:
+				rpm = self.getById(id)
+			else:
+				rpm = self._shortNameToRpm.get(name)
+
+		# name may also be of the form shortname.arch
+		if rpm is None and '.' in name:
+			id = self._lazyNameToId.get(name.rsplit('.', 1)[0])
+			if id is not None and id not in self._idToRpm:
+				other = self.getById(id)
+				if other.name == name:
+					rpm = other
 		return rpm
 
+	def getAllRegistered(self):
+		return list(map(self.getById, self.solvableIds))
+
 	def createDummyRpm(self, name, type):
 		rpm = self.getByName(name)
 		if rpm is None:
@@ -159,7 +206,13 @@ class RpmFactory(object):
 
 		return rpm
 
-	def getAllByType(self, type):
+	# If a nameFilter is given, the caller is only interested in rpms whose
+	# name passes the filter; there's no need to create wrappers for the others.
+	def getAllByType(self, type, nameFilter = None):
+		if type in (RpmBase.TYPE_REGULAR, RpmBase.TYPE_METAPKG):
+			for id, name in zip(self.solvableIds, self.solvableNames):
+				if id not in self._idToRpm and (nameFilter is None or nameFilter(name)):
+					self.getById(id)
 		return self._byType[type]
 
 class ArchSolver(object):
@@ -173,7 +226,9 @@ class ArchSolver(object):
 		self.pedantic = False
 		self.traceDisambiguation = False
 
-		self.rpmFactory = RpmFactory(self.arch)
+		self.rpmFactory = RpmFactory(self.arch, self.pool)
+
+		# rpms created on the fly, like synthetic or missing packages
 		self._rpms = []
 
 		if traceMatcher:
@@ -194,7 +249,18 @@ class ArchSolver(object):
 		self.resolvedRpms = []
 		self.unresolvableRpms = []
 
-		self.queue = []
+		# the ids of all solvables we're supposed to resolve
+		self.queue = self.rpmFactory.solvableIds
+
+		# Allow the solver to be run several times on the same pool
+		self._hintsApplied = False
+		self._abiCheckedCount = 0
+
+		# conditional dependencies, compiled against this pool
+		self._conditionalCache = MemoCache(f"{arch} conditional dependency cache")
+
+		# the same sets of alternatives show up over and over again
+		self._alternativesCache = MemoCache(f"{arch} alternatives cache")
 
 	def addRepository(self, repository):
 		repo = self.pool.add_repo(repository.projectName)
@@ -222,9 +288,7 @@ class ArchSolver(object):
 			if self.hints and self.hints.ignorePackageName(solvable.name):
 				continue
 
-			rpm = self.solvableToRpm(solvable)
-			self._rpms.append(rpm)
-			self.queue.append(rpm)
+			self.rpmFactory.registerSolvable(solvable)
 
 	# We must apply the resolver hints after adding all repos.
 	def applyHints(self):
@@ -313,6 +377,7 @@ class ArchSolver(object):
 		solvable.add_deparray(solv.SOLVABLE_PROVIDES, dep)
 
 		# create the rpm and override the type
+		self.rpmFactory.forgetRegisteredName(name)
 		rpm = self.solvableToRpm(solvable, type)
 		assert(type is None or type == rpm.type)
 
@@ -337,14 +402,32 @@ class ArchSolver(object):
 	def createScenarioRpm(self, name):
 		return self.createDummyRpm(name, RpmWrapper.TYPE_SCENARIO)
 
+	# Forget the results of a previous call to solve()
+	def resetResults(self):
+		self._resolvedDependencies = []
+		self.resolvedRpms = []
+		self.unresolvableRpms = []
+
 	# solve some or all rpms in a set of repositories.
+	# This can be called more than once; eg the patch step reuses the pool
+	# of the main solve, adding a few dummy solvables for ghost rpms.
 	def solve(self, progressMeter, rpms = None, db = None, **kwargs):
-		self.applyHints()
+		if not self._hintsApplied:
+			self.applyHints()
+			self._hintsApplied = True
+		else:
+			# pick up any dummy solvables created since the last run
+			self._dummyRepo.internalize()
+
 		self.pool.addfileprovides()
 		self.pool.createwhatprovides()
 
+		# what's provided may have changed since the last run
+		self._conditionalCache.clear()
+		self._alternativesCache.clear()
+
 		if rpms is None:
-			rpms = self._rpms
+			rpms = self.rpmFactory.getAllRegistered() + self._rpms
 
 		if db is not None:
 			for rpm in rpms:
@@ -361,11 +444,13 @@ class ArchSolver(object):
 		# we need to check all RPMs for ABI providers, not just those that we
 		# want to resolve.
 		infomsg(f"Looking for ABI providers")
-		for rpm in self._rpms:
-			if rpm.isSynthetic:
+		solvableNames = self.rpmFactory.solvableNames
+		for name in solvableNames[self._abiCheckedCount:]:
+			if RpmFactory.isMetaPackageName(name):
 				continue
 
-			self.detectAbiProviders(rpm)
+			self.detectAbiProviders(name)
+		self._abiCheckedCount = len(solvableNames)
 
 		if self.rpmFactory.traceMatcher is not None:
 			prefer = []
@@ -396,6 +481,10 @@ class ArchSolver(object):
 		else:
 			infomsg(f"Resolved all {totalCount} rpms")
 
+		self._conditionalCache.report()
+		self._alternativesCache.report()
+		BooleanDependency.reportCacheStatistics()
+
 	# try to resolve one RPM on one architecture
 	def tryToSolveRpm(self, rpm):
 		result = self.resolveAndDetectAmbiguities(rpm)
@@ -426,10 +515,10 @@ class ArchSolver(object):
 		if self.resolverLog is not None:
 			self.resolverLog.logResolvedPackage(resolved)
 
-	def detectAbiProviders(self, rpm):
-		sel = self.pool.select(rpm.shortname, solv.Selection.SELECTION_NAME)
+	def detectAbiProviders(self, name):
+		sel = self.pool.select(name, solv.Selection.SELECTION_NAME)
 		if sel.isempty():
-			infomsg(f"Error: {rpm} not found")
+			infomsg(f"Error: {name} not found")
 			return None
 
 		for solvable in self.disambiguateStaging(sel.solvables()):
@@ -624,13 +713,11 @@ class ArchSolver(object):
 			return None
 
 		try:
-			node = BooleanDependency.parse(depString, self.dependencyOracle)
+			node, implications = self._conditionalCache.lookup(depString, self.compileConditional)
 		except Exception as e:
 			errormsg(f"{rpm}: could not parse conditional dependency \"{depString}\" (exception {e})")
 			return None
 
-		implications = list(node.implications())
-
 		if rpm.trace:
 			infomsg(f"      compiled as {node}")
 			if len(implications) == 1 and str(implications[0]) == str(node):
@@ -644,6 +731,10 @@ class ArchSolver(object):
 
 		return implications
 
+	def compileConditional(self, depString):
+		node = BooleanDependency.parse(depString, self.dependencyOracle)
+		return node, list(node.implications())
+
 	def dependencyToSelection(self, rpm, dep):
 		# transform the dependency string if there is a rule for it
 		newString = self.hints.transformDependency(str(dep), rpm.shortname)
@@ -993,7 +1084,25 @@ class ArchSolver(object):
 		# libfoo.so.0, libsolv will return both libfoo0 and foo-devel. We can
 		# usually catch these easily because foo-devel will also require libfoo0...
 
-		return self.hints.filterChoices(choices)
+		# Do not memoize if we're tracing any of these rpms; we want to
+		# see the transforms being applied.
+		if any(rpm.trace for rpm in choices):
+			return self.hints.filterChoices(choices)
+
+		# With stagings, several solvables may share the same name, and each
+		# of them gets its own wrapper. The transforms compare wrappers by
+		# identity, so the wrappers themselves need to be the key.
+		key = frozenset(choices)
+		result = self._alternativesCache.lookup(key, self.filterAlternativesWorker, choices)
+		if result is None:
+			return None
+		return set(result)
+
+	def filterAlternativesWorker(self, key, choices):
+		result = self.hints.filterChoices(choices)
+		if result is None:
+			return None
+		return frozenset(result)
 
 	class ScenarioDisambiguation(object):
 		def __init__(self, scenario):
@@ -1630,7 +1739,16 @@ class PreprocessorHints(object):
 		def rebind(self, rpmFactory):
 			pass
 
+		def triggerNames(self):
+			return []
+
+		def triggerPattern(self):
+			return None
+
 	class MiniRpmTransform(HeuristicTransform):
+		def triggerPattern(self):
+			return '.*-mini.*'
+
 		def __call__(self, selection):
 			drop = []
 			for rpm in selection.rpms:
@@ -1647,6 +1765,9 @@ class PreprocessorHints(object):
 				selection.difference_update(drop)
 
 	class StripSuffixTransform(HeuristicTransform):
+		def triggerPattern(self):
+			return '.*' + re.escape(self.SUFFIX)
+
 		def __call__(self, selection):
 			drop = []
 			for rpm in selection.rpms:
@@ -1690,12 +1811,21 @@ class PreprocessorHints(object):
 		def __str__(self):
 			return f"AmbiguityTransform([{' '.join(self.srcNameList)}] -> [{' '.join(self.dstNameList)}])"
 
+		def triggerNames(self):
+			return self.srcNameList
+
+		def triggerPattern(self):
+			return None
+
 		def __call__(self, selection):
 			if self.valid and self.srcRpms.issubset(selection.rpms):
 				selection.difference_update(self.srcRpms)
 				selection.update(self.dstRpms)
 
 	class StripPrefixTransform(HeuristicTransform):
+		def triggerPattern(self):
+			return re.escape(self.PREFIX) + '.*'
+
 		def __call__(self, selection):
 			drop = []
 			for rpm in selection.rpms:
@@ -1726,6 +1856,12 @@ class PreprocessorHints(object):
 		def __str__(self):
 			return f"AlwaysPreferTransform()"
 
+		def triggerNames(self):
+			return self.nameList
+
+		def triggerPattern(self):
+			return None
+
 		def __call__(self, selection):
 			common = self.rpms.intersection(selection.rpms)
 			if common:
@@ -1784,6 +1920,12 @@ class PreprocessorHints(object):
 				else:
 					self.alternativeExpansions.append(pattern)
 
+		def triggerNames(self):
+			return []
+
+		def triggerPattern(self):
+			return self.preferredName
+
 		def process(self, selection):
 			for rpm in sorted(selection.rpms, key = lambda r: len(r.shortname)):
 				if rpm not in selection.rpms:
@@ -1807,6 +1949,12 @@ class PreprocessorHints(object):
 			super().__init__(preferredName, alternativeNames)
 			self.alternativePatterns = list(map(re.compile, alternativeNames))
 
+		def triggerNames(self):
+			return [self.preferredName]
+
+		def triggerPattern(self):
+			return None
+
 		def process(self, selection):
 			preferredRpm = selection.nameToRpm(self.preferredName)
 			if preferredRpm is None:
@@ -1827,6 +1975,12 @@ class PreprocessorHints(object):
 		def __str__(self):
 			return f"WildcardAmbiguityTransform({self.select})"
 
+		def triggerNames(self):
+			return self.select.triggerNames()
+
+		def triggerPattern(self):
+			return self.select.triggerPattern()
+
 		def __call__(self, selection):
 			if len(selection.rpms) > 1:
 				self.select.process(selection)
@@ -1847,6 +2001,84 @@ class PreprocessorHints(object):
 
 			return klass(select)
 
+	# Rather than running each set of alternatives through all ambiguity
+	# transforms, we index the transforms by the package names that can
+	# possibly trigger them. Transforms that are triggered by a pattern rather
+	# than a literal name (like the heuristics, or wildcard preferences) are
+	# folded into a single regex alternation, so that most names can be
+	# rejected with just one match.
+	# Transforms are still applied in the order in which they were defined.
+	class CompiledTransforms(object):
+		def __init__(self, transforms, ignoreNames):
+			self.transforms = transforms
+			self.ignoreNames = frozenset(ignoreNames)
+			self.nameIndex = {}
+			self.patterns = []
+			self.combinedPattern = None
+			self._triggerCache = {}
+
+			for index, transform in enumerate(transforms):
+				if transform is None:
+					continue
+
+				for name in transform.triggerNames():
+					indexList = self.nameIndex.get(name)
+					if indexList is None:
+						indexList = []
+						self.nameIndex[name] = indexList
+					indexList.append(index)
+
+				pattern = transform.triggerPattern()
+				if pattern is not None:
+					self.patterns.append((index, re.compile(pattern)))
+
+			if self.patterns:
+				combined = '|'.join(f"(?:{regex.pattern})" for index, regex in self.patterns)
+				try:
+					self.combinedPattern = re.compile(combined)
+				except re.error:
+					# this can happen if a pattern uses backreferences
+					pass
+
+		def triggersForName(self, name):
+			triggers = self._triggerCache.get(name)
+			if triggers is None:
+				triggers = set(self.nameIndex.get(name, []))
+				if self.patterns and \
+				   (self.combinedPattern is None or self.combinedPattern.fullmatch(name)):
+					for index, regex in self.patterns:
+						if regex.fullmatch(name):
+							triggers.add(index)
+				triggers = frozenset(triggers)
+				self._triggerCache[name] = triggers
+			return triggers
+
+		def triggersForNames(self, names):
+			result = set()
+			for name in names:
+				result.update(self.triggersForName(name))
+			return result
+
+		def apply(self, selection):
+			pending = self.triggersForNames(selection.nameDict.keys())
+			while pending:
+				index = min(pending)
+				pending.remove(index)
+
+				transform = self.transforms[index]
+				namesBefore = selection.names
+				transform(selection)
+				if not selection:
+					raise Exception(f"transform {transform} reduces selection to empty set")
+
+				# A transform may add rpms to the selection, which in turn may
+				# trigger transforms further down the list.
+				addedNames = selection.names.difference(namesBefore)
+				if addedNames:
+					for other in self.triggersForNames(addedNames):
+						if other > index:
+							pending.add(other)
+
 	class PreTransform(object):
 		def __init__(self, srcName, dstName, context = None):
 			self.srcName = srcName
@@ -1884,12 +2116,20 @@ class PreprocessorHints(object):
 		self._newScenarioManager = NewScenarioManager()
 		self._nowarnRequired = self.NoWarnRequired()
 		self._alwaysPreferTransform = None
+		self._compiledTransforms = None
+
+	@property
+	def compiledTransforms(self):
+		if self._compiledTransforms is None:
+			self._compiledTransforms = self.CompiledTransforms(self.ambiguityTransforms, self.ignoreNames)
+		return self._compiledTransforms
 
 	def addKnownMissing(self, names):
 		self.knownMissingNames += names
 
 	def addIgnoredDependencies(self, names):
 		self.ignoreNames += list(names)
+		self._compiledTransforms = None
 
 	def addIgnoredRpm(self, pattern):
 		self._nameFilter.addRpmPattern(pattern)
@@ -1927,7 +2167,8 @@ class PreprocessorHints(object):
 #		for abstractPackage in self.abstractScenarios:
 #			abstractPackage.rebind(rpmFactory)
 
-		allRpms = rpmFactory.getAllByType(RpmWrapper.TYPE_REGULAR)
+		allRpms = rpmFactory.getAllByType(RpmWrapper.TYPE_REGULAR,
+					nameFilter = self._newScenarioManager.mayControlName)
 		self._newScenarioManager.rebind(allRpms)
 
 	def addPreferredNames(self, args):
@@ -1935,6 +2176,7 @@ class PreprocessorHints(object):
 		if self._alwaysPreferTransform is None:
 			self._alwaysPreferTransform = self.AlwaysPreferTransform(self.preferredNames)
 			self.ambiguityTransforms.insert(0, self._alwaysPreferTransform)
+		self._compiledTransforms = None
 
 	def addConditional(self, name, value):
 		pass
@@ -1991,8 +2233,10 @@ class PreprocessorHints(object):
 
 	def defineAmbiguityTransform(self, srcNames, dstNames):
 		self.ambiguityTransforms.append(self.AmbiguityTransform(srcNames, dstNames))
+		self._compiledTransforms = None
 
 	def enableHeuristics(self, *args):
+		self._compiledTransforms = None
 		for name in args:
 			if name == 'ignore-mini-packages':
 				self.ambiguityTransforms.append(self.MiniRpmTransform(name))
@@ -2023,6 +2267,7 @@ class PreprocessorHints(object):
 		#	this will prefer perl over any perl-Foobar module
 		transform = self.WildcardPreferTransform.factory(preferredNames, alternativeNames)
 		self.ambiguityTransforms.append(transform)
+		self._compiledTransforms = None
 
 	class RpmSelection(object):
 		def __init__(self, rpms):
@@ -2083,7 +2328,9 @@ class PreprocessorHints(object):
 		selection = self.RpmSelection(choices)
 
 		debugSolver(f"filterChoices {selection}")
-		namesToDrop = selection.names.intersection(self.ignoreNames)
+		compiled = self.compiledTransforms
+
+		namesToDrop = compiled.ignoreNames.intersection(selection.nameDict.keys())
 		if namesToDrop:
 			rpmsToDrop = set(rpm for rpm in selection.rpms if rpm.shortname in namesToDrop)
 			selection.difference_update(rpmsToDrop)
@@ -2092,11 +2339,7 @@ class PreprocessorHints(object):
 			errormsg(f"All names in selection ignored - not good")
 			return None
 
-		for transform in self.ambiguityTransforms:
-			transform(selection)
-			if not selection:
-				raise Exception(f"transform {transform} reduces selection to empty set")
-
+		compiled.apply(selection)
 		return selection.rpms
 
 	def hasScenarioVariable(self, *args, **kwargs):
@@ -23,10 +23,14 @@ class LocationIndexedReport(object):
 		else:
 			self._messages.append(location.key + (message, ))
 
+	@property
+	def messages(self):
+		return sorted(self._messages)
+
 	def render(self):
 		lastName = None
 
-		for name, seq, msg in sorted(self._messages):
+		for name, seq, msg in self.messages:
 			if name != lastName:
 				infomsg(f"{name}:")
 				lastName = name
@@ -21,23 +21,94 @@
 
 from .util import infomsg, errormsg
 import functools
+import re
 
-__names__ = ['BooleanDependency']
+__names__ = ['BooleanDependency', 'MemoCache']
+
+##################################################################
+# Simple memoization with hit/miss counters.
+# Exceptions raised while computing a value are cached as well.
+##################################################################
+class MemoCache(object):
+	def __init__(self, name):
+		self.name = name
+		self._cache = {}
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self._cache)
+
+	def lookup(self, key, compute, *args):
+		try:
+			value, exception = self._cache[key]
+			self.hits += 1
+		except KeyError:
+			self.misses += 1
+			value = exception = None
+			try:
+				value = compute(key, *args)
+			except Exception as e:
+				exception = e
+			self._cache[key] = (value, exception)
+
+		if exception is not None:
+			raise exception
+		return value
+
+	def clear(self):
+		self._cache = {}
+
+	@property
+	def hitRate(self):
+		total = self.hits + self.misses
+		if total == 0:
+			return 0
+		return 100.0 * self.hits / total
+
+	def report(self):
+		infomsg(f"{self.name}: {len(self._cache)} entries, {self.hits} hits, {self.misses} misses ({self.hitRate:.1f}% hit rate)")
 
 class BooleanDependency(object):
+	# The same rich dependencies show up over and over again, across
+	# architectures and rpms, so we parse each of them only once.
+	# The parse trees are immutable tuples, and are shared by everyone.
+	parseTreeCache = MemoCache("boolean dependency parse cache")
+	compiledCache = MemoCache("compiled dependency parse cache")
+
 	@classmethod
 	def parse(klass, string, oracle):
-		parser = DependencyParser(string, oracle)
+		tree = klass.parseTree(string)
+		return DependencyParser.buildNode(tree, oracle)
+
+	@classmethod
+	def parseTree(klass, string):
+		return klass.parseTreeCache.lookup(string, klass._parseTree)
+
+	@staticmethod
+	def _parseTree(string):
+		parser = DependencyParser(string)
 		return parser.process()
 
+	# Note that the nodes returned are shared, so callers must not modify them.
 	@classmethod
 	def parseCompiled(klass, string):
+		return klass.compiledCache.lookup(string, klass._parseCompiled)
+
+	@staticmethod
+	def _parseCompiled(string):
 		parser = NodeParser(string)
 		node = parser.parse()
 		if not parser.complete():
 			raise Exception(f"parser did not consume entire string; remainder \"{parser.lexer.remainder}\"")
 		return node
 
+	@classmethod
+	def reportCacheStatistics(klass):
+		for cache in (klass.parseTreeCache, klass.compiledCache):
+			if cache.hits or cache.misses:
+				cache.report()
+
 ##################################################################
 # Assertions represent a specific combination of included/excluded
 # packages, resulting in a requirement
@@ -397,29 +468,17 @@ class NodeParser(object):
 		IDENTIFIER	= 'IDENTIFIER'
 		PUNCT		= 'PUNCT'
 
+		TOKEN_RE = re.compile(r'\s*(?:(?P<identifier>\w[\w.+\-:]*)|(?P<punct>\S))')
+
 		def __init__(self, string):
-			self.value = list(string)
+			self.value = string
 			self.pos = 0
 
 			self._saved = None
 
-		def getc(self):
-			try:
-				cc = self.value[self.pos]
-			except:
-				return None
-
-			self.pos += 1
-			return cc
-
-		def ungetc(self, cc):
-			assert(self.pos > 0)
-			assert(self.value[self.pos - 1] == cc)
-			self.pos -= 1
-
 		@property
 		def remainder(self):
-			return ''.join(self.value[self.pos:])
+			return self.value[self.pos:]
 
 		def next(self):
 			if self._saved is not None:
@@ -432,25 +491,17 @@ class NodeParser(object):
 			return token, value
 
 		def _next(self):
-			result = []
-			cc = self.getc()
-			while cc and cc.isspace():
-				cc = self.getc()
-
-			if not cc:
+			m = self.TOKEN_RE.match(self.value, self.pos)
+			if m is None:
+				self.pos = len(self.value)
 				return (self.EOL, None)
 
-			if cc.isalnum() or cc == '_':
-				while cc and (cc.isalnum() or cc in "_.+-:"):
-					result.append(cc)
-					cc = self.getc()
-				if cc is not None:
-					self.ungetc(cc)
-				token = self.IDENTIFIER
-			else:
-				result.append(cc)
-				token = self.PUNCT
-			return token, ''.join(result)
+			self.pos = m.end()
+
+			value = m.group('identifier')
+			if value is not None:
+				return (self.IDENTIFIER, value)
+			return (self.PUNCT, m.group('punct'))
 
 		def pushback(self, token, value):
 			assert(self._saved is None)
@@ -542,9 +593,6 @@ class DependencyParser(object):
 		OPERATOR = 3
 		IDENTIFIER = 4
 
-		CHARCLASS_OPERATOR = ('<', '>', '=', '!')
-		CHARCLASS_WORDBREAK = CHARCLASS_OPERATOR
-
 		OPERATOR_IDENTIFIERS = ('EQ', 'NE', 'LT', 'GT', 'LE', 'GE')
 		OPERATOR_TABLE = {
 			'=':  '=',
@@ -557,80 +605,61 @@ class DependencyParser(object):
 		}
 
 
+		# An identifier is a sequence of characters other than white space,
+		# operators and brackets. It may contain bracketed arguments, as in
+		# perl(Foo::Bar), which must not be nested.
+		TOKEN_RE = re.compile(r"""\s*(?:
+				(?P<operator>[<>=!]+)|
+				(?P<leftb>\()|
+				(?P<rightb>\))|
+				(?P<identifier>(?:[^\s<>=!()]|\([^\s<>=!()]*\))+(?:\([^\s<>=!()]*)?)
+			)""", re.VERBOSE)
+
 		def __init__(self, string):
-			self.value = list(string)
+			self.value = string
 			self.pos = 0
 
 		def __str__(self):
-			return "".join(self.value)
-
-		def getc(self):
-			try:
-				cc = self.value[self.pos]
-			except:
-				return None
-
-			self.pos += 1
-			return cc
-
-		def ungetc(self, cc):
-			assert(self.pos > 0)
-			assert(self.value[self.pos - 1] == cc)
-			self.pos -= 1
+			return self.value
 
 		def next(self):
-			result = ""
-			while True:
-				cc = self.getc()
-				if cc is None:
-					break
+			m = self.TOKEN_RE.match(self.value, self.pos)
+			if m is None:
+				self.pos = len(self.value)
+				return (self.EOL, "")
 
-				while cc and cc.isspace():
-					cc = self.getc()
-
-				if cc in self.CHARCLASS_OPERATOR:
-					while cc in self.CHARCLASS_OPERATOR:
-						result += cc
-						cc = self.getc()
-					# translate operator "<=" to "LE" and so on
-					result = self.OPERATOR_TABLE[result]
-					return (self.OPERATOR, result)
-
-				if cc == '(':
-					return (self.LEFTB, cc)
-				if cc == ')':
-					return (self.RIGHTB, cc)
-
-				processingBracketedArgument = False
-				while cc and not cc.isspace() and not cc in self.CHARCLASS_WORDBREAK:
-					if cc == '(':
-						if processingBracketedArgument:
-							raise Exception("Dependency parser: nested brackets not allowed inside Identifier")
-						processingBracketedArgument = True
-					elif cc == ')':
-						if not processingBracketedArgument:
-							break
-						processingBracketedArgument = False
-
-					result += cc
-					cc = self.getc()
-
-				if cc:
-					self.ungetc(cc)
-
-				if not result:
-					break
+			self.pos = m.end()
 
-				if result in self.OPERATOR_IDENTIFIERS:
-					return (self.OPERATOR, result)
+			kind = m.lastgroup
+			value = m.group(kind)
+			if kind == 'operator':
+				# translate operator "==" to "=" and so on
+				return (self.OPERATOR, self.OPERATOR_TABLE[value])
+			if kind == 'leftb':
+				return (self.LEFTB, value)
+			if kind == 'rightb':
+				return (self.RIGHTB, value)
 
-				return (self.IDENTIFIER, result)
+			if value.count('(') > value.count(')') and self.value.startswith('(', self.pos):
+				raise Exception("Dependency parser: nested brackets not allowed inside Identifier")
 
-			return (self.EOL, result)
+			if value in self.OPERATOR_IDENTIFIERS:
+				return (self.OPERATOR, value)
+
+			return (self.IDENTIFIER, value)
 
 		def symbolicToStringOperator(self, op):
 			return self.OPERATOR_TABLE[op]
 
+	# The parser produces a tree of tuples, which does not depend on the
+	# oracle and can therefore be cached. buildNode() then transforms this
+	# tree into Nodes, using the oracle to resolve the individual requirements.
+	TREE_REQUIRES	= 'requires'
+	TREE_OR		= 'or'
+	TREE_AND	= 'and'
+	TREE_NOT	= 'not'
+	TREE_IF		= 'if'
+
 	class ProcessedExpression(object):
 		pass
 
@@ -650,24 +679,44 @@ class DependencyParser(object):
 
 	class OrExpression(AssociativeExpression):
 		def build(self):
-			return OrNode(self.children)
+			return (DependencyParser.TREE_OR, tuple(self.children))
 
 	class AndExpression(AssociativeExpression):
 		def build(self):
-			return AndNode(self.children)
+			return (DependencyParser.TREE_AND, tuple(self.children))
 
 	class WithExpression(AssociativeExpression):
 		def build(self):
-			condition = AndNode(self.children[1:])
-			return ConditionalNode(condition, self.children[0])
+			condition = (DependencyParser.TREE_AND, tuple(self.children[1:]))
+			return (DependencyParser.TREE_IF, condition, self.children[0], None)
 
 	class WithoutExpression(AssociativeExpression):
 		def build(self):
-			condition = AndNode(self.children[1:])
-			return ConditionalNode(NotNode(condition), self.children[0])
+			condition = (DependencyParser.TREE_AND, tuple(self.children[1:]))
+			return (DependencyParser.TREE_IF, (DependencyParser.TREE_NOT, condition), self.children[0], None)
 
-	def buildSingleton(self, name, flags = None, version = None):
-		if self.oracle.isMacroInvocation(name):
+	@classmethod
+	def buildNode(klass, tree, oracle):
+		kind = tree[0]
+		if kind == klass.TREE_REQUIRES:
+			return klass.buildSingleton(oracle, *tree[1:])
+		if kind == klass.TREE_OR:
+			return OrNode(list(klass.buildNode(child, oracle) for child in tree[1]))
+		if kind == klass.TREE_AND:
+			return AndNode(list(klass.buildNode(child, oracle) for child in tree[1]))
+		if kind == klass.TREE_NOT:
+			return NotNode(klass.buildNode(tree[1], oracle))
+		if kind == klass.TREE_IF:
+			condTerm, thenTerm, elseTerm = tree[1:]
+			if elseTerm is not None:
+				elseTerm = klass.buildNode(elseTerm, oracle)
+			return ConditionalNode(klass.buildNode(condTerm, oracle), klass.buildNode(thenTerm, oracle), elseTerm)
+
+		raise Exception(f"Unexpected parse tree element {kind}")
+
+	@staticmethod
+	def buildSingleton(oracle, name, flags = None, version = None):
+		if oracle.isMacroInvocation(name):
 			node = FunctionCallNode(name)
 			if flags:
 				op = ComparisonNode.OPERAND[flags]
@@ -675,19 +724,18 @@ class DependencyParser(object):
 			return node
 
 		if flags:
-			choices = self.oracle.whatprovides(name, flags, version)
+			choices = oracle.whatprovides(name, flags, version)
 		else:
-			choices = self.oracle.whatprovides(name)
+			choices = oracle.whatprovides(name)
 
 		choices = list(s.name for s in choices)
 		if not choices:
 			return FailingNode()
 		return RequirementNode(choices)
 
-	def __init__(self, string, oracle):
+	def __init__(self, string):
 		self.lex = self.Lexer(string)
 		self.lookahead = None
-		self.oracle = oracle
 
 	def __str__(self):
 		return str(self.lex)
@@ -745,9 +793,9 @@ class DependencyParser(object):
 					elseTerm = self.process(endToken)
 
 				if operator == "unless":
-					condTerm = NotNode(condTerm)
+					condTerm = (self.TREE_NOT, condTerm)
 
-				return ConditionalNode(condTerm, thenTerm, elseTerm)
+				return (self.TREE_IF, condTerm, thenTerm, elseTerm)
 
 			groupClass = None
 			if type == self.Lexer.IDENTIFIER:
@@ -784,7 +832,7 @@ class DependencyParser(object):
 				if type != self.Lexer.IDENTIFIER:
 					raise self.BadExpression()
 
-				args = [value]
+				args = [self.TREE_REQUIRES, value]
 
 				type, value = self.nextToken()
 				if type == self.Lexer.OPERATOR:
@@ -798,7 +846,7 @@ class DependencyParser(object):
 				else:
 					self.pushBackToken(type, value)
 
-				term = self.buildSingleton(*args)
+				term = tuple(args)
 
 			if leftTerm:
 				leftTerm.add(term)
@@ -182,6 +182,8 @@ class NewScenarioManager(object):
 		self._byRpm = {}
 
 		self._patterns = []
+		self._prefixIndex = None
+		self._prefixLengths = None
 
 		self._variables = {}
 
@@ -223,6 +225,7 @@ class NewScenarioManager(object):
 	def addConcreteScenarioPattern(self, variable, abstractPackage, pattern):
 		regex = re.compile(pattern)
 		self._patterns.append((regex, variable, abstractPackage))
+		self._prefixIndex = None
 
 	def rebind(self, rpms):
 		for concreteScenario in self._byId.values():
@@ -239,8 +242,68 @@ class NewScenarioManager(object):
 
 		self.applyScenarioFallbacks()
 
+	# Rather than trying each scenario pattern in turn, we index the patterns
+	# by their literal prefix (eg "postgresql" for "postgresql([0-9._]+|[a-z_]*)-devel$").
+	# For a given rpm name, we then only need to try those patterns whose prefix
+	# matches the beginning of the name. Most rpm names do not match any
+	# prefix, and are rejected with a few dict lookups.
+	# (Folding all patterns into one big alternation does not help; python's
+	# re module simply tries each alternative in turn.)
+	REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+	@classmethod
+	def literalPrefix(klass, pattern):
+		prefix = ''
+		for i, c in enumerate(pattern):
+			if c in klass.REGEX_SPECIAL:
+				# in "ab*" or "ab?", the b is optional
+				if c in '*?{' and prefix:
+					prefix = prefix[:-1]
+				break
+			prefix += c
+		return prefix
+
+	def compilePatterns(self):
+		self._prefixIndex = {}
+		for index, (regex, variable, abstractPackage) in enumerate(self._patterns):
+			prefix = self.literalPrefix(regex.pattern)
+			indexList = self._prefixIndex.get(prefix)
+			if indexList is None:
+				indexList = []
+				self._prefixIndex[prefix] = indexList
+			indexList.append(index)
+
+		self._prefixLengths = sorted(set(map(len, self._prefixIndex.keys())))
+
+	def candidatePatterns(self, name):
+		if self._prefixIndex is None:
+			self.compilePatterns()
+
+		result = []
+		for length in self._prefixLengths:
+			if length > len(name):
+				break
+			indexList = self._prefixIndex.get(name[:length])
+			if indexList is not None:
+				result += indexList
+
+		# preserve the order in which the patterns were defined
+		if len(result) > 1:
+			result.sort()
+		return result
+
+	# Returns True if the rpm by this name may be controlled by a scenario.
+	# This is used to avoid looking at rpms that are of no interest to us.
+	def mayControlName(self, name):
+		if name in self._byRpm:
+			return True
+
+		patterns = self._patterns
+		return any(patterns[index][0].fullmatch(name) for index in self.candidatePatterns(name))
+
 	def matchPattern(self, name):
-		for regex, variable, abstractPackage in self._patterns:
+		for index in self.candidatePatterns(name):
+			regex, variable, abstractPackage = self._patterns[index]
 			m = regex.fullmatch(name)
 			if not m:
 				continue
@@ -11,21 +11,25 @@ import os
 import time
 import shutil
 
-from .util import infomsg, errormsg, warnmsg
+from .util import infomsg, errormsg, warnmsg, debugmsg
+from .util import FileFingerprint, removeUnreferencedObjects
 from .newdb import *
 from .policy import Policy
 from .postprocess import *
-from .download import DownloadInfo
+from .download import DownloadInfo, DownloadManifest
 from .csvio import CSVReader
 
 __names__ = ['SnapshotFactory', 'Snapshot']
 
 class Snapshot(object):
-	def __init__(self, path):
+	# Snapshots are only ever read; readOnly makes sure that looking at
+	# them does not modify their contents.
+	def __init__(self, path, readOnly = False):
 		self.path = path
+		self.readOnly = readOnly
 
 	def getCodebase(self, name):
-		return CodebaseLocation(os.path.join(self.path, name))
+		return CodebaseLocation(os.path.join(self.path, name), readOnly = self.readOnly)
 
 	def getProduct(self, name):
 		return ProductLocation(os.path.join(self.path, name))
@@ -41,19 +45,23 @@ class Snapshot(object):
 			srcpath = f"{cachePath}/{project}"
 			dstpath = f"{self.path}/rpmhdrs/{project}"
 
-			shutil.copytree(srcpath, dstpath, copy_function = os.link)
+			# The manifest is appended to in place, so it must not be hardlinked
+			shutil.copytree(srcpath, dstpath, copy_function = os.link,
+					ignore = shutil.ignore_patterns(DownloadManifest.FILENAME))
 
 ##################################################################
 # Provide access to all data in ~/.local/package_monkey/$codebase
 ##################################################################
 class CodebaseLocation(object):
-	def __init__(self, path):
+	def __init__(self, path, readOnly = False):
 		self.path = path
+		self.readOnly = readOnly
 		self._db = None
 		self._extraDB = None
 		self._policy = None
+		self._classification = None
 
-		if not os.path.isdir(path):
+		if not os.path.isdir(path) and not readOnly:
 			os.makedirs(path)
 
 	def getPath(self, basename):
@@ -71,6 +79,10 @@ class CodebaseLocation(object):
 	def dbPath(self):
 		return os.path.join(self.path, 'codebase.db')
 
+	@property
+	def dbJournalPath(self):
+		return self.dbPath + NewDBJournal.SUFFIX
+
 	@property
 	def patchPath(self):
 		return os.path.join(self.path, 'patch.db')
@@ -91,6 +103,11 @@ class CodebaseLocation(object):
 
 	@property
 	def extraDbPath(self):
+		return os.path.join(self.path, 'info.sqlite')
+
+	# Older versions stored the extra DB as a text file
+	@property
+	def legacyExtraDbPath(self):
 		return os.path.join(self.path, 'info.db')
 
 	def loadExtraDB(self):
@@ -98,7 +115,19 @@ class CodebaseLocation(object):
 			self._extraDB = ExtraDB()
 
 			path = self.extraDbPath
-			if os.path.exists(path):
+			legacyPath = self.legacyExtraDbPath
+			if self.readOnly:
+				# Do not convert (or create) anything inside a snapshot
+				if os.path.exists(path):
+					self._extraDB.load(path, readOnly = True)
+				elif os.path.exists(legacyPath):
+					self._extraDB.importText(legacyPath)
+			elif not os.path.exists(path) and os.path.exists(legacyPath):
+				infomsg(f"Converting {legacyPath} to {path}")
+				self._extraDB.load(path)
+				self._extraDB.importText(legacyPath)
+				self._extraDB.save()
+			else:
 				self._extraDB.load(path)
 
 		return self._extraDB
@@ -140,11 +169,14 @@ class CodebaseLocation(object):
 		classificationResult.save(self.getPath("classification.db"))
 
 	def loadClassification(self):
-		path = self.getPath("classification.db")
-		labelFacade = TrivialLabelFacade(path)
+		if self._classification is None:
+			path = self.getPath("classification.db")
+			labelFacade = TrivialLabelFacade(path)
+
+			labelFacade.policy = self.loadPolicy(labelFacade)
+			self._classification = labelFacade
 
-		labelFacade.policy = self.loadPolicy(labelFacade)
-		return labelFacade
+		return self._classification
 
 ##################################################################
 # Provide access to all data in ~/.local/package_monkey/$product
@@ -159,9 +191,167 @@ class ProductLocation(object):
 	def getPath(self, basename):
 		return os.path.join(self.path, basename)
 
+##################################################################
+# Content addressed store for snapshot files.
+# Every file is stored once, under its sha256 digest, and snapshots
+# consist of hardlinks to these objects. As a result, files that do
+# not change between snapshots (like a codebase.db that has not
+# been refreshed) do not consume any additional space.
+#
+# In order to avoid hashing the entire state directory every time,
+# we remember the digest of each source file along with its size
+# and mtime.
+##################################################################
+class SnapshotObjectStore(object):
+	MANIFEST = ".manifest"
+	STATCACHE = "statcache"
+
+	# ioctl for cloning a file on btrfs, xfs and friends
+	FICLONE = 0x40049409
+
+	def __init__(self, path):
+		self.path = path
+		self._statCache = None
+
+		self.numStored = 0
+		self.numReused = 0
+
+		if not os.path.isdir(path):
+			os.makedirs(path)
+
+	def objectPath(self, digest):
+		return os.path.join(self.path, digest[:2], digest)
+
+	@property
+	def statCachePath(self):
+		return os.path.join(self.path, self.STATCACHE)
+
+	@property
+	def statCache(self):
+		if self._statCache is None:
+			self._statCache = {}
+
+			path = self.statCachePath
+			if os.path.exists(path):
+				with open(path) as f:
+					for line in f.readlines():
+						w = line.rstrip('\n').split(' ', 3)
+						if len(w) != 4:
+							continue
+
+						digest, size, mtime, name = w
+						self._statCache[name] = (int(size), int(mtime), digest)
+		return self._statCache
+
+	def saveStatCache(self):
+		if self._statCache is None:
+			return
+
+		path = self.statCachePath
+		with open(path + ".tmp", "w") as f:
+			for name, (size, mtime, digest) in sorted(self._statCache.items()):
+				print(f"{digest} {size} {mtime} {name}", file = f)
+		os.rename(path + ".tmp", path)
+
+	def digestFile(self, path, st):
+		path = os.path.abspath(path)
+
+		cached = self.statCache.get(path)
+		if cached is not None:
+			size, mtime, digest = cached
+			if size == st.st_size and mtime == st.st_mtime_ns:
+				return digest
+
+		digest = FileFingerprint.digestFile(path)
+		self.statCache[path] = (st.st_size, st.st_mtime_ns, digest)
+		return digest
+
+	# Copy the file, using a reflink if the file system supports it
+	def cloneFile(self, srcPath, dstPath):
+		import fcntl
+
+		with open(srcPath, "rb") as src, open(dstPath, "wb") as dst:
+			try:
+				fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+				return
+			except OSError:
+				pass
+
+			shutil.copyfileobj(src, dst)
+
+	def store(self, srcPath, st):
+		digest = self.digestFile(srcPath, st)
+
+		objPath = self.objectPath(digest)
+		if os.path.exists(objPath):
+			self.numReused += 1
+			return digest
+
+		objDir = os.path.dirname(objPath)
+		if not os.path.isdir(objDir):
+			os.makedirs(objDir)
+
+		self.cloneFile(srcPath, objPath + ".tmp")
+		shutil.copystat(srcPath, objPath + ".tmp")
+		os.rename(objPath + ".tmp", objPath)
+
+		self.numStored += 1
+		return digest
+
+	def checkout(self, digest, dstPath):
+		objPath = self.objectPath(digest)
+		try:
+			os.link(objPath, dstPath)
+		except OSError:
+			self.cloneFile(objPath, dstPath)
+
+	# Store a copy of srcDir under dstDir, and write a manifest listing
+	# digest, size and relative path of each file.
+	def copyTree(self, srcDir, dstDir):
+		manifest = []
+		for dirPath, dirNames, fileNames in os.walk(srcDir):
+			dirNames.sort()
+
+			relDir = os.path.relpath(dirPath, srcDir)
+			targetDir = os.path.normpath(os.path.join(dstDir, relDir))
+			os.makedirs(targetDir, exist_ok = True)
+
+			for name in sorted(fileNames):
+				srcPath = os.path.join(dirPath, name)
+				try:
+					st = os.stat(srcPath)
+				except FileNotFoundError:
+					warnmsg(f"Ignoring dangling symlink {srcPath}")
+					continue
+
+				digest = self.store(srcPath, st)
+				self.checkout(digest, os.path.join(targetDir, name))
+				manifest.append((digest, st.st_size, os.path.normpath(os.path.join(relDir, name))))
+
+		with open(os.path.join(dstDir, self.MANIFEST), "w") as f:
+			for digest, size, name in manifest:
+				print(f"{digest} {size} {name}", file = f)
+
+		self.saveStatCache()
+
+	# Remove all objects that are no longer referenced by any snapshot
+	def collectGarbage(self):
+		numRemoved = removeUnreferencedObjects(self.path)
+		if numRemoved:
+			debugmsg(f"Removed {numRemoved} unreferenced objects from {self.path}")
+
 class SnapshotFactory(object):
+	OBJECT_STORE = ".objects"
+
 	def __init__(self, rootDir):
 		self.root = rootDir
+		self._objectStore = None
+
+	@property
+	def objectStore(self):
+		if self._objectStore is None:
+			self._objectStore = SnapshotObjectStore(os.path.join(self.root, self.OBJECT_STORE))
+		return self._objectStore
 
 	def createSnapshot(self, statePath):
 		name = time.strftime("%Y%m%dT%H%M%S")
@@ -172,15 +362,17 @@ class SnapshotFactory(object):
 			return None
 
 		infomsg(f"Copy {statePath} to {snapDir}")
-		shutil.copytree(statePath, snapDir)
+		store = self.objectStore
+		store.copyTree(statePath, snapDir)
+		infomsg(f"Stored {store.numStored} new files, {store.numReused} files unchanged")
 
-		return Snapshot(snapDir)
+		return Snapshot(snapDir, readOnly = True)
 
 	def load(self, slug):
 		link = os.path.join(self.root, slug)
 		infomsg(link)
 		if os.path.islink(link) or os.path.isdir(link):
-			return Snapshot(link)
+			return Snapshot(link, readOnly = True)
 
 	def remember(self, slug, snapshot):
 		link = os.path.join(self.root, slug)
@@ -209,3 +401,5 @@ class SnapshotFactory(object):
 
 		infomsg(f"Remove {snapDir}")
 		shutil.rmtree(snapDir)
+
+		self.objectStore.collectGarbage()
@@ -5,7 +5,13 @@
 # This does not track every scalar; just lists, dicts and strings.
 # This should do for most purposes.
 #
+# If PyYAML was built with libyaml, we use the C parser and take
+# the marks from the events it produces. Otherwise, we fall back
+# to the (much slower) pure Python implementation.
+#
 ##################################################################
+import yaml
+
 from yaml.composer import Composer
 from yaml.constructor import SafeConstructor
 from yaml.parser import Parser
@@ -13,6 +19,11 @@ from yaml.reader import Reader
 from yaml.resolver import Resolver
 from yaml.scanner import Scanner
 
+try:
+	from yaml.cyaml import CParser
+except ImportError:
+	CParser = None
+
 class YamlLocationTracking(dict):
 	def add(self, obj, mark):
 		self[id(obj)] = mark
@@ -64,7 +75,7 @@ class NodeConstructor(SafeConstructor):
 				u'tag:yaml.org,2002:str',
 				klass.construct_yaml_str)
 
-class TrackingLoader(Reader, Scanner, Parser, Composer, NodeConstructor, Resolver):
+class PyTrackingLoader(Reader, Scanner, Parser, Composer, NodeConstructor, Resolver):
 	def __init__(self, stream, line_tracking = None):
 		Reader.__init__(self, stream)
 		Scanner.__init__(self)
@@ -73,6 +84,23 @@ class TrackingLoader(Reader, Scanner, Parser, Composer, NodeConstructor, Resolve
 		NodeConstructor.__init__(self, line_tracking = line_tracking)
 		Resolver.__init__(self)
 
+# The C parser reports the same stream name and (zero based) line and
+# column numbers as the Python Reader, so the locations we record are
+# identical. The only difference is that its marks do not carry the
+# input buffer, so str(mark) does not include a snippet.
+if CParser is not None:
+	class CTrackingLoader(CParser, NodeConstructor, Resolver):
+		def __init__(self, stream, line_tracking = None):
+			CParser.__init__(self, stream)
+			NodeConstructor.__init__(self, line_tracking = line_tracking)
+			Resolver.__init__(self)
+
+	TrackingLoader = CTrackingLoader
+	FullLoader = yaml.CFullLoader
+else:
+	TrackingLoader = PyTrackingLoader
+	FullLoader = yaml.FullLoader
+
 def tracked_load(stream, **kwargs):
 	loader = TrackingLoader(stream, **kwargs)
 	try:
@@ -80,4 +108,6 @@ def tracked_load(stream, **kwargs):
 	finally:
 		loader.dispose()
 
-
+# Drop-in replacement for yaml.full_load() that uses libyaml if available
+def full_load(stream):
+	return yaml.load(stream, Loader = FullLoader)
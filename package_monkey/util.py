@@ -6,6 +6,8 @@ import fnmatch
 import locale
 import os
 import datetime
+import hashlib
+import bisect
 
 ##################################################################
 # A simple class for batched processing
@@ -393,6 +395,10 @@ class NameMatcher:
 
 		return False
 
+	@property
+	def patterns(self):
+		return [m.pattern for m in self.matches]
+
 	def reportUnmatched(self):
 		result = []
 		for m in self.matches:
@@ -400,6 +406,168 @@ class NameMatcher:
 				result.append(m.pattern)
 		return result
 
+##################################################################
+#
+# Index a collection of named objects for fast exact, prefix,
+# suffix and glob lookups.
+# We keep the names sorted, plus a sorted list of the reversed
+# names. A prefix then maps to a contiguous range in the first list,
+# and a suffix to a contiguous range in the second. For a general
+# glob pattern, we use its literal prefix and suffix to narrow down
+# the candidates, and use fnmatch only on those.
+#
+##################################################################
+class NameIndex(object):
+	WILDCARDS = '*?['
+
+	def __init__(self, objects, getName = str):
+		self._byName = {}
+		for obj in objects:
+			self._byName[getName(obj)] = obj
+
+		self._sorted = sorted(self._byName.keys())
+		self._reversed = sorted(name[::-1] for name in self._sorted)
+
+	def __len__(self):
+		return len(self._sorted)
+
+	@staticmethod
+	def isPattern(name):
+		return any((c in name) for c in NameIndex.WILDCARDS)
+
+	@staticmethod
+	def _range(sortedList, prefix):
+		lo = bisect.bisect_left(sortedList, prefix)
+		hi = bisect.bisect_left(sortedList, prefix + '\U0010ffff')
+		return sortedList[lo:hi]
+
+	def lookup(self, name):
+		return self._byName.get(name)
+
+	def namesWithPrefix(self, prefix):
+		return self._range(self._sorted, prefix)
+
+	def namesWithSuffix(self, suffix):
+		return sorted(name[::-1] for name in self._range(self._reversed, suffix[::-1]))
+
+	def matchingNames(self, pattern):
+		if not self.isPattern(pattern):
+			if pattern in self._byName:
+				return [pattern]
+			return []
+
+		first = min(pattern.find(c) for c in self.WILDCARDS if c in pattern)
+		last = max(pattern.rfind(c) for c in self.WILDCARDS)
+		prefix = pattern[:first]
+		suffix = pattern[last + 1:]
+
+		# '[' starts a character class; whatever follows up to the closing
+		# bracket is not part of the literal suffix
+		if ']' in suffix:
+			suffix = suffix[suffix.rfind(']') + 1:]
+
+		if prefix:
+			candidates = self.namesWithPrefix(prefix)
+			if suffix:
+				candidates = [name for name in candidates if name.endswith(suffix)]
+		elif suffix:
+			candidates = self.namesWithSuffix(suffix)
+		else:
+			candidates = self._sorted
+
+		if pattern == prefix + '*':
+			return list(candidates)
+		if pattern == '*' + suffix:
+			return list(candidates)
+		return [name for name in candidates if fnmatch.fnmatchcase(name, pattern)]
+
+	def match(self, pattern):
+		return [self._byName[name] for name in self.matchingNames(pattern)]
+
+##################################################################
+#
+# Fingerprint a set of input files (plus a few settings), so that
+# we can tell whether a cached result derived from them is still
+# valid.
+#
+##################################################################
+class FileFingerprint(object):
+	def __init__(self, files = None, values = None):
+		self.files = dict(files or {})
+		self.values = dict(values or {})
+
+	@staticmethod
+	def digestFile(path):
+		if not os.path.isfile(path):
+			return 'missing'
+
+		sha = hashlib.sha256()
+		with open(path, "rb") as f:
+			while True:
+				chunk = f.read(1024 * 1024)
+				if not chunk:
+					break
+				sha.update(chunk)
+		return sha.hexdigest()
+
+	@staticmethod
+	def statFile(path):
+		try:
+			st = os.stat(path)
+		except FileNotFoundError:
+			return 'missing'
+		return f"{st.st_size}:{st.st_mtime_ns}"
+
+	def addFile(self, path):
+		if path not in self.files:
+			self.files[path] = self.digestFile(path)
+
+	# Cheaper than addFile(), but relies on size and mtime only
+	def addFileStat(self, path):
+		if path not in self.files:
+			self.files[path] = self.statFile(path)
+
+	def addValue(self, key, value):
+		self.values[key] = str(value)
+
+	# Return the list of files and settings that differ between two fingerprints
+	def differences(self, other):
+		result = []
+		for mine, theirs in ((self.files, other.files), (self.values, other.values)):
+			for key in sorted(set(mine).union(theirs)):
+				if mine.get(key) != theirs.get(key):
+					result.append(key)
+		return result
+
+	def asDict(self):
+		return {'files': self.files, 'values': self.values}
+
+	@classmethod
+	def fromDict(klass, d):
+		return klass(files = d.get('files'), values = d.get('values'))
+
+##################################################################
+# Object stores (such as the header store and the snapshot object
+# store) hardlink their objects into the directories that use them.
+# An object whose link count has dropped to 1 is no longer
+# referenced by anyone and can be removed.
+# Objects live in subdirectories of the store; files at the top
+# level are bookkeeping data of the store itself and are left alone.
+##################################################################
+def removeUnreferencedObjects(storePath):
+	numRemoved = 0
+	for dirPath, dirNames, fileNames in os.walk(storePath):
+		if dirPath == storePath:
+			continue
+
+		for name in fileNames:
+			objPath = os.path.join(dirPath, name)
+			if os.stat(objPath).st_nlink == 1:
+				os.unlink(objPath)
+				numRemoved += 1
+
+	return numRemoved
+
 ##################################################################
 # Simple helper classes
 ##################################################################
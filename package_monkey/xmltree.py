@@ -111,6 +111,26 @@ class XMLTree(object):
 def parse(filename):
 	return ET.parse(filename)
 
+# Parse a document incrementally. This yields (event, depth, element) tuples,
+# where event is either 'start' or 'end', and depth is 0 for the root element.
+# Once the caller has processed the 'end' event of an element at clearDepth,
+# the element is discarded, so callers must not hold on to it.
+# When processing 'start' events, only the element's attributes are valid.
+def iterparse(source, clearDepth = 1):
+	stack = []
+	for event, node in ET.iterparse(source, events = ('start', 'end')):
+		if event == 'start':
+			yield event, len(stack), node
+			stack.append(node)
+		else:
+			stack.pop()
+			depth = len(stack)
+			yield event, depth, node
+
+			if depth == clearDepth:
+				node.clear()
+				stack[-1].remove(node)
+
 # xml.etree.ElementInclude does not handle include files that contain
 # 0 or N > 1 elements...
 XINCLUDE = "{http://www.w3.org/2001/XInclude}"
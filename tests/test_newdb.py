@@ -0,0 +1,86 @@
+##################################################################
+#
+# Save/load round trips of codebase.db
+#
+##################################################################
+from package_monkey.newdb import NewDB
+
+def createDB(typeOfB = None, requirementsOfA = ('b', 'promise')):
+	db = NewDB()
+	db.addArchitecture('x86_64')
+
+	a = db.createRpm('a')
+	b = db.createRpm('b', typeOfB)
+	c = db.createRpm('c')
+	promise = db.createPromise(c, arch = 'x86_64')
+
+	rpms = {'b': b, 'c': c, 'promise': promise}
+	a.addDependencies(None, 'x86_64', set(rpms[name] for name in requirementsOfA))
+	b.addDependencies(None, 'x86_64', set())
+	c.addDependencies(None, 'x86_64', set())
+
+	build = db.createBuild('abc')
+	build.setArchBuildStatus('x86_64', 'succeeded')
+	for rpm in (a, b, c):
+		build.addRpm(rpm)
+	return db
+
+def requiredBy(db, name):
+	return sorted(map(str, db.lookupRpm(name).requiredBy.get('x86_64')))
+
+def test_roundtrip_with_per_arch_promise(tmp_path):
+	path = str(tmp_path / "codebase.db")
+	createDB().save(path, compact = True)
+
+	with open(path) as f:
+		assert 'provides promise:' not in f.read()
+
+	db = NewDB()
+	db.load(path)
+
+	# the index is only parsed on demand
+	assert not db.providesLookupsEnabled
+	assert db.lookupRpm('b').requiredBy is None
+
+	db.enableProvidesLookups()
+	assert db.lookupRpm('promise:x86_64:c') is None
+	assert requiredBy(db, 'b') == ['a']
+	assert requiredBy(db, 'c') == []
+
+def test_load_ignores_per_arch_promise_in_index(tmp_path):
+	path = str(tmp_path / "codebase.db")
+	createDB().save(path, compact = True)
+
+	# this is what earlier versions wrote to the index
+	with open(path, "a") as f:
+		print("provides promise:x86_64:c", file = f)
+		print("  rby common a", file = f)
+
+	db = NewDB()
+	db.load(path)
+	db.enableProvidesLookups()
+
+	assert db.lookupRpm('promise:x86_64:c') is None
+	assert requiredBy(db, 'b') == ['a']
+
+def test_index_with_journal(tmp_path):
+	path = str(tmp_path / "codebase.db")
+	createDB().save(path, compact = True)
+	createDB(requirementsOfA = ('c', )).save(path)
+
+	db = NewDB()
+	db.load(path)
+	db.enableProvidesLookups()
+
+	assert requiredBy(db, 'b') == []
+	assert requiredBy(db, 'c') == ['a']
+
+def test_journal_with_changed_rpm_type(tmp_path):
+	path = str(tmp_path / "codebase.db")
+	createDB().save(path, compact = True)
+	createDB(typeOfB = 'synthetic').save(path)
+
+	db = NewDB()
+	db.load(path)
+
+	assert db.lookupRpm('b').type == 'synthetic'